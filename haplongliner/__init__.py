@@ -15,3 +15,5 @@ from .module2_SV import *
 from .module3_DB import *
 from .find_intact_orf import find_intact_orf
 from .combine_table import combine_table
+from .orf_reducer import OrfReducer
+from .records import L1Record, OrfHit
@@ -0,0 +1,127 @@
+"""Per-assembly store of module 2 anchor liftovers and verdicts.
+
+Module 2 lifts every anchor of the catalogue (``data/HPRC_L1_hs_v2_v2fl.bed``
+with its ``-2kb.fa``/``+2kb.fa`` flanks) onto an assembly and classifies it
+against the SV callset. :class:`AnchorStore` keeps, per anchor, a signature
+of its reference coordinates and flank sequences, the flank hits on the
+assembly and the resulting status and RepeatMasker flag. When the catalogue
+grows, only anchors whose signature is new or changed are mapped and
+classified again; the others are served from the store. A different
+assembly clears the store, a different SV callset clears the verdicts only.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .cache import file_checksum
+
+Hit = Optional[List[str]]
+
+
+def anchor_signature(coords: Sequence, minus_seq: str, plus_seq: str) -> str:
+    """Return the signature of an anchor's reference coordinates and flank sequences."""
+    digest = hashlib.sha256("\t".join(map(str, coords)).encode())
+    for seq in (minus_seq, plus_seq):
+        digest.update(b"\0" + seq.upper().encode())
+    return digest.hexdigest()
+
+
+class AnchorStore:
+    """SQLite file holding one assembly's anchor liftovers and verdicts."""
+
+    def __init__(self, path) -> None:
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path, timeout=120)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS anchors ("
+            " name TEXT PRIMARY KEY, signature TEXT, minus TEXT, plus TEXT, status TEXT, l1_flag TEXT);"
+            "CREATE TABLE IF NOT EXISTS checksums ("
+            " path TEXT, size INTEGER, mtime_ns INTEGER, checksum TEXT, PRIMARY KEY (path, size, mtime_ns));"
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "AnchorStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def checksum(self, path) -> str:
+        """Return the checksum of ``path``, hashing it only once per file version."""
+        st = os.stat(path)
+        ident = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+        row = self.conn.execute(
+            "SELECT checksum FROM checksums WHERE path = ? AND size = ? AND mtime_ns = ?", ident
+        ).fetchone()
+        if row:
+            return row[0]
+        checksum = file_checksum(path)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?)", (*ident, checksum))
+        return checksum
+
+    def bind(self, key: str, value: str) -> bool:
+        """Record ``value`` for ``key``; return ``False`` if it replaced a different value."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+        return row is None or row[0] == value
+
+    def reset(self, liftover: bool = False) -> None:
+        """Drop all verdicts, and with ``liftover`` all anchors."""
+        with self.conn:
+            if liftover:
+                self.conn.execute("DELETE FROM anchors")
+            else:
+                self.conn.execute("UPDATE anchors SET status = NULL, l1_flag = NULL")
+
+    def signatures(self) -> Dict[str, str]:
+        return dict(self.conn.execute("SELECT name, signature FROM anchors"))
+
+    def hits(self) -> Dict[str, Tuple[Hit, Hit]]:
+        """Return ``name -> (minus_hit, plus_hit)`` PAF fields (``None`` if unmapped)."""
+        return {
+            name: (json.loads(minus) if minus else None, json.loads(plus) if plus else None)
+            for name, minus, plus in self.conn.execute("SELECT name, minus, plus FROM anchors")
+        }
+
+    def verdicts(self) -> Dict[str, Tuple[str, str]]:
+        """Return ``name -> (status, l1_flag)`` for anchors classified against the current callset.
+
+        Anchors that did not lift over are stored with an empty status.
+        """
+        return {
+            name: (status, l1_flag)
+            for name, status, l1_flag in self.conn.execute(
+                "SELECT name, status, l1_flag FROM anchors WHERE status IS NOT NULL"
+            )
+        }
+
+    def put_hits(self, rows: Iterable[Tuple[str, str, Hit, Hit]]) -> None:
+        """Store ``(name, signature, minus_hit, plus_hit)``; their verdicts are cleared."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO anchors VALUES (?, ?, ?, ?, NULL, NULL)",
+                [
+                    (name, signature, json.dumps(minus) if minus else None, json.dumps(plus) if plus else None)
+                    for name, signature, minus, plus in rows
+                ],
+            )
+
+    def put_verdicts(self, rows: Iterable[Tuple[str, str, str]]) -> None:
+        """Store ``(name, status, l1_flag)`` for anchors already in the store."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE anchors SET status = ?, l1_flag = ? WHERE name = ?",
+                [(status, l1_flag, name) for name, status, l1_flag in rows],
+            )
+
+    def remove(self, names: Iterable[str]) -> None:
+        with self.conn:
+            self.conn.executemany("DELETE FROM anchors WHERE name = ?", [(name,) for name in names])
@@ -0,0 +1,218 @@
+"""Single-node batch runs that stage inputs ahead of processing.
+
+:func:`run_batch` takes the same TSV manifest as ``haplongliner enqueue``.
+While jobs are being processed, up to ``prefetch`` later jobs have their
+remote or slow inputs (assembly, RepeatMasker annotation, SV callset)
+copied into a local staging area, so downloads overlap with computation
+instead of preceding it. The staging area can be capped at a byte quota;
+a job's inputs are evicted as soon as the job finishes. Fetching goes
+through a pluggable ``fetcher(src, dest)`` callable: the default handles
+local paths and anything :mod:`urllib` can open, and :func:`command_fetcher`
+wraps an external copy command such as ``aws s3 cp {src} {dest}``.
+Inputs whose size cannot be learned up front (e.g. ``s3://`` sources) are
+counted at a configurable estimate, or fetched only once the staging area
+is below its quota, and are re-counted at their real size once on disk.
+"""
+
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import traceback
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from .work_queue import _publish, _run_job, read_job_manifest
+
+# Job parameters that name input files worth staging locally
+STAGED_PARAMS = ("input", "mask", "sv")
+
+Fetcher = Callable[[str, str], None]
+
+
+def _is_url(src: str) -> bool:
+    return "://" in src and not src.startswith("file://")
+
+
+def fetch(src: str, dest: str) -> None:
+    """Copy ``src`` (a local path or a URL) to ``dest``."""
+    if _is_url(src):
+        with urllib.request.urlopen(src) as response, open(dest, "wb") as out:
+            shutil.copyfileobj(response, out, 1 << 20)
+    else:
+        shutil.copyfile(src[len("file://"):] if src.startswith("file://") else src, dest)
+
+
+def command_fetcher(template: str) -> Fetcher:
+    """Return a fetcher running ``template`` with ``{src}`` and ``{dest}`` filled in."""
+
+    def run(src: str, dest: str) -> None:
+        cmd = template.format(src=shlex.quote(src), dest=shlex.quote(dest))
+        subprocess.run(cmd, shell=True, check=True)
+
+    return run
+
+
+def source_size(src: str) -> Optional[int]:
+    """Best-effort size of ``src`` in bytes (``None`` when unknown)."""
+    try:
+        if not _is_url(src):
+            return os.path.getsize(src[len("file://"):] if src.startswith("file://") else src)
+        if src.startswith(("http://", "https://")):
+            request = urllib.request.Request(src, method="HEAD")
+            with urllib.request.urlopen(request) as response:
+                length = response.headers.get("Content-Length")
+                return int(length) if length else None
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class StagingArea:
+    """Local directory holding staged inputs under an optional byte quota.
+
+    :meth:`reserve` blocks while the reservation would exceed ``quota``,
+    or while the area is full, unless nothing else is staged (so a single
+    oversized job still runs). A zero-byte reservation therefore waits for
+    free space.
+    """
+
+    def __init__(self, root, quota: Optional[int] = None) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.quota = quota
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def reserve(self, size: int) -> None:
+        with self._cond:
+            while self.quota and self.used and (self.used + size > self.quota or self.used >= self.quota):
+                self._cond.wait()
+            self.used += size
+
+    def account(self, size: int) -> None:
+        """Record ``size`` bytes already on disk, without waiting for quota."""
+        with self._cond:
+            self.used += size
+
+    def release(self, size: int) -> None:
+        with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+
+def _stage(job: Dict, area: StagingArea, fetcher: Fetcher, estimate: Optional[int] = None) -> int:
+    """Fetch ``job``'s inputs into ``area`` and point its params at them.
+
+    Inputs of unknown size are reserved at ``estimate`` bytes each (nothing
+    when it is ``None``, which still waits for the area to drop below its
+    quota). Returns the number of bytes reserved for the job.
+    """
+    sources = {key: job["params"][key] for key in STAGED_PARAMS if key in job["params"]}
+    sizes = [source_size(src) for src in sources.values()]
+    reserved = sum((estimate or 0) if size is None else size for size in sizes)
+    area.reserve(reserved)
+    try:
+        job["stage_dir"] = area.root / f"{job['sample']}.{job['haplotype']}.{job['module']}.{job['id']}"
+        job["stage_dir"].mkdir(parents=True, exist_ok=True)
+        for key, src in sources.items():
+            dest = job["stage_dir"] / f"{key}.{Path(src.rstrip('/')).name}"
+            partial = dest.with_name(dest.name + ".part")
+            fetcher(src, str(partial))
+            os.replace(partial, dest)
+            job["params"][key] = str(dest)
+        actual = sum(f.stat().st_size for f in job["stage_dir"].iterdir())
+        # Replace estimates for sources whose size could not be known up front
+        if actual > reserved:
+            area.account(actual - reserved)
+        elif actual < reserved:
+            area.release(reserved - actual)
+        reserved = actual
+    except BaseException:
+        area.release(reserved)
+        raise
+    return reserved
+
+
+def _evict(job: Dict, area: StagingArea, reserved: int) -> None:
+    stage_dir = job.get("stage_dir")
+    if stage_dir is not None and stage_dir.exists():
+        shutil.rmtree(stage_dir)
+    area.release(reserved)
+
+
+def run_batch(manifest, staging_dir, prefetch: int = 2, quota: Optional[int] = None,
+              fetcher: Fetcher = fetch, jobs: int = 1, metrics: Optional[str] = None,
+              input_estimate: Optional[int] = None) -> Dict[str, int]:
+    """Run every job of ``manifest`` on this node, prefetching inputs.
+
+    Up to ``prefetch`` jobs are staged concurrently ahead of the ``jobs``
+    being processed. ``input_estimate`` is the number of bytes counted
+    against ``quota`` for an input whose size is unknown until fetched. Outputs are published with the same staging-and-rename
+    step as the work queue. ``metrics`` is the default stage-metrics history
+    of jobs whose manifest row sets none. With ``jobs`` > 1 no history is
+    recorded, as concurrent jobs share this process's memory figures. Returns counts of ``done`` and
+    ``failed`` jobs.
+    """
+    area = StagingArea(staging_dir, quota)
+    if jobs > 1:
+        print("[BATCH] not recording stage metrics history: concurrent jobs share one process")
+    slots = threading.Semaphore(prefetch + jobs)
+    counts = {"done": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def finish(job: Dict, ok: bool, reserved: int = 0, error: str = "") -> None:
+        _evict(job, area, reserved)
+        slots.release()
+        with lock:
+            counts["done" if ok else "failed"] += 1
+        if not ok:
+            print(f"[BATCH] job {job['id']} ({job['module']} {job['sample']} {job['haplotype']}) failed:\n{error}")
+
+    def process(job: Dict, reserved: int) -> None:
+        final = Path(job["params"]["out"])
+        final.parent.mkdir(parents=True, exist_ok=True)
+        staging = final.with_name(f".{final.name}.{job['id']}.batch.partial")
+        print(f"[BATCH] job {job['id']}: {job['module']} {job['sample']} {job['haplotype']}")
+        try:
+            _publish(_run_job(job, staging, final), final)
+        except Exception:
+            finish(job, False, reserved, traceback.format_exc(limit=5))
+        else:
+            finish(job, True, reserved)
+        finally:
+            if staging.exists():
+                shutil.rmtree(staging) if staging.is_dir() else staging.unlink()
+
+    with ThreadPoolExecutor(jobs) as run_pool:
+        def stage(job: Dict) -> None:
+            try:
+                reserved = _stage(job, area, fetcher, input_estimate)
+            except Exception:
+                finish(job, False, error=traceback.format_exc(limit=5))
+                return
+            print(f"[BATCH] staged job {job['id']} ({reserved} bytes)")
+            run_pool.submit(process, job, reserved)
+
+        with ThreadPoolExecutor(prefetch) as fetch_pool:
+            for job_id, (sample, haplotype, module, params) in enumerate(read_job_manifest(manifest), 1):
+                slots.acquire()
+                if jobs > 1:
+                    params["metrics"] = ""
+                elif metrics:
+                    params.setdefault("metrics", metrics)
+                job = {"id": job_id, "sample": sample, "haplotype": haplotype, "module": module, "params": params}
+                fetch_pool.submit(stage, job)
+    return counts
+
+
+def parse_size(text: str) -> int:
+    """Parse a byte count with an optional K/M/G/T suffix, e.g. ``200G``."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
@@ -0,0 +1,414 @@
+"""Precompiled, memory-mappable bundle of the packaged reference data.
+
+Module 1/2 runs otherwise re-parse the text assets in ``data/`` (anchor and
+master BEDs, ``L1rp.fa``, ``L1rpORF12p.fa`` and the anchor flank FASTAs).
+``build_bundle`` compiles them once into ``data/reference.hlb``:
+
+* BED tables become typed columns: integer columns are ``int32``/``int64``
+  arrays and text columns are ``uint32`` ids into one interned string table.
+* FASTA sequences are 2-bit packed (see :mod:`haplongliner.twobit`).
+* A manifest records the format version and the size, mtime and SHA-256 of
+  every text source.
+
+:class:`Bundle` maps the file read-only and hands out ``memoryview`` slices
+of it, so opening costs a stat per source and nothing is decoded until it
+is used. A bundle whose sources changed since it was built is reported as
+stale and the callers fall back to the text files.
+
+File layout: an 8-byte magic, ``uint32`` version and manifest length, the
+JSON manifest, then 8-byte aligned data sections in the byte order of the
+machine that built the bundle (recorded in the manifest).
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import twobit
+from .utils import iter_fasta
+
+MAGIC = b"HLLBNDL\0"
+VERSION = 1
+DATA_DIR = Path("data")
+DEFAULT_BUNDLE = DATA_DIR / "reference.hlb"
+BED_SOURCES = ("HPRC_L1_hs_v2_v2fl.bed", "HPRC_L1_hs1_master_v2.bed")
+FASTA_SOURCES = ("L1rp.fa", "L1rpORF12p.fa", "-2kb.fa", "+2kb.fa")
+
+_INT32 = (-(1 << 31), (1 << 31) - 1)
+
+
+class BundleError(Exception):
+    """The bundle is missing, of another format version, or stale."""
+
+
+def _sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_info(path: Path) -> Dict:
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": _sha256(path)}
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.sections: Dict[str, Dict] = {}
+        self.chunks: List[bytes] = []
+        self.offset = 0
+
+    def add(self, name: str, typecode: str, data) -> str:
+        raw = data.tobytes() if isinstance(data, array) else bytes(data)
+        self.sections[name] = {"offset": self.offset, "length": len(raw), "type": typecode}
+        pad = -len(raw) % 8
+        self.chunks.append(raw + bytes(pad))
+        self.offset += len(raw) + pad
+        return name
+
+
+class _StringPool:
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def intern(self, value: str) -> int:
+        sid = self.ids.get(value)
+        if sid is None:
+            sid = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return sid
+
+    def write(self, writer: _Writer) -> None:
+        blob = bytearray()
+        offsets = array("Q", [0])
+        for value in self.values:
+            blob += value.encode()
+            offsets.append(len(blob))
+        order = array("I", sorted(range(len(self.values)), key=self.values.__getitem__))
+        writer.add("strings.blob", "B", blob)
+        writer.add("strings.offsets", "Q", offsets)
+        writer.add("strings.sorted", "I", order)
+
+
+def _is_int(value: str) -> bool:
+    try:
+        return str(int(value)) == value
+    except ValueError:
+        return False
+
+
+def _add_bed(writer: _Writer, pool: _StringPool, name: str, path: Path) -> Dict:
+    rows = []
+    with open(path) as fh:
+        for line in fh:
+            if not line.strip() or line.startswith("#"):
+                continue
+            rows.append(line.rstrip("\n").split("\t") if "\t" in line else line.split())
+    width = max((len(r) for r in rows), default=0)
+    if any(len(r) != width for r in rows):
+        raise ValueError(f"{path}: rows have differing numbers of columns")
+    columns = []
+    for c in range(width):
+        values = [r[c] for r in rows]
+        section = f"{name}.{c}"
+        if all(_is_int(v) for v in values):
+            ints = [int(v) for v in values]
+            fits = all(_INT32[0] <= v <= _INT32[1] for v in ints)
+            typecode = "i" if fits else "q"
+            writer.add(section, typecode, array(typecode, ints))
+            columns.append({"kind": "int", "section": section})
+        else:
+            writer.add(section, "I", array("I", (pool.intern(v) for v in values)))
+            columns.append({"kind": "str", "section": section})
+    return {"rows": len(rows), "columns": columns}
+
+
+def _add_fasta(writer: _Writer, pool: _StringPool, name: str, path: Path) -> Dict:
+    names = array("I")
+    lengths = array("Q")
+    offsets = array("Q", [0])
+    run_index = array("Q", [0])
+    run_start = array("Q")
+    run_length = array("Q")
+    run_char = bytearray()
+    packed = bytearray()
+    for header, seq in iter_fasta(path):
+        data, runs = twobit.pack(seq)
+        names.append(pool.intern(header))
+        lengths.append(len(seq))
+        packed += data
+        offsets.append(len(packed))
+        for start, length, char in runs:
+            run_start.append(start)
+            run_length.append(length)
+            run_char += char.encode("ascii")
+        run_index.append(len(run_start))
+    return {
+        "records": len(names),
+        "names": writer.add(f"{name}.names", "I", names),
+        "lengths": writer.add(f"{name}.lengths", "Q", lengths),
+        "offsets": writer.add(f"{name}.offsets", "Q", offsets),
+        "packed": writer.add(f"{name}.packed", "B", packed),
+        "run_index": writer.add(f"{name}.run_index", "Q", run_index),
+        "run_start": writer.add(f"{name}.run_start", "Q", run_start),
+        "run_length": writer.add(f"{name}.run_length", "Q", run_length),
+        "run_char": writer.add(f"{name}.run_char", "B", run_char),
+    }
+
+
+def build_bundle(data_dir=DATA_DIR, out=None) -> Path:
+    """Compile the text assets found in ``data_dir`` into a bundle; return its path."""
+    data_dir = Path(data_dir)
+    out = Path(out) if out else data_dir / DEFAULT_BUNDLE.name
+    writer = _Writer()
+    pool = _StringPool()
+    manifest = {"version": VERSION, "byteorder": sys.byteorder, "sources": {}, "tables": {}, "fasta": {}}
+    for source in BED_SOURCES:
+        path = data_dir / source
+        if path.exists():
+            manifest["tables"][source] = _add_bed(writer, pool, source, path)
+            manifest["sources"][source] = _source_info(path)
+    for source in FASTA_SOURCES:
+        path = data_dir / source
+        if path.exists():
+            manifest["fasta"][source] = _add_fasta(writer, pool, source, path)
+            manifest["sources"][source] = _source_info(path)
+    pool.write(writer)
+    manifest["strings"] = len(pool.values)
+    manifest["sections"] = writer.sections
+
+    head = json.dumps(manifest, sort_keys=True).encode()
+    prefix = MAGIC + struct.pack("<II", VERSION, len(head)) + head
+    prefix += bytes(-len(prefix) % 8)
+    tmp = out.with_name(out.name + f".tmp-{os.getpid()}")
+    with open(tmp, "wb") as fh:
+        fh.write(prefix)
+        for chunk in writer.chunks:
+            fh.write(chunk)
+    os.replace(tmp, out)
+    return out
+
+
+class StringTable:
+    """Interned strings, decoded on demand."""
+
+    def __init__(self, blob: memoryview, offsets: memoryview, order: memoryview) -> None:
+        self._blob = blob
+        self._offsets = offsets
+        self._order = order
+        self._cache: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, sid: int) -> str:
+        value = self._cache.get(sid)
+        if value is None:
+            value = self._cache[sid] = bytes(self._blob[self._offsets[sid]:self._offsets[sid + 1]]).decode()
+        return value
+
+    def find(self, value: str) -> Optional[int]:
+        """Return the id of ``value`` (binary search over the sorted ids)."""
+        order = self._order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[order[mid]] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and self[order[lo]] == value:
+            return order[lo]
+        return None
+
+
+class BundleTable:
+    """Typed columns of a compiled BED file."""
+
+    def __init__(self, columns: List[Tuple[str, memoryview]], rows: int, strings: StringTable) -> None:
+        self.columns = columns
+        self.rows = rows
+        self.strings = strings
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, index: int) -> memoryview:
+        """Zero-copy view of column ``index`` (string ids for text columns)."""
+        return self.columns[index][1]
+
+    def text_column(self, index: int) -> List[str]:
+        kind, view = self.columns[index]
+        if kind == "str":
+            strings = self.strings
+            return [strings[sid] for sid in view]
+        return [str(v) for v in view]
+
+    def __iter__(self) -> Iterator[List[str]]:
+        """Yield rows as lists of strings, as if split from the text file."""
+        cols = [self.text_column(i) for i in range(len(self.columns))]
+        return (list(row) for row in zip(*cols))
+
+
+class Bundle:
+    """Read-only, memory-mapped view of a bundle built by :func:`build_bundle`."""
+
+    def __init__(self, path=DEFAULT_BUNDLE, data_dir=None, verify: bool = True) -> None:
+        self.path = Path(path)
+        self.data_dir = Path(data_dir) if data_dir else self.path.parent
+        try:
+            fh = open(self.path, "rb")
+        except FileNotFoundError:
+            raise BundleError(f"{self.path} not found; run 'haplongliner bundle'") from None
+        with fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:8] != MAGIC:
+            raise BundleError(f"{self.path} is not a HapLongLINEr bundle")
+        version, head_len = struct.unpack_from("<II", self._mm, 8)
+        if version != VERSION:
+            raise BundleError(f"{self.path} has format version {version}, expected {VERSION}")
+        self.manifest = json.loads(bytes(self._mm[16:16 + head_len]))
+        if self.manifest["byteorder"] != sys.byteorder:
+            raise BundleError(f"{self.path} was built on a {self.manifest['byteorder']}-endian machine")
+        self._base = 16 + head_len + (-(16 + head_len) % 8)
+        self._view = memoryview(self._mm)
+        if verify:
+            stale = self.stale_sources()
+            if stale:
+                raise BundleError(f"{self.path} is stale ({', '.join(stale)} changed); rebuild it")
+        self.strings = StringTable(
+            self._section("strings.blob"), self._section("strings.offsets"), self._section("strings.sorted")
+        )
+
+    def _section(self, name: str) -> memoryview:
+        info = self.manifest["sections"][name]
+        start = self._base + info["offset"]
+        view = self._view[start:start + info["length"]]
+        return view if info["type"] == "B" else view.cast(info["type"])
+
+    def stale_sources(self) -> List[str]:
+        """Return the text sources whose content differs from the bundled copy.
+
+        Size and mtime are compared first; the SHA-256 is only computed for
+        sources whose stat changed. Missing sources are not stale.
+        """
+        stale = []
+        for name, info in self.manifest["sources"].items():
+            path = self.data_dir / name
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if st.st_size == info["size"] and st.st_mtime_ns == info["mtime_ns"]:
+                continue
+            if st.st_size != info["size"] or _sha256(path) != info["sha256"]:
+                stale.append(name)
+        return stale
+
+    def covers(self, path) -> bool:
+        """Return whether ``path`` is one of the bundled sources."""
+        path = Path(path)
+        name = path.name
+        if name not in self.manifest["sources"]:
+            return False
+        try:
+            return os.path.samefile(path, self.data_dir / name)
+        except FileNotFoundError:
+            return Path(os.path.abspath(path)) == Path(os.path.abspath(self.data_dir / name))
+
+    def table(self, source: str) -> BundleTable:
+        info = self.manifest["tables"][Path(source).name]
+        columns = [(c["kind"], self._section(c["section"])) for c in info["columns"]]
+        return BundleTable(columns, info["rows"], self.strings)
+
+    def anchors(self, source: str = BED_SOURCES[0]) -> Dict[str, Tuple[str, int, int, str]]:
+        """Return ``name -> (chrom, start, end, strand)`` for an anchor BED."""
+        table = self.table(source)
+        chrom, start, end, name, strand = (table.column(i) for i in range(5))
+        s = self.strings
+        return {
+            s[name[i]]: (s[chrom[i]], start[i], end[i], s[strand[i]])
+            for i in range(len(table))
+        }
+
+    def fasta(self, source: str) -> Iterator[Tuple[str, str]]:
+        """Yield ``(header, sequence)`` like :func:`~haplongliner.utils.iter_fasta`."""
+        info = self.manifest["fasta"][Path(source).name]
+        names, lengths, offsets, packed = (
+            self._section(info[k]) for k in ("names", "lengths", "offsets", "packed")
+        )
+        run_index, run_start, run_length, run_char = (
+            self._section(info[k]) for k in ("run_index", "run_start", "run_length", "run_char")
+        )
+        for i in range(info["records"]):
+            runs = [
+                (run_start[r], run_length[r], chr(run_char[r]))
+                for r in range(run_index[i], run_index[i + 1])
+            ]
+            yield self.strings[names[i]], twobit.unpack(packed[offsets[i]:offsets[i + 1]], lengths[i], runs)
+
+
+_default: Dict[str, Optional[Bundle]] = {}
+
+
+def default_bundle() -> Optional[Bundle]:
+    """Return the bundle at ``data/reference.hlb`` if it exists and is fresh.
+
+    Opened at most once per process; a stale bundle is reported once and
+    ignored so callers fall back to the text sources.
+    """
+    key = os.path.abspath(DEFAULT_BUNDLE)
+    if key not in _default:
+        bundle = None
+        if DEFAULT_BUNDLE.exists():
+            try:
+                bundle = Bundle(DEFAULT_BUNDLE)
+            except BundleError as exc:
+                print(f"[INFO] Ignoring reference bundle: {exc}")
+        _default[key] = bundle
+    return _default[key]
+
+
+def fasta_records(path) -> Iterator[Tuple[str, str]]:
+    """Yield FASTA records of ``path`` from the bundle when it covers the file."""
+    bundle = default_bundle()
+    if bundle is not None and bundle.covers(path) and Path(path).name in bundle.manifest["fasta"]:
+        return bundle.fasta(path)
+    return iter_fasta(path)
+
+
+def bed_rows(path) -> Iterator[Sequence[str]]:
+    """Yield the rows of a BED file as string lists, from the bundle when possible."""
+    bundle = default_bundle()
+    if bundle is not None and bundle.covers(path) and Path(path).name in bundle.manifest["tables"]:
+        return iter(bundle.table(path))
+    return _text_rows(path)
+
+
+def _text_rows(path) -> Iterator[List[str]]:
+    with open(path) as fh:
+        for line in fh:
+            if not line.strip() or line.startswith("#"):
+                continue
+            yield line.rstrip("\n").split("\t") if "\t" in line else line.split()
+
+
+def anchor_coords(path) -> Dict[str, Tuple[str, int, int, str]]:
+    """Return ``name -> (chrom, start, end, strand)`` for an anchor BED."""
+    bundle = default_bundle()
+    if bundle is not None and bundle.covers(path) and Path(path).name in bundle.manifest["tables"]:
+        return bundle.anchors(path)
+    anchors = {}
+    for fields in _text_rows(path):
+        if len(fields) >= 5:
+            anchors[fields[3]] = (fields[0], int(fields[1]), int(fields[2]), fields[4])
+    return anchors
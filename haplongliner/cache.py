@@ -0,0 +1,210 @@
+"""Persistent, size-bounded key/value caches shared across runs.
+
+Entries live in a SQLite database that several concurrent pipeline runs
+(e.g. one per haplotype) can read and write safely. On a local disk it
+runs in WAL mode, which needs shared memory on a single host; on a network
+filesystem (NFS, Lustre, GPFS, ...) it falls back to the rollback journal
+(``journal_mode=DELETE``) with a busy timeout, so runs on several nodes
+can share one file. Each table keeps at most ``max_entries`` rows; the
+least recently used rows are evicted on write.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+_NETWORK_FS = ("nfs", "nfs4", "lustre", "gpfs", "beegfs", "cifs", "smb3", "smbfs", "ceph", "glusterfs", "pvfs2")
+
+
+def sequence_key(seq: str) -> str:
+    """Return the cache key of a nucleotide sequence (case-insensitive)."""
+    return hashlib.sha256(seq.upper().encode()).hexdigest()
+
+
+def on_network_fs(path) -> bool:
+    """Return ``True`` if ``path`` (or the directory it would be created in) is on a network filesystem."""
+    target = os.path.realpath(path)
+    best, fstype = "", ""
+    try:
+        with open("/proc/mounts") as fh:
+            for line in fh:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount = fields[1].replace("\\040", " ")
+                inside = target == mount or target.startswith(mount.rstrip("/") + "/")
+                if inside and len(mount) > len(best):
+                    best, fstype = mount, fields[2]
+    except OSError:
+        return False
+    return fstype in _NETWORK_FS or fstype.startswith("fuse.")
+
+
+class SqliteCache:
+    """LRU-bounded JSON value cache stored in table ``table`` of ``path``."""
+
+    def __init__(self, path, table: str, max_entries: Optional[int] = 100000) -> None:
+        self.path = str(path)
+        self.table = table
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(self.path, timeout=120, isolation_level=None)
+        if on_network_fs(Path(self.path).parent):
+            # WAL's shared-memory index does not work across hosts
+            self.conn.execute("PRAGMA busy_timeout = 120000")
+            self.conn.execute("PRAGMA journal_mode=DELETE")
+        else:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT, last_used REAL)"
+        )
+        self.conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_lru ON {table} (last_used)"
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "SqliteCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        """Return the cached values for whichever of ``keys`` are present."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, object] = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for key, value in self.conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE key IN ({marks})", chunk
+            ):
+                found[key] = json.loads(value)
+        if found:
+            now = time.time()
+            self._write(
+                f"UPDATE {self.table} SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, object]]) -> None:
+        """Store ``(key, value)`` pairs and evict beyond ``max_entries``."""
+        now = time.time()
+        rows = [(key, json.dumps(value), now) for key, value in items]
+        if rows:
+            self._write(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, last_used) VALUES (?, ?, ?)",
+                rows,
+                evict=True,
+            )
+
+    def _write(self, sql: str, rows, evict: bool = False) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(sql, rows)
+            if evict and self.max_entries is not None:
+                self.conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f"SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+
+class OrfCache(SqliteCache):
+    """Cache of ORF1p/ORF2p best hits and intactness per L1 sequence.
+
+    Values hold the best BLASTP rows with the query name stripped, so that a
+    hit can be replayed into an :class:`~haplongliner.orf_reducer.OrfReducer`
+    under the name of whichever L1 carries the same sequence. Keys combine
+    the sequence hash with the aligner and the checksum of the ORF protein
+    FASTA, so hits from blastp and the builtin aligner, or from another
+    protein set, are never mixed.
+    """
+
+    def __init__(self, path, max_entries: Optional[int] = 100000, aligner: str = "blastp",
+                 orf_db="data/L1rpORF12p.fa") -> None:
+        super().__init__(path, "orf_verdicts", max_entries)
+        self.scope = f"{aligner}:{file_checksum(orf_db)}"
+
+    def key(self, seq: str) -> str:
+        return f"{sequence_key(seq)}:{self.scope}"
+
+    @staticmethod
+    def _strip(row: Optional[str], name: str) -> Optional[str]:
+        return row[len(name):] if row is not None else None
+
+    def replay(self, entry, name: str):
+        """Yield the cached BLASTP rows of ``entry`` renamed to ``name``."""
+        for row in (entry["orf1"], entry["orf2"]):
+            if row is not None:
+                yield name + row
+
+    def entry(self, reducer, name: str):
+        """Return the cache value for ``name`` from a filled reducer."""
+        orf1, orf2 = reducer.best_hits(name)
+        return {
+            "orf1": self._strip(orf1, name),
+            "orf2": self._strip(orf2, name),
+            "intact": reducer.intact(name),
+        }
+
+
+def file_checksum(path, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 digest of the file at ``path``."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FlankMemo(SqliteCache):
+    """Memo of flank-to-reference liftover hits across haplotypes.
+
+    Keys combine the flank sequence hash, the reference checksum and the
+    minimap2 preset. Values are the PAF line ``combine_table`` would select
+    for that flank, without the query name, or ``None`` when no alignment
+    qualifies.
+    """
+
+    def __init__(self, path, max_entries: Optional[int] = 1000000) -> None:
+        super().__init__(path, "flank_liftover", max_entries)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS reference_checksums ("
+            "path TEXT, size INTEGER, mtime_ns INTEGER, checksum TEXT,"
+            " PRIMARY KEY (path, size, mtime_ns))"
+        )
+
+    def reference_checksum(self, reference) -> str:
+        """Return the checksum of ``reference``, hashing it only once per file version."""
+        st = os.stat(reference)
+        ident = (os.path.realpath(reference), st.st_size, st.st_mtime_ns)
+        row = self.conn.execute(
+            "SELECT checksum FROM reference_checksums WHERE path = ? AND size = ? AND mtime_ns = ?",
+            ident,
+        ).fetchone()
+        if row:
+            return row[0]
+        checksum = file_checksum(reference)
+        self._write(
+            "INSERT OR REPLACE INTO reference_checksums VALUES (?, ?, ?, ?)",
+            [(*ident, checksum)],
+        )
+        return checksum
+
+    @staticmethod
+    def key(name: str, seq: str, ref_checksum: str, preset: str) -> str:
+        # combine_table's tie-breaking looks for "_" anywhere in the kept PAF
+        # line, query name included, so the key records whether it has one.
+        return f"{sequence_key(seq)}:{ref_checksum}:{preset}:{int('_' in name)}"
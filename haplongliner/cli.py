@@ -1,15 +1,26 @@
 import argparse
 import sys
-from .module1_RM import run_module1
+from pathlib import Path
+from .bundle import DEFAULT_BUNDLE, Bundle, BundleError, build_bundle
+from .extract_l1 import compile_filter
+from .module1_RM import iter_module1, write_module1
 from .module2_SV import run_module2
 from .module3_DB import run_module3
+from .sv_multi import run_module2_multi
+from .repository import append_sample, import_master
+from .cohort_sites import build_master, read_table_manifest
+from .l1_sketch import cluster_sequences, read_sequences, write_clusters
+from .site_query import MASTER_BED, SiteIndex, format_rows, parse_region, serve
+from .work_queue import WorkQueue, enqueue_manifest, run_worker
+from .batch import command_fetcher, fetch, parse_size, run_batch
+from .metrics import history_path
+from .seqstore import SharedGenome, list_segments, segment_name, unlink_segment
+from .planner import format_plan, inspect_inputs, plan_job, plan_manifest, recommend_jobs
 from .utils import check_dependencies
+from .constants import HG38_URL, HS1_URL
 
 __version__ = "0.1.0"
 
-HS1_URL = "https://hgdownload.soe.ucsc.edu/goldenPath/hs1/bigZips/hs1.fa.gz"
-HG38_URL = "https://hgdownload.soe.ucsc.edu/goldenPath/hg38/bigZips/hg38.fa.gz"
-
 def main():
     parser = argparse.ArgumentParser(
         prog="haplongliner",
@@ -42,6 +53,39 @@ def main():
     ref_group.add_argument("-c", "--custom", help="Custom reference FASTA or gzipped FASTA (local path)")
 
     parser_rm.add_argument("-o", "--out", dest="output", required=True, help="Output directory for intermediate files")
+    parser_rm.add_argument("--orf-cache", dest="orf_cache",
+                           help="SQLite file caching ORF verdicts by L1 sequence across runs")
+    parser_rm.add_argument("--orf-cache-size", dest="orf_cache_size", type=int, default=100000,
+                           help="Maximum number of sequences kept in the ORF cache (default: 100000)")
+    parser_rm.add_argument("--liftover-memo", dest="liftover_memo",
+                           help="SQLite file memoizing flank liftover hits across haplotypes")
+    parser_rm.add_argument("--bgzip", action="store_true",
+                           help="Also write sorted, bgzipped and indexed BED/FASTA outputs (needs htslib)")
+    parser_rm.add_argument("--aligner", choices=["blastp", "builtin"], default="blastp",
+                           help="ORF1p/ORF2p aligner: BLAST+ blastp or the in-process Smith-Waterman (default: blastp)")
+    parser_rm.add_argument("-t", "--threads", type=int, default=1,
+                           help="Worker processes for the builtin aligner and threads for input decompression (default: 1)")
+    parser_rm.add_argument("--decompress-cache", dest="decompress_cache",
+                           help="Directory keeping decompressed copies of gzipped inputs across runs "
+                                "(default: a per-run copy that is removed afterwards)")
+    parser_rm.add_argument("--keep-orf-tables", dest="keep_orf_tables", action="store_true", default=None,
+                           help="Also write the longest and intact ORF hit tables (FLAllORF.*.blastp) for debugging")
+    parser_rm.add_argument("--rescue-flanks", dest="rescue_flanks", action="store_true",
+                           help="Retry loci without a concordant 2 kb flank liftover using longer or offset flanks")
+    parser_rm.add_argument("--filter", dest="l1_filter",
+                           help="Expression over subfamily, length, contig and strand selecting which "
+                                "full-length L1s to analyse, e.g. \"subfamily in ('L1HS', 'L1PA2', 'L1PA3')\"")
+    parser_rm.add_argument("--regions",
+                           help="Only analyse L1s overlapping these assembly windows: a BED file or a "
+                                "comma-separated list of contig:start-end (1-based)")
+    parser_rm.add_argument("--merge-into", dest="merge_into",
+                           help="Output directory of an earlier full run whose rows in --regions are replaced")
+    parser_rm.add_argument("--metrics", help="SQLite history of per-stage metrics to append this run to "
+                           "and to fit --plan estimates from (default: $HAPLONGLINER_METRICS)")
+    parser_rm.add_argument("--plan", action="store_true",
+                           help="Print predicted time, memory and disk per stage before running")
+    parser_rm.add_argument("--dry-run", dest="dry_run", action="store_true",
+                           help="Inspect the inputs and print the plan without running")
     parser_rm.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
                            help="Show this help message and exit.")
 
@@ -51,21 +95,192 @@ def main():
     parser_sv.add_argument("-s", "--sv", required=True, help="Structural variant callset")
     parser_sv.add_argument("-l", "--l1ref", required=True, help="Pangenome-level L1 reference FASTA")
     parser_sv.add_argument("-o", "--out", dest="output", required=True, help="Output BED file")
+    parser_sv.add_argument("--bgzip", action="store_true",
+                           help="Also write a sorted, bgzipped and tabix-indexed BED (needs htslib)")
+    parser_sv.add_argument("--no-ins-screen", dest="ins_screen", action="store_false",
+                           help="Skip screening insertion ALT sequences for novel full-length L1s")
+    parser_sv.add_argument("--aligner", choices=["blastp", "builtin"], default="blastp",
+                           help="ORF1p/ORF2p aligner for screened insertions (default: blastp)")
+    parser_sv.add_argument("-t", "--threads", type=int, default=1,
+                           help="Threads for decompressing gzipped inputs (default: 1)")
+    parser_sv.add_argument("--decompress-cache", dest="decompress_cache",
+                           help="Directory keeping decompressed copies of gzipped inputs across runs "
+                                "(default: a per-run copy that is removed afterwards)")
+    parser_sv.add_argument("--anchor-store", dest="anchor_store",
+                           help="Per-assembly SQLite file keeping anchor liftovers and verdicts, so reruns "
+                                "after an anchor catalogue update only process added or changed anchors")
+    parser_sv.add_argument("--regions",
+                           help="Only analyse L1s overlapping these assembly windows: a BED file or a "
+                                "comma-separated list of contig:start-end (1-based)")
+    parser_sv.add_argument("--merge-into", dest="merge_into",
+                           help="Output BED of an earlier full run whose rows in --regions are replaced")
+    parser_sv.add_argument("--metrics", help="SQLite history of per-stage metrics to append this run to "
+                           "and to fit --plan estimates from (default: $HAPLONGLINER_METRICS)")
+    parser_sv.add_argument("--plan", action="store_true",
+                           help="Print predicted time, memory and disk per stage before running")
+    parser_sv.add_argument("--dry-run", dest="dry_run", action="store_true",
+                           help="Inspect the inputs and print the plan without running")
     parser_sv.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
                            help="Show this help message and exit.")
 
+    # Module 2 over a multi-sample VCF
+    parser_svm = subparsers.add_parser("sv-multi", help="Module 2 for every haplotype of a multi-sample SV VCF in one pass", add_help=False)
+    parser_svm.add_argument("-s", "--sv", required=True, help="Multi-sample SV VCF (plain or gzipped) with per-sample GT")
+    parser_svm.add_argument("-o", "--out", dest="output", required=True, help="Output directory")
+    parser_svm.add_argument("--samples", help="Comma-separated sample columns to process (default: all)")
+    parser_svm.add_argument("--bgzip", action="store_true",
+                            help="Also write sorted, bgzipped and tabix-indexed BEDs (needs htslib)")
+    parser_svm.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                            help="Show this help message and exit.")
+
     # Module 3: Database
     parser_db = subparsers.add_parser("db", help="Module 3: L1 sequence repository", add_help=False)
     parser_db.add_argument("-o", "--out", dest="output", required=True, help="Output directory or file")
     parser_db.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
                            help="Show this help message and exit.")
 
+    # Reference data bundle
+    parser_bundle = subparsers.add_parser("bundle", help="Compile the packaged reference data into a binary bundle", add_help=False)
+    parser_bundle.add_argument("-d", "--data", default="data", help="Directory with the text reference data (default: data)")
+    parser_bundle.add_argument("-o", "--out", dest="output", help="Bundle path (default: <data>/reference.hlb)")
+    parser_bundle.add_argument("--check", action="store_true", help="Only report whether the bundle is up to date")
+    parser_bundle.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                               help="Show this help message and exit.")
+
+    # Incremental repository update
+    parser_append = subparsers.add_parser("append", help="Add one haplotype's module 1/2 output to a cohort repository", add_help=False)
+    parser_append.add_argument("-d", "--db", required=True, help="Cohort repository (SQLite) to update")
+    parser_append.add_argument("-t", "--table", required=True, help="Module 1 HapLongLINErRM.txt or module 2 BED")
+    parser_append.add_argument("-s", "--sample", required=True, help="Sample name, e.g. HG00733")
+    parser_append.add_argument("-p", "--haplotype", required=True, choices=["1", "2", "paternal", "maternal"], help="Haplotype")
+    parser_append.add_argument("-f", "--fasta", help="L1 sequences (e.g. module 1 FL.fa) to store as diffs against L1rp")
+    parser_append.add_argument("--master", help="Master BED used to seed the repository if it does not exist yet")
+    parser_append.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                               help="Show this help message and exit.")
+
+    # Master table from per-haplotype outputs
+    parser_sites = subparsers.add_parser("sites", help="Cluster per-haplotype module 1/2 outputs into a master table", add_help=False)
+    parser_sites.add_argument("-m", "--manifest", required=True, help="TSV with sample, haplotype and table columns")
+    parser_sites.add_argument("-o", "--out", dest="output", required=True, help="Output master BED")
+    parser_sites.add_argument("--previous", help="Earlier master BED whose site IDs are kept")
+    parser_sites.add_argument("--slop", type=int, default=100, help="Merge distance in bp (default: 100)")
+    parser_sites.add_argument("--buffer", type=int, default=500000,
+                              help="Calls held in memory before spilling a sorted chunk (default: 500000)")
+    parser_sites.add_argument("--tmp-dir", dest="tmp_dir", help="Directory for sorted chunks (default: system temp)")
+    parser_sites.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                              help="Show this help message and exit.")
+
+    # Site lookups
+    parser_query = subparsers.add_parser("query", help="Look up cohort L1 sites by ID, sample or region", add_help=False)
+    source_group = parser_query.add_mutually_exclusive_group()
+    source_group.add_argument("--master", default=str(MASTER_BED),
+                              help=f"Master BED to index (default: {MASTER_BED})")
+    source_group.add_argument("-d", "--db", help="Cohort repository (SQLite) to index instead of a master BED")
+    lookup_group = parser_query.add_mutually_exclusive_group(required=True)
+    lookup_group.add_argument("--site", help="Site ID, e.g. 014887A1")
+    lookup_group.add_argument("--sample", help="Sample name; lists its calls")
+    lookup_group.add_argument("-r", "--region", help="hs1 region chrom:start-end (1-based, inclusive)")
+    lookup_group.add_argument("-b", "--bed", help="BED file to annotate with overlapping sites and frequencies")
+    lookup_group.add_argument("--serve", action="store_true", help="Keep the index resident behind a local HTTP/JSON service")
+    parser_query.add_argument("-o", "--out", dest="output", help="Annotated BED (with --bed; default: stdout)")
+    parser_query.add_argument("--host", default="127.0.0.1", help="Address for --serve (default: 127.0.0.1)")
+    parser_query.add_argument("--port", type=int, default=8765, help="Port for --serve (default: 8765)")
+    parser_query.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                              help="Show this help message and exit.")
+
+    # Sequence clustering
+    parser_cluster = subparsers.add_parser("cluster", help="Cluster L1 sequences into near-identical groups with MinHash LSH", add_help=False)
+    parser_cluster.add_argument("-i", "--in", dest="input", nargs="+", required=True,
+                                help="L1 FASTA files, e.g. the module 1 FL.fa of every haplotype")
+    parser_cluster.add_argument("-o", "--out", dest="output", required=True, help="Output cluster table")
+    parser_cluster.add_argument("--identity", type=float, default=0.98, help="Minimum identity to a cluster representative (default: 0.98)")
+    parser_cluster.add_argument("-k", "--kmer", type=int, default=15, help="k-mer size for sketches (default: 15)")
+    parser_cluster.add_argument("--sketch-size", dest="sketch_size", type=int, default=128,
+                                help="MinHash values per sequence, a power of two (default: 128)")
+    parser_cluster.add_argument("--no-align", dest="align", action="store_false",
+                                help="Decide membership from sketch estimates only, without edlib alignment")
+    parser_cluster.add_argument("-t", "--threads", type=int, default=1, help="Sketching processes (default: 1)")
+    parser_cluster.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                                help="Show this help message and exit.")
+
+    # Cohort work queue
+    parser_enqueue = subparsers.add_parser("enqueue", help="Add jobs from a TSV manifest to a shared work queue", add_help=False)
+    parser_enqueue.add_argument("-q", "--queue", required=True, help="Work queue (SQLite file on shared storage)")
+    parser_enqueue.add_argument("-m", "--manifest", required=True,
+                                help="TSV with sample, haplotype, module (rm/sv) and module parameter columns")
+    parser_enqueue.add_argument("--max-attempts", dest="max_attempts", type=int, default=3,
+                                help="Attempts per job before it is marked failed (default: 3)")
+    parser_enqueue.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                                help="Show this help message and exit.")
+
+    parser_worker = subparsers.add_parser("worker", help="Process jobs from a shared work queue", add_help=False)
+    parser_worker.add_argument("-q", "--queue", required=True, help="Work queue (SQLite file on shared storage)")
+    parser_worker.add_argument("--id", dest="worker_id", help="Worker name (default: host:pid)")
+    parser_worker.add_argument("--lease", type=float, default=600, help="Job lease in seconds (default: 600)")
+    parser_worker.add_argument("--heartbeat", type=float, default=60, help="Lease renewal interval in seconds (default: 60)")
+    parser_worker.add_argument("--once", action="store_true", help="Exit after processing a single job")
+    parser_worker.add_argument("--status", action="store_true", help="Print job counts by state and exit")
+    parser_worker.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                               help="Show this help message and exit.")
+
+    # Single-node batch with input prefetching
+    parser_batch = subparsers.add_parser("batch", help="Run a job manifest on this node, prefetching inputs while jobs run", add_help=False)
+    parser_batch.add_argument("-m", "--manifest", required=True,
+                              help="TSV with sample, haplotype, module (rm/sv) and module parameter columns")
+    parser_batch.add_argument("--staging", required=True, help="Local directory for staged inputs")
+    parser_batch.add_argument("--prefetch", type=int, default=2, help="Jobs staged ahead of the running ones (default: 2)")
+    parser_batch.add_argument("--quota", type=parse_size, help="Maximum size of the staging area, e.g. 200G (default: unlimited)")
+    parser_batch.add_argument("-j", "--jobs", type=int, default=1, help="Jobs processed concurrently (default: 1)")
+    parser_batch.add_argument("--fetch-cmd", dest="fetch_cmd",
+                              help="Command used to copy an input, with {src} and {dest} placeholders "
+                                   "(default: built-in copy for paths and http/https/ftp URLs)")
+    parser_batch.add_argument("--input-estimate", dest="input_estimate", type=parse_size,
+                              help="Size counted against --quota for an input whose size is unknown until fetched, "
+                                   "e.g. 4G for s3:// sources (default: fetch it once the staging area is below "
+                                   "its quota)")
+    parser_batch.add_argument("--metrics", help="SQLite metrics history passed to every job and used by --plan "
+                                                "(default: $HAPLONGLINER_METRICS)")
+    parser_batch.add_argument("--plan", action="store_true",
+                              help="Print a per-job plan with recommended --jobs and --quota before running")
+    parser_batch.add_argument("--dry-run", dest="dry_run", action="store_true",
+                              help="Print the plan without running any job")
+    parser_batch.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                              help="Show this help message and exit.")
+
+    # Node-local shared-memory sequence stores
+    parser_seqstore = subparsers.add_parser("seqstore", help="Load assemblies into shared memory for the jobs on this node", add_help=False)
+    parser_seqstore.add_argument("action", choices=["load", "drop", "list"],
+                                 help="load: pack FASTAs into shared memory; drop: remove their stores "
+                                      "(all stores when none is given); list: show the stores on this node")
+    parser_seqstore.add_argument("fasta", nargs="*", help="Plain or gzipped FASTA files (or store names for drop)")
+    parser_seqstore.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                                 help="Show this help message and exit.")
+
     args = parser.parse_args()
 
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
         sys.exit(1)
 
+    if args.command in ("rm", "sv") and args.merge_into and not args.regions:
+        (parser_rm if args.command == "rm" else parser_sv).error("--merge-into requires --regions")
+    if args.command == "sv" and args.anchor_store and args.regions:
+        parser_sv.error("--anchor-store cannot be combined with --regions")
+    if args.command in ("rm", "sv") and (args.plan or args.dry_run):
+        params = {"input": args.input, "reference": args.custom or args.reference, "mask": args.mask} \
+            if args.command == "rm" else {"input": args.input, "sv": args.sv}
+        drivers, notes = inspect_inputs(args.command, params)
+        rows = plan_job(args.command, drivers, history_path(args.metrics))
+        print(format_plan(f"{args.command} {args.input}", rows, notes))
+        jobs, reason = recommend_jobs(max(r[4] for r in rows), args.threads)
+        print(f"[PLAN] {jobs} such jobs fit on this node at once (limited by {reason})")
+        if args.dry_run:
+            return
+    elif args.command == "batch" and (args.plan or args.dry_run):
+        print(plan_manifest(args.manifest, history_path(args.metrics), args.prefetch))
+        if args.dry_run:
+            return
+
     if args.command == "rm":
         # Determine reference path/URL
         if args.reference == "hs1":
@@ -74,17 +289,126 @@ def main():
             reference = HG38_URL
         else:
             reference = args.custom
-        run_module1(
+        if args.l1_filter:
+            try:
+                compile_filter(args.l1_filter)
+            except ValueError as exc:
+                parser_rm.error(str(exc))
+        # Stream the records to disk instead of collecting them
+        records = iter_module1(
             args.input,
             args.mask,
             reference,
             args.output,
             log_skipped=args.log_skipped,
+            orf_cache=args.orf_cache,
+            orf_cache_size=args.orf_cache_size,
+            liftover_memo=args.liftover_memo,
+            aligner=args.aligner,
+            threads=args.threads,
+            l1_filter=args.l1_filter,
+            rescue_flanks=args.rescue_flanks,
+            keep_fasta=args.bgzip,
+            decompress_cache=args.decompress_cache,
+            metrics=args.metrics,
+            regions=args.regions,
+            keep_orf_tables=args.keep_orf_tables,
         )
+        write_module1(records, args.output, bgzip=args.bgzip, regions=args.regions, merge_into=args.merge_into)
     elif args.command == "sv":
-        run_module2(args.input, args.sv, args.l1ref, args.output)
+        run_module2(args.input, args.sv, args.l1ref, args.output, bgzip=args.bgzip,
+                    screen_insertions=args.ins_screen, aligner=args.aligner, threads=args.threads,
+                    decompress_cache=args.decompress_cache, metrics=args.metrics,
+                    regions=args.regions, merge_into=args.merge_into, anchor_store=args.anchor_store)
+    elif args.command == "sv-multi":
+        samples = args.samples.split(",") if args.samples else None
+        run_module2_multi(args.sv, args.output, samples=samples, bgzip=args.bgzip)
     elif args.command == "db":
         run_module3(args.output)
+    elif args.command == "enqueue":
+        added = enqueue_manifest(args.queue, args.manifest, args.max_attempts)
+        print(f"Queued {added} new jobs in {args.queue}")
+    elif args.command == "worker":
+        if args.status:
+            queue = WorkQueue(args.queue)
+            for state, count in sorted(queue.counts().items()):
+                print(f"{state}\t{count}")
+            queue.close()
+        else:
+            done = run_worker(args.queue, args.worker_id, args.lease, args.heartbeat, once=args.once)
+            print(f"Worker finished {done} jobs")
+    elif args.command == "batch":
+        fetcher = command_fetcher(args.fetch_cmd) if args.fetch_cmd else fetch
+        counts = run_batch(args.manifest, args.staging, prefetch=args.prefetch, quota=args.quota,
+                           fetcher=fetcher, jobs=args.jobs, metrics=args.metrics,
+                           input_estimate=args.input_estimate)
+        print(f"Batch finished: {counts['done']} done, {counts['failed']} failed")
+    elif args.command == "bundle":
+        path = Path(args.output) if args.output else Path(args.data) / DEFAULT_BUNDLE.name
+        if args.check:
+            try:
+                Bundle(path, data_dir=args.data)
+            except BundleError as exc:
+                sys.exit(f"Error: {exc}")
+            print(f"{path} is up to date")
+        else:
+            print(f"Wrote {build_bundle(args.data, path)}")
+    elif args.command == "append":
+        if args.master and not Path(args.db).exists():
+            import_master(args.master, args.db)
+        counts = append_sample(args.db, args.table, args.sample, args.haplotype, fasta=args.fasta)
+        print(
+            f"Appended {args.sample} {args.haplotype}: {counts['added']} added, "
+            f"{counts['updated']} updated, {counts['removed']} removed, {counts['duplicates']} duplicates, "
+            f"{counts['new_sites']} new sites"
+        )
+    elif args.command == "query":
+        index = SiteIndex.from_repository(args.db) if args.db else SiteIndex.from_master(args.master)
+        if args.serve:
+            serve(index, args.host, args.port)
+        elif args.bed:
+            index.annotate_bed(args.bed, args.output or "/dev/stdout")
+        else:
+            if args.site:
+                rows = index.site(args.site)
+            elif args.sample:
+                rows = index.sample(args.sample)
+            else:
+                try:
+                    rows = index.overlap(*parse_region(args.region))
+                except ValueError:
+                    parser_query.error(f"Invalid region: {args.region}")
+            for line in format_rows(rows):
+                print(line)
+    elif args.command == "cluster":
+        sequences = read_sequences(args.input)
+        rows = cluster_sequences(sequences, args.identity, args.kmer, args.sketch_size,
+                                 threads=args.threads, align=args.align)
+        write_clusters(rows, args.output)
+        print(f"Clustered {len(rows)} sequences into {len({row[1] for row in rows})} clusters: {args.output}")
+    elif args.command == "seqstore":
+        if args.action == "load":
+            if not args.fasta:
+                parser_seqstore.error("load needs at least one FASTA")
+            for fasta in args.fasta:
+                with SharedGenome.open(fasta) as genome:
+                    print(f"Loaded {fasta}: {len(genome)} contigs, {genome.nbytes / (1 << 20):.1f} MB in {genome.name}")
+        elif args.action == "drop":
+            names = [segment_name(f) if Path(f).is_file() else f for f in args.fasta]
+            for name in names or [name for name, _, _ in list_segments()]:
+                try:
+                    unlink_segment(name)
+                except FileNotFoundError:
+                    print(f"No store {name}", file=sys.stderr)
+                else:
+                    print(f"Dropped {name}")
+        else:
+            for name, source, size in list_segments():
+                print(f"{name}\t{size / (1 << 20):.1f} MB\t{source}")
+    elif args.command == "sites":
+        counts = build_master(read_table_manifest(args.manifest), args.output, previous=args.previous,
+                              slop=args.slop, buffer_size=args.buffer, tmpdir=args.tmp_dir)
+        print(f"Wrote {counts['sites']} sites ({counts['calls']} calls, {counts['new_ids']} new IDs) to {args.output}")
 
 if __name__ == "__main__":
     check_dependencies()
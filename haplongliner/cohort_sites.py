@@ -0,0 +1,257 @@
+"""Build the cohort master table from per-haplotype module 1 and module 2 outputs.
+
+Every carrier call in the listed ``HapLongLINErRM.txt`` tables and module 2
+BEDs is streamed into sorted chunk files of at most ``buffer_size`` calls,
+the chunks are merged by ``(chrom, strand, start)`` and a single sweep
+clusters calls whose hs1 spans overlap (within ``slop``) on the same strand
+into sites. Only one cluster is held in memory at a time, so the cost is
+dominated by the external sort rather than by cohort size.
+
+Site IDs are kept stable across rebuilds: a site overlapping one of a
+previous master table keeps that ID, a site containing a module 2 call keeps
+the HPRC anchor name, and only the remaining sites get a new
+:func:`~haplongliner.repository.make_site_id` ID.
+"""
+
+import csv
+import heapq
+import tempfile
+from bisect import bisect_right
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .bundle import anchor_coords, bed_rows
+from .repository import (
+    ANCHOR_BED,
+    YOUNG_L1,
+    HAPLOTYPES,
+    assembly_tag,
+    is_module2,
+    make_site_id,
+    parse_hs1_coord,
+    read_module1,
+    read_module2,
+)
+
+# chrom, strand, start, end, sample, haplotype, status, lineage, assembly_info, anchor
+Call = Tuple[str, str, int, int, str, str, str, str, str, str]
+
+_STATUS_RANK = {"intact": 2, "present": 1}
+
+
+def read_table_manifest(manifest) -> List[Tuple[str, str, str]]:
+    """Return ``(sample, haplotype, table)`` rows from a TSV manifest.
+
+    The manifest needs ``sample``, ``haplotype`` (``1``/``2`` or
+    ``paternal``/``maternal``) and ``table`` columns; relative table paths
+    are resolved against the manifest's directory.
+    """
+    base = Path(manifest).parent
+    rows = []
+    with open(manifest, newline="") as fh:
+        for row in csv.DictReader(fh, delimiter="\t"):
+            table = Path(row["table"])
+            rows.append((row["sample"], HAPLOTYPES[row["haplotype"]], str(table if table.is_absolute() else base / table)))
+    return rows
+
+
+def _iter_calls(sample: str, haplotype: str, table, anchors: Dict[str, Tuple[str, int, int, str]],
+                lineages) -> Iterator[Call]:
+    """Yield the carrier calls of one haplotype's table in hs1 coordinates."""
+    tag = assembly_tag(sample, haplotype)
+    if is_module2(table):
+        for row in read_module2(table):
+            if not row["carrier"] or row["site_id"] not in anchors:
+                continue
+            chrom, start, end, strand = anchors[row["site_id"]]
+            yield (chrom, strand, start, end, sample, haplotype, row["status"], "NA",
+                   tag + row["key"], row["site_id"])
+    else:
+        for row in read_module1(table):
+            if row["lineage"] not in lineages:
+                continue
+            yield (row["chrom"], row["strand"], row["start"], row["end"], sample, haplotype,
+                   row["status"], row["lineage"], tag + row["key"], "")
+
+
+def _sort_key(call: Call):
+    return call[0], call[1], call[2], call[3]
+
+
+def _write_chunk(calls: List[Call], tmpdir: str) -> str:
+    calls.sort(key=_sort_key)
+    with tempfile.NamedTemporaryFile("w", dir=tmpdir, suffix=".calls", delete=False) as fh:
+        for call in calls:
+            fh.write("\t".join(map(str, call)) + "\n")
+    return fh.name
+
+
+def _read_chunk(path: str) -> Iterator[Call]:
+    with open(path) as fh:
+        for line in fh:
+            f = line.rstrip("\n").split("\t")
+            yield (f[0], f[1], int(f[2]), int(f[3]), f[4], f[5], f[6], f[7], f[8], f[9])
+
+
+def sorted_calls(tables: Iterable[Tuple[str, str, str]], tmpdir: str, anchors, lineages=YOUNG_L1,
+                 buffer_size: int = 500000) -> Iterator[Call]:
+    """Yield every carrier call of ``tables`` ordered by ``(chrom, strand, start, end)``.
+
+    Calls are spilled to sorted chunk files in ``tmpdir`` whenever
+    ``buffer_size`` of them have accumulated and merged back with
+    :func:`heapq.merge`.
+    """
+    lineages = set(lineages)
+    chunks = []
+    buffer: List[Call] = []
+    for sample, haplotype, table in tables:
+        for call in _iter_calls(sample, haplotype, table, anchors, lineages):
+            buffer.append(call)
+            if len(buffer) >= buffer_size:
+                chunks.append(_write_chunk(buffer, tmpdir))
+                buffer = []
+    if not chunks:
+        buffer.sort(key=_sort_key)
+        yield from buffer
+        return
+    if buffer:
+        chunks.append(_write_chunk(buffer, tmpdir))
+    yield from heapq.merge(*map(_read_chunk, chunks), key=_sort_key)
+
+
+def cluster_calls(calls: Iterable[Call], slop: int = 100) -> Iterator[List[Call]]:
+    """Group sorted calls into sites by strand-aware overlap within ``slop``."""
+    cluster: List[Call] = []
+    key = None
+    cluster_end = 0
+    for call in calls:
+        if cluster and call[:2] == key and call[2] <= cluster_end + slop:
+            cluster.append(call)
+            cluster_end = max(cluster_end, call[3])
+            continue
+        if cluster:
+            yield cluster
+        cluster = [call]
+        key = call[:2]
+        cluster_end = call[3]
+    if cluster:
+        yield cluster
+
+
+class _PreviousSites:
+    """Sites of an earlier master table, for carrying their IDs over."""
+
+    def __init__(self, master) -> None:
+        spans: Dict[str, List] = {}
+        for fields in bed_rows(master):
+            if len(fields) < 10:
+                continue
+            chrom, start, end, strand = parse_hs1_coord(fields[9])
+            span = spans.get(fields[0])
+            if span is None:
+                spans[fields[0]] = [chrom, strand, start, end]
+            else:
+                span[2] = min(span[2], start)
+                span[3] = max(span[3], end)
+        self.ids = set(spans)
+        self.max_span = max((s[3] - s[2] for s in spans.values()), default=0)
+        self.by_strand: Dict[Tuple[str, str], Tuple[List[int], List[Tuple[int, str]]]] = {}
+        for site_id, (chrom, strand, start, end) in sorted(spans.items(), key=lambda kv: kv[1][2]):
+            starts, rest = self.by_strand.setdefault((chrom, strand), ([], []))
+            starts.append(start)
+            rest.append((end, site_id))
+
+    def match(self, chrom: str, strand: str, start: int, end: int, slop: int, used) -> Optional[str]:
+        """Return the unused previous site nearest ``start`` overlapping ``start-end``."""
+        entry = self.by_strand.get((chrom, strand))
+        if entry is None:
+            return None
+        starts, rest = entry
+        best = None
+        i = bisect_right(starts, end + slop) - 1
+        while i >= 0 and starts[i] >= start - slop - self.max_span:
+            s_end, site_id = rest[i]
+            if s_end >= start - slop and site_id not in used:
+                if best is None or abs(starts[i] - start) < best[0]:
+                    best = (abs(starts[i] - start), site_id)
+            i -= 1
+        return best[1] if best else None
+
+
+def _site_id(cluster: List[Call], start: int, end: int, previous: Optional[_PreviousSites],
+             slop: int, used: set, taken: set) -> str:
+    chrom, strand = cluster[0][:2]
+    if previous is not None:
+        site_id = previous.match(chrom, strand, start, end, slop, used)
+        if site_id is not None:
+            return site_id
+    for name, _ in Counter(c[9] for c in cluster if c[9]).most_common():
+        if name not in used:
+            return name
+    return make_site_id(chrom, start, taken)
+
+
+def _dedup(cluster: List[Call]) -> List[Call]:
+    """Keep one call per haplotype, preferring ``intact`` over ``present``."""
+    best: Dict[Tuple[str, str], Call] = {}
+    for call in cluster:
+        key = call[4], call[5]
+        if key not in best or _STATUS_RANK.get(call[6], 0) > _STATUS_RANK.get(best[key][6], 0):
+            best[key] = call
+    return sorted(best.values(), key=lambda c: (c[4], c[5] != "paternal"))
+
+
+def build_master(tables: Iterable[Tuple[str, str, str]], out, previous=None, anchors=ANCHOR_BED,
+                 lineages: Iterable[str] = YOUNG_L1, slop: int = 100, buffer_size: int = 500000,
+                 tmpdir=None) -> Dict[str, int]:
+    """Cluster the calls of ``tables`` into sites and write a master BED to ``out``.
+
+    ``tables`` holds ``(sample, haplotype, table)`` tuples, where ``table``
+    is a module 1 ``HapLongLINErRM.txt`` or a module 2 BED. The output has
+    the ``HPRC_L1_hs1_master_v2.bed`` layout, with sites numbered in
+    coordinate order; ``site_lineage`` joins the distinct lineages seen at
+    the site. ``previous`` is an earlier master table whose site IDs are
+    reused. Returns counts of ``calls``, ``sites`` and ``new_ids``.
+    """
+    anchor_table = anchor_coords(anchors)
+    prev = _PreviousSites(previous) if previous else None
+    taken = set(anchor_table)
+    if prev is not None:
+        taken |= prev.ids
+    used: set = set()
+    counts = {"calls": 0, "sites": 0, "new_ids": 0}
+    with tempfile.TemporaryDirectory(dir=tmpdir) as workdir, open(out, "w") as fh:
+        calls = sorted_calls(tables, workdir, anchor_table, lineages, buffer_size)
+        for index, cluster in enumerate(cluster_calls(calls, slop), 1):
+            start = min(c[2] for c in cluster)
+            end = max(c[3] for c in cluster)
+            site_id = _site_id(cluster, start, end, prev, slop, used, taken)
+            if site_id not in taken:
+                counts["new_ids"] += 1
+            used.add(site_id)
+            taken.add(site_id)
+            cluster = _dedup(cluster)
+            present = len(cluster)
+            intact = sum(c[6] == "intact" for c in cluster)
+            site_lineage = "_".join(sorted({c[7] for c in cluster} - {"NA"})) or "NA"
+            for chrom, strand, c_start, c_end, sample, haplotype, status, lineage, info, _ in cluster:
+                fh.write(
+                    f"{site_id}\t{sample}\t{haplotype}\t{status}\t{lineage}\t{site_lineage}\t"
+                    f"{present}\t{intact}\t{info}\t{chrom}_{c_start}_{c_end}_{strand}\t{index}\n"
+                )
+            counts["calls"] += present
+            counts["sites"] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the cohort master table from per-haplotype outputs")
+    parser.add_argument("manifest", help="TSV with sample, haplotype and table columns")
+    parser.add_argument("-o", "--out", required=True, help="Output master BED")
+    parser.add_argument("--previous", help="Earlier master BED whose site IDs are kept")
+    parser.add_argument("--slop", type=int, default=100, help="Merge distance in bp (default: 100)")
+    args = parser.parse_args()
+    print(build_master(read_table_manifest(args.manifest), args.out, previous=args.previous, slop=args.slop))
@@ -1,46 +1,63 @@
 import sys
 import re
-from typing import Dict
+from os import PathLike
+from typing import Dict, Iterable, Iterator, Tuple, Union
 
 
-def _read_minimap(file_path: str) -> Dict[str, str]:
+def _read_minimap(source: Union[str, PathLike, Iterable[str]]) -> Dict[str, str]:
+    """Pick the liftover PAF line for each flank from a path or PAF lines."""
+    if isinstance(source, (str, PathLike)):
+        with open(source) as fh:
+            return _read_minimap(fh)
     result = {}
-    with open(file_path) as fh:
-        for line in fh:
-            if not line.strip():
-                continue
-            fields = line.strip().split()
-            if len(fields) < 4:
-                continue
-            key = fields[0]
-            aln_len = int(fields[3]) - int(fields[2])
-            if aln_len >= 200 and (key not in result or "_" in result[key]):
-                result[key] = line.strip()
+    for line in source:
+        if not line.strip():
+            continue
+        fields = line.strip().split()
+        if len(fields) < 4:
+            continue
+        key = fields[0]
+        aln_len = int(fields[3]) - int(fields[2])
+        if aln_len >= 200 and (key not in result or "_" in result[key]):
+            result[key] = line.strip()
     return result
 
 
-def _read_intact(file_path: str) -> Dict[str, str]:
+def _read_intact(source: Union[str, PathLike, Iterable[str]]) -> Dict[str, str]:
+    """Index intact ORF rows by L1 key.
+
+    ``source`` is either a path to a ``find_intact_orf`` table or an iterable
+    of its rows, e.g. :meth:`OrfReducer.intact_lines`.
+    """
+    if isinstance(source, (str, PathLike)):
+        with open(source) as fh:
+            return _read_intact(fh)
     result = {}
-    with open(file_path) as fh:
-        for line in fh:
-            if not line.strip():
-                continue
-            fields = line.strip().split()
-            m = re.match(r"^(.+?)_(\d+)_(\d+)_([+-])(?:_.*)?$", fields[0])
-            if not m:
-                continue
-            chrom, start, end, _ = m.groups()
-            key = f"{chrom}_{start}_{end}"
-            result[key] = line.strip()
+    for line in source:
+        if not line.strip():
+            continue
+        fields = line.strip().split()
+        m = re.match(r"^(.+?)_(\d+)_(\d+)_([+-])(?:_.*)?$", fields[0])
+        if not m:
+            continue
+        chrom, start, end, _ = m.groups()
+        key = f"{chrom}_{start}_{end}"
+        result[key] = line.strip()
     return result
 
 
-def combine_table(plus_file: str, minus_file: str, intact_file: str, fl_bed: str, out_file: str) -> None:
+def combine_rows(plus_file: str, minus_file: str, intact_file: Union[str, PathLike, Iterable[str]], fl_bed: str) -> Iterator[Tuple[str, ...]]:
+    """Yield one row per full-length L1 in ``fl_bed``.
+
+    Rows are ``(chrom, start, end, strand, length, name, status, ref_chrom,
+    ref_start, ref_end, ref_strand)`` strings, with ``NA`` for a failed
+    liftover; :func:`combine_table` joins them into ``HapLongLINErRM.txt``.
+    """
     plus = _read_minimap(plus_file)
     minus = _read_minimap(minus_file)
     intact = _read_intact(intact_file)
 
-    with open(fl_bed) as bed, open(out_file, "w") as out:
+    with open(fl_bed) as bed:
         for line in bed:
             if not line.strip() or line.startswith("#"):
                 continue
@@ -90,9 +107,13 @@ def combine_table(plus_file: str, minus_file: str, intact_file: str, fl_bed: str
                 if start_ref != "NA" and end_ref != "NA" and int(end_ref) < int(start_ref):
                     start_ref, end_ref = end_ref, start_ref
 
-            out.write(
-                f"{chrom}_{start}_{end}_{strand}_{dot}_{name}_{status}\t{chr_ref}_{start_ref}_{end_ref}_{out_strand}\n"
-            )
+            yield chrom, start, end, strand, dot, name, status, chr_ref, start_ref, end_ref, out_strand
+
+
+def combine_table(plus_file: str, minus_file: str, intact_file: Union[str, PathLike, Iterable[str]], fl_bed: str, out_file: str) -> None:
+    with open(out_file, "w") as out:
+        for row in combine_rows(plus_file, minus_file, intact_file, fl_bed):
+            out.write("_".join(row[:7]) + "\t" + "_".join(row[7:]) + "\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+"""Values shared by the command line and the batch runners."""
+
+HS1_URL = "https://hgdownload.soe.ucsc.edu/goldenPath/hs1/bigZips/hs1.fa.gz"
+HG38_URL = "https://hgdownload.soe.ucsc.edu/goldenPath/hg38/bigZips/hg38.fa.gz"
+
+# Names accepted in place of a reference genome path or URL
+REFERENCES = {"hs1": HS1_URL, "hg38": HG38_URL}
@@ -0,0 +1,233 @@
+"""Decompress gzipped inputs once into a cached, indexed local copy.
+
+Assemblies (``.fa.gz``), RepeatMasker annotations (``.out.gz``,
+``.bed.gz``), SV callsets and references are otherwise decompressed again
+by every stage that reads them (``gzip.open``, each ``seqtk`` and
+``minimap2`` call). :class:`InputCache` turns each compressed input into a
+plain file the first time it is asked for, and hands the same copy to every
+later stage.
+
+BGZF files (bgzip output, the usual form of indexed genomes and VCFs) are
+decompressed block-parallel: blocks are found from their headers and
+inflated with :mod:`zlib` on a thread pool (``zlib`` releases the GIL), then
+written in order. Ordinary gzip streams go through ``pigz`` or ``igzip``
+when installed, and a single ``zlib`` stream otherwise. FASTA copies get a
+``.fai`` index.
+"""
+
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional
+
+_BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+_FASTA_SUFFIXES = (".fa", ".fasta", ".fna")
+# Blocks handed to a worker at once (BGZF blocks hold at most 64 KiB)
+_BLOCKS_PER_TASK = 64
+
+
+def is_gzip(path) -> bool:
+    with open(path, "rb") as fh:
+        return fh.read(2) == b"\x1f\x8b"
+
+
+def is_bgzf(path) -> bool:
+    """Return ``True`` if ``path`` starts with a BGZF block (``BC`` extra subfield)."""
+    with open(path, "rb") as fh:
+        head = fh.read(12)
+        if len(head) < 12 or head[:4] != _BGZF_MAGIC:
+            return False
+        extra = fh.read(struct.unpack("<H", head[10:12])[0])
+    return _bsize(extra) is not None
+
+
+def _bsize(extra: bytes) -> Optional[int]:
+    i = 0
+    while i + 4 <= len(extra):
+        slen = struct.unpack("<H", extra[i + 2:i + 4])[0]
+        if extra[i:i + 2] == b"BC" and slen == 2:
+            return struct.unpack("<H", extra[i + 4:i + 6])[0]
+        i += 4 + slen
+    return None
+
+
+def iter_bgzf_blocks(fh) -> Iterator[bytes]:
+    """Yield the body (deflate data, CRC32 and size) of each BGZF block of ``fh``."""
+    while True:
+        head = fh.read(12)
+        if not head:
+            return
+        if len(head) < 12 or head[:4] != _BGZF_MAGIC:
+            raise ValueError("Not a BGZF block")
+        xlen = struct.unpack("<H", head[10:12])[0]
+        extra = fh.read(xlen)
+        bsize = _bsize(extra)
+        if bsize is None:
+            raise ValueError("BGZF block without a BC subfield")
+        body = fh.read(bsize - xlen - 11)
+        yield body
+
+
+def _inflate(blocks) -> bytes:
+    out = []
+    for body in blocks:
+        data = zlib.decompress(body[:-8], -15)
+        crc, isize = struct.unpack("<II", body[-8:])
+        if len(data) != isize or zlib.crc32(data) != crc:
+            raise ValueError("Corrupt BGZF block")
+        out.append(data)
+    return b"".join(out)
+
+
+def decompress_bgzf(src, dest, threads: int = 4) -> None:
+    """Inflate the BGZF file ``src`` into ``dest`` with ``threads`` threads."""
+    with open(src, "rb") as fin, open(dest, "wb") as fout, ThreadPoolExecutor(threads) as pool:
+        pending = deque()
+        task = []
+        for body in iter_bgzf_blocks(fin):
+            task.append(body)
+            if len(task) == _BLOCKS_PER_TASK:
+                pending.append(pool.submit(_inflate, task))
+                task = []
+                # Bound memory to a few tasks per thread, written in order
+                while len(pending) > 2 * threads:
+                    fout.write(pending.popleft().result())
+        if task:
+            pending.append(pool.submit(_inflate, task))
+        while pending:
+            fout.write(pending.popleft().result())
+
+
+def decompress(src, dest, threads: int = 4) -> str:
+    """Decompress ``src`` into ``dest``; return the backend used."""
+    if is_bgzf(src):
+        decompress_bgzf(src, dest, threads)
+        return "bgzf"
+    for tool, args in (("pigz", ["-dc", "-p", str(threads)]), ("igzip", ["-dc"])):
+        if shutil.which(tool):
+            with open(dest, "wb") as out:
+                subprocess.run([tool, *args, str(src)], stdout=out, check=True)
+            return tool
+    # Concatenated gzip members are handled by wbits=47 plus restarting on unused data
+    with open(src, "rb") as fin, open(dest, "wb") as fout:
+        inflater = zlib.decompressobj(47)
+        while True:
+            chunk = fin.read(1 << 22)
+            if not chunk:
+                break
+            while chunk:
+                fout.write(inflater.decompress(chunk))
+                if inflater.eof:
+                    chunk = inflater.unused_data
+                    inflater = zlib.decompressobj(47)
+                else:
+                    chunk = b""
+        fout.write(inflater.flush())
+    return "zlib"
+
+
+def build_fai(fasta, fai=None) -> Path:
+    """Write a samtools-compatible ``.fai`` for ``fasta`` (uniform line widths required)."""
+    fai = Path(fai or f"{fasta}.fai")
+    entries = []
+    with open(fasta, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            fai.write_text("")
+            return fai
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            pos = 0
+            while pos < size:
+                if mm[pos] != ord(">"):
+                    raise ValueError(f"{fasta}: expected '>' at byte {pos}")
+                eol = mm.find(b"\n", pos)
+                eol = size if eol < 0 else eol
+                name = mm[pos + 1:eol].split()[0].decode()
+                seq_start = min(eol + 1, size)
+                nxt = mm.find(b"\n>", eol)
+                end = size if nxt < 0 else nxt + 1
+                first = mm.find(b"\n", seq_start, end)
+                first = end if first < 0 else first + 1
+                line_bytes = first - seq_start
+                line_bases = len(mm[seq_start:first].rstrip(b"\r\n"))
+                newline_bytes = 0
+                for chunk_start in range(seq_start, end, 1 << 26):
+                    chunk = mm[chunk_start:min(end, chunk_start + (1 << 26))]
+                    newline_bytes += chunk.count(b"\n") + chunk.count(b"\r")
+                length = end - seq_start - newline_bytes
+                if line_bases:
+                    # Bytes the sequence takes with uniform lines, with or without a final newline
+                    padded = length + -(-length // line_bases) * (line_bytes - line_bases)
+                    if end - seq_start not in (padded, padded - (line_bytes - line_bases)):
+                        raise ValueError(f"{fasta}: sequence {name} has lines of different lengths")
+                entries.append(f"{name}\t{length}\t{seq_start}\t{line_bases}\t{line_bytes}\n")
+                pos = end
+    with open(fai, "w") as out:
+        out.writelines(entries)
+    return fai
+
+
+def _plain_name(path: Path) -> str:
+    name = path.name
+    for suffix in (".gz", ".bgz"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+class InputCache:
+    """Per-run (or shared) directory of decompressed input copies.
+
+    Copies are keyed by the source's absolute path, size and modification
+    time, so a ``cache_dir`` shared between runs (e.g. module 1 and module 2
+    of the same assembly) decompresses each file once. Copies are written
+    under a temporary name and renamed into place.
+    """
+
+    def __init__(self, cache_dir, threads: int = 4) -> None:
+        self.dir = Path(cache_dir)
+        self.threads = max(1, threads)
+        self.created = []
+
+    def plain(self, path) -> str:
+        """Return a plain-text path for ``path``, decompressing it if needed."""
+        if path is None or "://" in str(path):
+            return path
+        src = Path(path)
+        if not src.is_file() or not is_gzip(src):
+            return str(path)
+        stat = src.stat()
+        key = hashlib.sha1(f"{src.resolve()}\0{stat.st_size}\0{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+        dest = self.dir / key / _plain_name(src)
+        if dest.exists():
+            print(f"[INFO] Using decompressed copy {dest}")
+            return str(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        partial = dest.with_name(f".{dest.name}.{os.getpid()}.partial")
+        backend = decompress(src, partial, self.threads)
+        if dest.suffix.lower() in _FASTA_SUFFIXES:
+            try:
+                os.replace(build_fai(partial, f"{partial}.fai"), f"{dest}.fai")
+            except ValueError as exc:
+                print(f"[INFO] No .fai index for {dest}: {exc}")
+        os.replace(partial, dest)
+        self.created.append(dest.parent)
+        print(f"[INFO] Decompressed {src} ({backend}) to {dest}")
+        return str(dest)
+
+    def remove(self) -> None:
+        """Delete the copies this cache made (used for per-run caches)."""
+        for path in self.created:
+            shutil.rmtree(path, ignore_errors=True)
+        self.created = []
+        try:
+            self.dir.rmdir()
+        except OSError:
+            pass
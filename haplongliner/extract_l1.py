@@ -1,5 +1,64 @@
-def extract_l1_from_bed(infile, outfile=None):
+import ast
+
+# Names a filter expression may refer to
+FILTER_FIELDS = ("subfamily", "length", "contig", "strand")
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div,
+    ast.Name, ast.Load, ast.Constant, ast.Tuple, ast.List, ast.Set, ast.Call, ast.Attribute,
+)
+_ALLOWED_METHODS = {"startswith", "endswith", "lower", "upper"}
+
+
+def compile_filter(expr):
+    """Compile a filter expression over BED records into a predicate.
+
+    The expression is a Python boolean expression over ``subfamily``,
+    ``length``, ``contig`` and ``strand``, e.g.
+    ``subfamily in ('L1HS', 'L1PA2', 'L1PA3') and length >= 6000`` or
+    ``subfamily.startswith('L1PA') and contig != 'chrY'``. It is checked
+    against a whitelist of syntax (comparisons, boolean and arithmetic
+    operators, literals and the string methods ``startswith``,
+    ``endswith``, ``lower`` and ``upper``) and compiled once; anything else
+    raises ``ValueError``. The predicate takes the fields as keywords.
+    """
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError as exc:
+        raise ValueError(f"Invalid filter expression {expr!r}: {exc.msg}") from None
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Unsupported syntax in filter expression: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in FILTER_FIELDS:
+            raise ValueError(
+                f"Unknown name '{node.id}' in filter expression (expected one of {', '.join(FILTER_FIELDS)})"
+            )
+        if isinstance(node, ast.Attribute) and node.attr not in _ALLOWED_METHODS:
+            raise ValueError(f"Unsupported method '{node.attr}' in filter expression")
+        if isinstance(node, ast.Call) and not isinstance(node.func, ast.Attribute):
+            raise ValueError("Only string methods may be called in filter expressions")
+    code = compile(tree, "<filter>", "eval")
+
+    def predicate(**fields):
+        return bool(eval(code, {"__builtins__": {}}, fields))
+
+    return predicate
+
+
+def extract_l1_from_bed(infile, outfile=None, min_length=5000, where=None):
+    """Write L1 records of at least ``min_length`` bp from a BED file.
+
+    ``where`` is an optional filter expression (see :func:`compile_filter`)
+    that further restricts which full-length L1s are kept. Returns counts
+    of ``total`` records read, those dropped as ``not_full_length`` (not L1
+    or shorter than ``min_length``) and as ``filtered`` by ``where``, and
+    the number ``kept``.
+    """
     import sys
+    keep = compile_filter(where) if where else None
+    counts = {"total": 0, "not_full_length": 0, "filtered": 0, "kept": 0}
     out = open(outfile, "w") if outfile else sys.stdout
     with open(infile) as f:
         for line in f:
@@ -8,18 +67,31 @@ def extract_l1_from_bed(infile, outfile=None):
             fields = line.strip().split()
             if len(fields) < 4:
                 continue
+            counts["total"] += 1
             name = fields[3]
             start = int(fields[1])
             end = int(fields[2])
-            if name.startswith("L1") and (end - start) >= 5000:
-                print(line, end="", file=out)
+            if not (name.startswith("L1") and (end - start) >= min_length):
+                counts["not_full_length"] += 1
+                continue
+            strand = fields[5] if len(fields) > 5 else "."
+            if keep and not keep(subfamily=name, length=end - start, contig=fields[0], strand=strand):
+                counts["filtered"] += 1
+                continue
+            counts["kept"] += 1
+            print(line, end="", file=out)
     if outfile:
         out.close()
+    return counts
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Extract full-length L1s (>=5000bp) from BED file.")
     parser.add_argument("infile", help="Input BED file")
     parser.add_argument("-o", "--outfile", help="Output file (default: stdout)")
+    parser.add_argument("-w", "--where", help="Filter expression over subfamily, length, contig and strand")
     args = parser.parse_args()
-    extract_l1_from_bed(args.infile, args.outfile)
\ No newline at end of file
+    try:
+        extract_l1_from_bed(args.infile, args.outfile, where=args.where)
+    except ValueError as exc:
+        parser.error(str(exc))
@@ -1,4 +1,4 @@
-import re
+from .orf_reducer import OrfReducer
 
 
 def find_longest_orf(blastp_file, out_file):
@@ -6,31 +6,15 @@ def find_longest_orf(blastp_file, out_file):
 
     Mirrors the behaviour of ``FindLongestORF.pl``. ``blastp_file`` should be
     generated with ``-outfmt '6 std qlen slen sacc'`` against the ORF1/2
-    reference database.
+    reference database. The rows are folded through :class:`OrfReducer`, so
+    only the best hit per L1 and subject is held in memory.
     """
 
-    len_dict = {}
-    info = {}
-    index = set()
     with open(blastp_file) as fh:
-        for line in fh:
-            if not line.strip():
-                continue
-            F = line.strip().split()
-            name = re.sub(r"_[0-9]+$", "", F[0])
-            subject = F[1]
-            aln_len = int(F[3])
-            if aln_len >= len_dict.get(name, {}).get(subject, 0):
-                len_dict.setdefault(name, {})[subject] = aln_len
-                info.setdefault(name, {})[subject] = line.strip()
-            index.add(name)
+        reducer = OrfReducer().consume(fh)
 
     with open(out_file, "w") as out:
-        for key in index:
-            if "L1rpORF1p" in info.get(key, {}) and "L1rpORF2p" in info.get(key, {}):
-                out.write(
-                    f"{info[key]['L1rpORF1p']}\t{info[key]['L1rpORF2p']}\n"
-                )
+        out.writelines(reducer.longest_lines())
 
 
 if __name__ == "__main__":
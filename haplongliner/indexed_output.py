@@ -0,0 +1,78 @@
+"""Coordinate-sorted, bgzip-compressed and indexed output artifacts.
+
+BED/TSV tables are sorted by contig and start, compressed with ``bgzip`` and
+indexed with ``tabix``; FASTA files are bgzipped with a ``.gzi`` block index
+and a ``.fai`` index so region and locus lookups only read the blocks they
+need (e.g. ``tabix out.bed.gz chr1:1-100000`` or ``samtools faidx``).
+"""
+
+import subprocess
+from typing import Iterable, List, Sequence, Tuple
+
+from .utils import iter_fasta, require_tools
+
+
+def _sort_key(row: Sequence[str]) -> Tuple[str, int, int]:
+    return row[0], int(row[1]), int(row[2])
+
+
+def write_indexed_bed(rows: Iterable[Sequence[str]], out_gz, header: str = None) -> None:
+    """Write ``rows`` (chrom, start, end, ...) as a sorted, tabix-indexed BED.gz."""
+    require_tools("bgzip", "tabix")
+    lines: List[str] = []
+    if header:
+        lines.append(f"#{header}\n")
+    lines.extend("\t".join(map(str, row)) + "\n" for row in sorted(rows, key=_sort_key))
+    with open(out_gz, "wb") as out:
+        subprocess.run(["bgzip", "-c"], input="".join(lines).encode(), stdout=out, check=True)
+    subprocess.run(["tabix", "-f", "-p", "bed", str(out_gz)], check=True)
+
+
+def write_indexed_fasta(fasta, out_gz) -> None:
+    """Bgzip ``fasta`` to ``out_gz`` with ``.gzi`` and ``.fai`` indexes.
+
+    Sequences are written on a single line each; ``.fai`` offsets refer to
+    the uncompressed stream as htslib expects.
+    """
+    require_tools("bgzip")
+    fai = []
+    offset = 0
+    chunks = []
+    for header, seq in iter_fasta(fasta):
+        name = header.split()[0]
+        head = f">{header}\n"
+        offset += len(head.encode())
+        fai.append(f"{name}\t{len(seq)}\t{offset}\t{len(seq)}\t{len(seq) + 1}\n")
+        chunks.append(head + seq + "\n")
+        offset += len(seq) + 1
+    with open(out_gz, "wb") as out:
+        subprocess.run(
+            ["bgzip", "-c", "-i", "-I", f"{out_gz}.gzi"],
+            input="".join(chunks).encode(),
+            stdout=out,
+            check=True,
+        )
+    with open(f"{out_gz}.fai", "w") as fh:
+        fh.writelines(fai)
+
+
+def module1_rows(table) -> Iterable[List[str]]:
+    """Split a ``HapLongLINErRM.txt`` table into BED columns.
+
+    Output columns: chrom, start, end, name, length, strand, status,
+    ref_chrom, ref_start, ref_end, ref_strand.
+    """
+    with open(table) as fh:
+        for line in fh:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            chrom, start, end, strand, length, name, status = fields[0].rsplit("_", 6)
+            ref = fields[1].rsplit("_", 3)
+            yield [chrom, start, end, name, length, strand, status, *ref]
+
+
+MODULE1_HEADER = "\t".join(
+    ["chrom", "start", "end", "name", "length", "strand", "status",
+     "ref_chrom", "ref_start", "ref_end", "ref_strand"]
+)
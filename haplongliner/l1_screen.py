@@ -0,0 +1,87 @@
+"""In-process k-mer screen for young full-length L1 sequences.
+
+Used by module 2 to examine the ALT alleles of insertion calls without a
+second pass over the assembly: an inserted sequence is classified as a young
+full-length L1 when most of its k-mers occur in the L1rp reference (query
+containment) and it covers most of L1rp (reference coverage), on either
+strand. Only the hits go on to ORF intactness checking.
+"""
+
+import gzip
+from typing import Iterator, Optional, Tuple
+
+from .bundle import fasta_records
+
+_COMPLEMENT = str.maketrans("ACGTN", "TGCAN")
+
+
+def revcomp(seq: str) -> str:
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+class KmerScreen:
+    """K-mer containment classifier against a single reference L1.
+
+    ``containment`` is the fraction of query k-mers found in the reference;
+    ``coverage`` is the fraction of ``bin_size`` windows along the reference
+    hit by at least one query k-mer, which separates full-length copies from
+    5'-truncated or partial ones independently of divergence.
+    """
+
+    def __init__(self, reference="data/L1rp.fa", k: int = 15, bin_size: int = 200,
+                 min_containment: float = 0.4, min_coverage: float = 0.9) -> None:
+        self.k = k
+        self.min_containment = min_containment
+        self.min_coverage = min_coverage
+        ref = next(fasta_records(reference))[1].upper()
+        self.bins = {}
+        for i in range(len(ref) - k + 1):
+            self.bins.setdefault(ref[i:i + k], i // bin_size)
+        self.n_bins = (len(ref) - k) // bin_size + 1
+
+    def score(self, seq: str) -> Tuple[float, float, str]:
+        """Return ``(containment, coverage, strand)`` for the better strand."""
+        seq = seq.upper()
+        k = self.k
+        best = (0.0, 0.0, "+")
+        for strand, s in (("+", seq), ("-", revcomp(seq))):
+            query = {s[i:i + k] for i in range(len(s) - k + 1)}
+            if not query:
+                continue
+            hit_bins = [self.bins[kmer] for kmer in query if kmer in self.bins]
+            result = (len(hit_bins) / len(query), len(set(hit_bins)) / self.n_bins, strand)
+            if result[:2] > best[:2]:
+                best = result
+        return best
+
+    def classify(self, seq: str) -> Optional[Tuple[float, float, str]]:
+        """Return :meth:`score` if ``seq`` looks like a young full-length L1."""
+        containment, coverage, strand = self.score(seq)
+        if containment >= self.min_containment and coverage >= self.min_coverage:
+            return containment, coverage, strand
+        return None
+
+
+def iter_insertion_alts(vcf, min_len: int = 5000, max_len: int = 7000) -> Iterator[Tuple[str, int, str, str]]:
+    """Stream ``(chrom, pos, id, inserted_sequence)`` for sequence-resolved INS.
+
+    ``pos`` is 0-based. Only insertions whose inserted sequence length lies
+    within ``min_len``-``max_len`` are yielded; symbolic ALT alleles such as
+    ``<INS>`` carry no sequence and are skipped.
+    """
+    opener = gzip.open if str(vcf).endswith(".gz") else open
+    with opener(vcf, "rt") as fh:
+        for line in fh:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.rstrip("\n").split("\t", 8)
+            if len(fields) < 8 or "SVTYPE=INS" not in fields[7]:
+                continue
+            chrom, pos, var_id, ref, alts = fields[:5]
+            for alt in alts.split(","):
+                if alt.startswith("<") or not alt.isalpha():
+                    continue
+                # Drop the VCF padding base(s) shared with REF
+                inserted = alt[len(ref):] if alt[:len(ref)].upper() == ref.upper() else alt
+                if min_len <= len(inserted) <= max_len:
+                    yield chrom, int(pos) - 1, var_id, inserted
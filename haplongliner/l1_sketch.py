@@ -0,0 +1,223 @@
+"""MinHash sketches and LSH clustering of full-length L1 sequences.
+
+Each sequence is reduced to a fixed-size MinHash signature over its
+canonical k-mers, computed in one pass with one-permutation hashing: the
+64-bit k-mer hashes are split into ``size`` bins by their high bits and the
+minimum of each bin is kept (empty bins borrow from the next filled bin).
+The fraction of equal signature positions estimates the k-mer Jaccard
+similarity of two sequences.
+
+Clustering is greedy and centroid based, as in CD-HIT: sequences are taken
+longest first, and each is compared only against the cluster
+representatives that share at least one LSH band with it. Band and row
+counts are chosen so that pairs at the requested identity collide with high
+probability. Candidates are checked with a bounded edlib alignment (in
+either orientation) in order of estimated similarity; a sequence that
+matches none of them starts a new cluster. The number of alignments thus
+grows with the number of clusters a sequence could belong to rather than
+with the number of sequences.
+"""
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .utils import iter_fasta
+
+_MASK64 = (1 << 64) - 1
+_CODE = {"A": 0, "C": 1, "G": 2, "T": 3, "a": 0, "c": 1, "g": 2, "t": 3}
+_EMPTY = _MASK64
+
+
+def _mix(x: int) -> int:
+    """splitmix64 finalizer; spreads 2-bit encoded k-mers over 64 bits."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def sketch(seq: str, k: int = 15, size: int = 128) -> array:
+    """Return the one-permutation MinHash signature of ``seq`` (``size`` values)."""
+    if size & (size - 1):
+        raise ValueError("Sketch size must be a power of two")
+    shift = 64 - size.bit_length() + 1
+    mask = (1 << 2 * k) - 1
+    top = 2 * (k - 1)
+    bins = [_EMPTY] * size
+    fwd = rev = filled = 0
+    for base in seq:
+        code = _CODE.get(base)
+        if code is None:
+            filled = 0
+            continue
+        fwd = ((fwd << 2) | code) & mask
+        rev = (rev >> 2) | ((3 - code) << top)
+        filled += 1
+        if filled >= k:
+            h = _mix(fwd if fwd < rev else rev)
+            b = h >> shift
+            if h < bins[b]:
+                bins[b] = h
+    # Densify: an empty bin takes the next filled bin's value, salted with the distance
+    if _EMPTY in bins and any(v != _EMPTY for v in bins):
+        for i in range(size):
+            if bins[i] == _EMPTY:
+                j = 1
+                while bins[(i + j) % size] == _EMPTY:
+                    j += 1
+                bins[i] = _mix(bins[(i + j) % size] ^ j)
+    return array("Q", bins)
+
+
+def similarity(a: array, b: array) -> float:
+    """Estimated k-mer Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def jaccard_for_identity(identity: float, k: int) -> float:
+    """Expected k-mer Jaccard of two sequences at ``identity`` (uniform substitutions)."""
+    shared = identity ** k
+    return shared / (2 - shared)
+
+
+def identity_for_jaccard(jaccard: float, k: int) -> float:
+    """Inverse of :func:`jaccard_for_identity`."""
+    return (2 * jaccard / (1 + jaccard)) ** (1 / k)
+
+
+def choose_bands(size: int, jaccard: float) -> Tuple[int, int]:
+    """Return ``(bands, rows)`` whose LSH threshold lies safely below ``jaccard``.
+
+    The S-curve threshold ``(1/bands) ** (1/rows)`` is placed at most at
+    ``0.7 * jaccard`` so that true pairs collide with high probability.
+    """
+    target = 0.7 * jaccard
+    best = (size, 1)
+    best_threshold = 0.0
+    for rows in range(1, size + 1):
+        bands = size // rows
+        threshold = (1 / bands) ** (1 / rows)
+        if best_threshold < threshold <= target:
+            best, best_threshold = (bands, rows), threshold
+    return best
+
+
+def _revcomp(seq: str) -> str:
+    return seq.translate(str.maketrans("ACGTacgtNn", "TGCAtgcaNn"))[::-1]
+
+
+def aligned_identity(a: str, b: str, min_identity: float) -> Tuple[float, str]:
+    """Return ``(identity, orientation)`` of ``b`` against ``a`` (global alignment).
+
+    The alignment is bounded to the edit distance allowed by
+    ``min_identity``; ``(0.0, "")`` means neither orientation reached it.
+    """
+    import edlib
+
+    longest = max(len(a), len(b))
+    limit = int((1 - min_identity) * longest)
+    best = (0.0, "")
+    for orient, query in (("+", b), ("-", _revcomp(b))):
+        dist = edlib.align(query, a, mode="NW", task="distance", k=limit)["editDistance"]
+        if dist >= 0:
+            identity = 1 - dist / longest
+            if identity > best[0]:
+                best = (identity, orient)
+                limit = dist
+    return best
+
+
+def _sketch_one(args):
+    name, seq, k, size = args
+    return name, sketch(seq, k, size)
+
+
+def sketch_all(records: Iterable[Tuple[str, str]], k: int = 15, size: int = 128,
+               threads: int = 1) -> Iterator[Tuple[str, array]]:
+    """Yield ``(name, signature)`` for each record, optionally in parallel."""
+    items = ((name, seq, k, size) for name, seq in records)
+    if threads > 1:
+        with ProcessPoolExecutor(threads) as pool:
+            yield from pool.map(_sketch_one, items, chunksize=64)
+    else:
+        yield from map(_sketch_one, items)
+
+
+def read_sequences(fastas: List[str]) -> Dict[str, str]:
+    """Load the sequences of ``fastas``; names are prefixed by the file stem when several files are given."""
+    sequences = {}
+    for path in fastas:
+        prefix = f"{Path(path).name.split('.')[0]}:" if len(fastas) > 1 else ""
+        for header, seq in iter_fasta(path):
+            sequences[prefix + header.split()[0]] = seq
+    return sequences
+
+
+def cluster_sequences(sequences: Dict[str, str], identity: float = 0.98, k: int = 15,
+                      size: int = 128, threads: int = 1, align: bool = True) -> List[Tuple[str, int, str, float, str]]:
+    """Greedily cluster ``sequences`` at ``identity``.
+
+    Returns ``(name, cluster, representative, identity, orientation)`` rows
+    in input order. Without ``align`` membership is decided on the
+    sketch-estimated identity alone.
+    """
+    target = jaccard_for_identity(identity, k)
+    bands, rows = choose_bands(size, target)
+    signatures = dict(sketch_all(sequences.items(), k, size, threads))
+    order = sorted(sequences, key=lambda name: -len(sequences[name]))
+
+    buckets: Dict[Tuple[int, bytes], List[str]] = {}
+    clusters: Dict[str, Tuple[int, str, float, str]] = {}
+    representatives: List[str] = []
+    for name in order:
+        sig = signatures[name]
+        keys = [(band, sig[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+        candidates = {rep for key in keys for rep in buckets.get(key, ())}
+        scored = sorted(
+            ((similarity(sig, signatures[rep]), rep) for rep in candidates),
+            reverse=True,
+        )
+        member = None
+        seq = sequences[name]
+        for estimate, rep in scored:
+            if estimate < 0.5 * target:
+                break
+            rep_len = len(sequences[rep])
+            if min(len(seq), rep_len) < identity * max(len(seq), rep_len):
+                continue
+            if align:
+                found, orient = aligned_identity(sequences[rep], seq, identity)
+            else:
+                found, orient = identity_for_jaccard(estimate, k), "."
+            if found >= identity:
+                member = (clusters[rep][0], rep, round(found, 4), orient)
+                break
+        if member is None:
+            representatives.append(name)
+            member = (len(representatives), name, 1.0, "+")
+            for key in keys:
+                buckets.setdefault(key, []).append(name)
+        clusters[name] = member
+    return [(name, *clusters[name]) for name in sequences]
+
+
+def write_clusters(rows, out) -> None:
+    with open(out, "w") as fh:
+        fh.write("name\tcluster\trepresentative\tidentity\torientation\n")
+        for row in rows:
+            fh.write("\t".join(map(str, row)) + "\n")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cluster full-length L1 sequences with MinHash LSH")
+    parser.add_argument("fasta", nargs="+", help="L1 FASTA files (e.g. module 1 FL.fa)")
+    parser.add_argument("-o", "--out", required=True, help="Output cluster table")
+    parser.add_argument("--identity", type=float, default=0.98, help="Clustering identity (default: 0.98)")
+    parser.add_argument("-k", type=int, default=15, help="k-mer size (default: 15)")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="Sketching processes (default: 1)")
+    args = parser.parse_args()
+    write_clusters(cluster_sequences(read_sequences(args.fasta), args.identity, args.k, threads=args.threads), args.out)
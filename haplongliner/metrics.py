@@ -0,0 +1,152 @@
+"""Per-stage resource metrics of module runs.
+
+:class:`StageMetrics` works like a lap timer next to :class:`RunLog`: each
+call to :meth:`StageMetrics.lap` closes a stage and records its wall time,
+peak memory, the size of the files the run has written to its output
+directory, and the size of the input that drives the stage's cost (e.g.
+assembly length or number of L1s). Stages are written to ``METRICS.tsv``
+(or another per-run file) and, when a history database is given, appended
+to it so the planner (:mod:`haplongliner.planner`) can scale later
+estimates from real runs. Memory figures are process-wide, so runs sharing
+a process (``batch --jobs`` > 1) must not record a history.
+"""
+
+import os
+import resource
+import socket
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_HEADER = "stage\tdriver\tdriver_value\tseconds\tpeak_rss_mb\tdisk_mb\n"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_metrics (
+    module TEXT,
+    stage TEXT,
+    driver TEXT,
+    driver_value REAL,
+    seconds REAL,
+    peak_rss_mb REAL,
+    disk_mb REAL,
+    host TEXT,
+    recorded REAL
+);
+CREATE INDEX IF NOT EXISTS stage_metrics_stage ON stage_metrics (module, stage);
+"""
+
+
+def _peak_rss_mb() -> float:
+    """Largest resident size of this process or any finished child, in MB."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def dir_size_mb(path, since: Optional[float] = None) -> float:
+    """Size of the files under ``path``, only those modified at or after ``since`` if given."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if since is None or st.st_mtime >= since:
+                total += st.st_size
+    return total / (1 << 20)
+
+
+class StageMetrics:
+    """Record wall time, memory and disk use of consecutive pipeline stages.
+
+    Disk use counts the files under ``outdir`` written since the run began,
+    so earlier outputs sharing the directory are left out. The stages are
+    written to ``path`` (default ``outdir/METRICS.tsv``).
+    """
+
+    def __init__(self, module: str, outdir, history=None, path=None) -> None:
+        self.module = module
+        self.outdir = Path(outdir)
+        self.path = Path(path) if path else self.outdir / "METRICS.tsv"
+        self.history = history
+        self.rows: List[Tuple[str, str, float, float, float, float]] = []
+        # Whole seconds, as some filesystems keep coarse modification times
+        self._since = int(time.time())
+        with open(self.path, "w") as fh:
+            fh.write(_HEADER)
+        self._start = time.monotonic()
+        self._peak = _peak_rss_mb()
+
+    def lap(self, stage: str, driver: str, value: float) -> None:
+        """Close ``stage``, whose cost scales with ``value`` units of ``driver``.
+
+        Peak memory is only attributable to a stage when it raised the
+        process-wide maximum; otherwise the current resident size is used.
+        """
+        now = time.monotonic()
+        peak = _peak_rss_mb()
+        stage_peak = peak if peak > self._peak else _current_rss_mb()
+        row = (stage, driver, float(value), now - self._start, stage_peak, dir_size_mb(self.outdir, self._since))
+        self.rows.append(row)
+        with open(self.path, "a") as fh:
+            fh.write(f"{stage}\t{driver}\t{value:g}\t{row[3]:.2f}\t{stage_peak:.1f}\t{row[5]:.1f}\n")
+        self._start = time.monotonic()
+        self._peak = peak
+
+    def restart(self) -> None:
+        """Start timing the next stage now (e.g. after time spent outside the pipeline)."""
+        self._start = time.monotonic()
+
+    def save(self) -> None:
+        """Append the recorded stages to the history database, if any."""
+        if not self.history or not self.rows:
+            return
+        conn = sqlite3.connect(str(self.history), timeout=60)
+        try:
+            conn.executescript(_SCHEMA)
+            host = socket.gethostname()
+            recorded = time.time()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO stage_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(self.module, *row, host, recorded) for row in self.rows],
+                )
+        finally:
+            conn.close()
+
+
+def load_history(history, module: str) -> Dict[str, List[Tuple[float, float, float, float]]]:
+    """Return ``stage -> [(driver_value, seconds, peak_rss_mb, disk_mb)]`` for ``module``."""
+    if not history or not Path(history).exists():
+        return {}
+    conn = sqlite3.connect(f"file:{history}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT stage, driver_value, seconds, peak_rss_mb, disk_mb FROM stage_metrics WHERE module = ?",
+            (module,),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    stages: Dict[str, List[Tuple[float, float, float, float]]] = {}
+    for stage, *values in rows:
+        stages.setdefault(stage, []).append(tuple(values))
+    return stages
+
+
+def history_path(history: Optional[str] = None) -> Optional[str]:
+    """Return ``history``, or ``HAPLONGLINER_METRICS`` when it is ``None``; ``""`` records none."""
+    if history is None:
+        return os.getenv("HAPLONGLINER_METRICS")
+    return history or None
@@ -5,34 +5,52 @@ import re
 import urllib.request
 import shutil
 import os
+import tempfile
 
-from .process_orf import process_orf_fasta
-from .find_longest_orf import find_longest_orf
-from .find_intact_orf import find_intact_orf
-from .combine_table import combine_table
-from .utils import verify_blast_db
+from .orf_reducer import OrfReducer
+from .combine_table import _read_minimap, combine_rows
+from .cache import FlankMemo, OrfCache
+from .indexed_output import MODULE1_HEADER, module1_rows, write_indexed_bed, write_indexed_fasta
+from .extract_l1 import compile_filter, extract_l1_from_bed
+from .records import L1Record, OrfHit
+from .run_log import RunLog
+from .decompress import InputCache
+from .metrics import StageMetrics, history_path
+from .planner import fasta_bases
+from .regions import FastaIndex, Regions, merge_table, module1_coords, tabix_subset
+from .seqstore import SharedGenome
+from .orf_detect import ORF_DB, detect_orfs
+from .utils import iter_fasta
 
-def parse_repeatmasker(input_path, output_path, log_path=None):
+
+def parse_repeatmasker(input_path, output_path, log_path=None, regions=None):
     """
     Parse RepeatMasker BED, BED.gz, .out, or .out.gz file and write a unified
     BED-like file using 0-based half-open coordinates::
 
         chrom  start  end  name  length  strand
 
-    ``log_path`` optionally records skipped malformed lines.
+    ``log_path`` optionally records skipped malformed lines. With
+    :class:`~haplongliner.regions.Regions`, only records overlapping them
+    are written. Returns the numbers of records written and of lines skipped.
     """
     # Open plain or gzipped file
     opener = gzip.open if str(input_path).endswith(".gz") else open
     skipped = []
+    written = 0
     with opener(input_path, "rt") as fin, open(output_path, "w") as fout:
         lines = fin.readlines()
         # Detect .out header (skip first 4 lines if header detected)
         if any("SW" in l and "perc" in l for l in lines[:4]):
             lines = lines[4:]
 
+        contigs = regions.contigs if regions is not None else None
         for line in lines:
             if not line.strip() or line.startswith(("#", "track", "browser")):
                 continue
+            # Cheap substring test before splitting lines of other contigs
+            if contigs is not None and not any(c in line for c in contigs):
+                continue
             fields = re.split(r"\s+", line.strip())
 
             is_out = (
@@ -64,15 +82,19 @@ def parse_repeatmasker(input_path, output_path, log_path=None):
                 skipped.append(line.rstrip())
                 continue
 
+            if regions is not None and not regions.overlaps(chrom, start, end):
+                continue
             length = end - start
             fout.write(
                 f"{chrom}\t{start}\t{end}\t{name}\t{length}\t{strand}\n"
             )
+            written += 1
 
     if log_path and skipped:
         with open(log_path, "w") as logf:
             logf.write("\n".join(skipped) + "\n")
     print(f"Skipped {len(skipped)} malformed lines")
+    return written, len(skipped)
 
 def download_if_needed(url, local_path):
     """
@@ -89,22 +111,236 @@ def download_if_needed(url, local_path):
     print(f"[INFO] Download complete: {local_path}")
     return str(local_path)
 
-def run_module1(
+def _map_flanks(reference_fasta, flank_fa, out_paf, memo=None, preset="asm5", unique=False):
+    """Map ``flank_fa`` to the reference with minimap2, writing ``out_paf``.
+
+    With a :class:`FlankMemo`, flanks whose sequence was already lifted over
+    to the same reference with the same preset are answered from the memo and
+    only the unseen flanks are sent to the aligner. The memo keeps the hit
+    ``combine_table`` selects, or with ``unique`` the one :func:`_unique_hits`
+    selects (under separate keys), so memo hits leave that selection unchanged.
+    """
+    if memo is None:
+        subprocess.run(
+            f"minimap2 -x {preset} {reference_fasta} {flank_fa} > {out_paf}",
+            shell=True,
+            check=True,
+        )
+        return
+    ref_checksum = memo.reference_checksum(reference_fasta)
+    select = _unique_lines if unique else _read_minimap
+    selection = f"{preset}:unique" if unique else preset
+    keys = {
+        header.split()[0]: memo.key(header.split()[0], seq, ref_checksum, selection)
+        for header, seq in iter_fasta(flank_fa)
+    }
+    cached = memo.get_many(keys.values())
+    miss_fa = Path(str(out_paf) + ".miss.fa")
+    misses = []
+    with open(out_paf, "w") as out, open(miss_fa, "w") as fout:
+        for header, seq in iter_fasta(flank_fa):
+            name = header.split()[0]
+            if keys[name] in cached:
+                if cached[keys[name]] is not None:
+                    out.write(name + cached[keys[name]] + "\n")
+            else:
+                misses.append(name)
+                fout.write(f">{header}\n{seq}\n")
+    print(f"[INFO] Liftover memo for {Path(flank_fa).name}: {len(keys) - len(misses)} hits, {len(misses)} misses")
+    if misses:
+        paf = subprocess.run(
+            ["minimap2", "-x", preset, str(reference_fasta), str(miss_fa)],
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
+        ).stdout
+        with open(out_paf, "a") as out:
+            out.write(paf)
+        best = select(paf.splitlines())
+        memo.put_many(
+            (keys[name], best[name][len(name):] if name in best else None)
+            for name in misses
+        )
+    os.remove(miss_fa)
+
+# Flank length and distance from the L1 boundary tried, in order, for loci
+# whose 2 kb flanks did not give a concordant placement
+RESCUE_SCHEDULE = ((4000, 0), (2000, 2000), (8000, 0), (8000, 4000))
+
+
+def _unique_hits(paf_lines, min_mapq=5, min_aln=200):
+    """Return ``query -> PAF fields`` for flanks with one confident placement.
+
+    The longest primary alignment of each query is kept if it spans at
+    least ``min_aln`` query bases with mapping quality ``min_mapq`` or more
+    (minimap2 gives repeats and segmental duplications low MAPQ).
+    """
+    best = {}
+    for line in paf_lines:
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) < 12 or "tp:A:S" in fields[12:]:
+            continue
+        span = int(fields[3]) - int(fields[2])
+        if span >= min_aln and (fields[0] not in best or span > best[fields[0]][0]):
+            best[fields[0]] = (span, fields)
+    return {name: fields for name, (_, fields) in best.items() if int(fields[11]) >= min_mapq}
+
+
+def _unique_lines(paf_lines):
+    """:func:`_unique_hits` as ``query -> PAF line``, the form :class:`FlankMemo` stores."""
+    return {name: "\t".join(fields) for name, fields in _unique_hits(paf_lines).items()}
+
+
+def _placement(up, down, strand, length, offset):
+    """Return ``(chrom, start, end, strand)`` for concordant flank hits, else None."""
+    if up[5] != down[5] or up[4] != down[4]:
+        return None
+    if up[4] == "+":
+        start_ref, end_ref = int(up[8]), int(down[7])
+    else:
+        start_ref, end_ref = int(down[8]), int(up[7])
+    # The flanks must face each other with at most the L1 (if the reference
+    # carries it) and the offsets between them
+    gap = end_ref - start_ref
+    if not -1000 <= gap <= length + 2 * offset + 1000:
+        return None
+    if gap >= 2 * offset:
+        # The reference carries the skipped sequence; move to the L1 boundaries
+        start_ref, end_ref = start_ref + offset, end_ref - offset
+    if end_ref < start_ref:
+        start_ref, end_ref = end_ref, start_ref
+    out_strand = "+" if up[4] == strand else "-"
+    return up[5], start_ref, end_ref, out_strand
+
+
+def _subseq(input_fasta, bed, out_fa, index=None):
+    """Write the upper-cased sequences of ``bed`` intervals, via ``index`` when given."""
+    if index is not None:
+        index.write_bed(bed, out_fa)
+    else:
+        subprocess.run(f"seqtk subseq {input_fasta} {bed} | seqtk seq -U -l 0 - > {out_fa}", shell=True, check=True)
+
+
+def _rescue_liftover(loci, input_fasta, reference_fasta, workdir, memo=None,
+                     schedule=RESCUE_SCHEDULE, index=None):
+    """Retry the liftover of unresolved loci with longer or offset flanks.
+
+    ``loci`` are ``(chrom, start, end, strand)`` of L1s whose 2 kb flanks
+    failed. For each ``(flank, offset)`` step of ``schedule`` only the loci
+    still unresolved are re-extracted and mapped, and a locus stops at the
+    first step where both flanks place uniquely and concordantly. Returns
+    ``(chrom, start, end) -> (ref_chrom, ref_start, ref_end, ref_strand)``.
+    Flanks are read through ``index`` (a
+    :class:`~haplongliner.regions.SequenceSource`), or through the
+    assembly's ``.fai`` when it is ``None``.
+    """
+    pending = {(chrom, int(start), int(end)): strand for chrom, start, end, strand in loci}
+    rescued = {}
+    own_index = index is None
+    if own_index:
+        index = FastaIndex(input_fasta, workdir)
+    try:
+        for step, (flank, offset) in enumerate(schedule, 1):
+            if not pending:
+                break
+            bed = Path(workdir) / f"rescue{step}.bed"
+            fa = Path(workdir) / f"rescue{step}.fa"
+            paf = Path(workdir) / f"rescue{step}.paf"
+            sides = {}
+            with open(bed, "w") as out:
+                for chrom, start, end in pending:
+                    if chrom not in index:
+                        continue
+                    # Clamp to the contig so the flank names below are the
+                    # coordinates the extracted records are named after
+                    size = index.length(chrom)
+                    up = (chrom, max(0, start - offset - flank), max(0, start - offset))
+                    down = (chrom, min(size, end + offset), min(size, end + offset + flank))
+                    for side, (c, s, e) in (("up", up), ("down", down)):
+                        if e > s:
+                            out.write(f"{c}\t{s}\t{e}\n")
+                            sides[f"{c}:{s + 1}-{e}"] = ((chrom, start, end), side)
+            index.write_bed(bed, fa)
+            _map_flanks(reference_fasta, fa, paf, memo, unique=True)
+            with open(paf) as fh:
+                hits = _unique_hits(fh)
+            placed = {}
+            for name, fields in hits.items():
+                if name in sides:
+                    locus, side = sides[name]
+                    placed.setdefault(locus, {})[side] = fields
+            for locus, flanks in placed.items():
+                if "up" not in flanks or "down" not in flanks:
+                    continue
+                chrom, start, end = locus
+                result = _placement(flanks["up"], flanks["down"], pending[locus], end - start, offset)
+                if result is not None:
+                    rescued[locus] = result
+                    del pending[locus]
+            print(f"[INFO] Flank rescue step {step} ({flank} bp, offset {offset}): {len(rescued)} rescued, {len(pending)} unresolved")
+            for tmp in (bed, fa, paf):
+                tmp.unlink()
+    finally:
+        if own_index:
+            index.close()
+    return rescued
+
+
+def _orf_query_name(chrom, start, end, strand):
+    """Return the sanitized FASTA header used for an L1 in the ORF search."""
+    chrom = chrom.replace(":", "_").replace("-", "_")
+    return f"{chrom}_{int(start) + 1}_{end}_{strand}"
+
+
+def iter_module1(
     input_fasta,
     repeatmasker_file,
     reference_fasta,
-    output_dir="module1_output",
+    output_dir=None,
     log_skipped=None,
+    orf_cache=None,
+    orf_cache_size=100000,
+    liftover_memo=None,
+    aligner="blastp",
+    threads=1,
+    l1_filter=None,
+    rescue_flanks=False,
+    keep_fasta=False,
+    decompress_cache=None,
+    metrics=None,
+    regions=None,
+    keep_orf_tables=None,
 ):
     """
-    RepeatMasker-based L1 discovery pipeline.
-    Downloads remote reference if needed.
-    Handles RepeatMasker BED, BED.gz, .out, or .out.gz input.
-    ``log_skipped`` specifies a file to log malformed RepeatMasker lines. If not
-    provided, the ``HAPLOGLINER_LOG_SKIPPED`` environment variable is checked.
+    RepeatMasker-based L1 discovery pipeline, streaming :class:`L1Record`.
+
+    Yields one record per full-length L1 with its assembly coordinates,
+    reference liftover, best ORF1p/ORF2p hits, intactness status and
+    sequence. Intermediate files go to ``output_dir``, or to a temporary
+    directory that is removed afterwards when it is ``None``; no result
+    table is written (see :func:`run_module1`). ``keep_fasta`` keeps
+    ``FL.fa`` in ``output_dir``. ORF hits go from the reducer straight into
+    the result rows; ``keep_orf_tables`` (or ``HAPLONGLINER_KEEP_ORF_TABLES``)
+    also writes them to ``FLAllORF.combine.blastp`` and
+    ``FLAllORF.intact.blastp`` for debugging. ``regions`` (a
+    :class:`~haplongliner.regions.Regions` or its spec) restricts the run to
+    the full-length L1s overlapping those assembly windows. Other arguments
+    are as for :func:`run_module1`.
     """
+    tmpdir = None
+    if output_dir is None:
+        tmpdir = tempfile.TemporaryDirectory(prefix="haplongliner_")
+        output_dir = tmpdir.name
     if log_skipped is None:
         log_skipped = os.getenv("HAPLOGLINER_LOG_SKIPPED")
+    if orf_cache is None:
+        orf_cache = os.getenv("HAPLONGLINER_ORF_CACHE")
+    if liftover_memo is None:
+        liftover_memo = os.getenv("HAPLONGLINER_LIFTOVER_MEMO")
+    if keep_orf_tables is None:
+        keep_orf_tables = bool(os.getenv("HAPLONGLINER_KEEP_ORF_TABLES"))
+    if decompress_cache is None:
+        decompress_cache = os.getenv("HAPLONGLINER_DECOMPRESS_CACHE")
     outdir = Path(output_dir)
     outdir.mkdir(parents=True, exist_ok=True)
 
@@ -115,46 +351,85 @@ def run_module1(
         ref_local = data_dir / Path(reference_fasta).name
         reference_fasta = download_if_needed(reference_fasta, ref_local)
 
+    if isinstance(regions, str):
+        regions = Regions.parse(regions)
+    # A tabix-indexed annotation only needs the records inside the windows
+    regions_rm = outdir / "regions.rm.bed"
+    if regions is not None and tabix_subset(repeatmasker_file, regions, regions_rm):
+        repeatmasker_file = str(regions_rm)
+
+    # An assembly loaded with ``haplongliner seqstore load`` is read from
+    # shared memory instead of being scanned by seqtk
+    index = SharedGenome.find(input_fasta)
+    if index is not None:
+        print(f"[INFO] Reading {input_fasta} from shared sequence store {index.name}")
+    # Decompress a gzipped assembly and annotation once; every later stage
+    # (RepeatMasker parsing, each seqtk call) reads the plain copies
+    inputs = InputCache(decompress_cache or outdir / ".inputs", threads)
+    if index is None:
+        input_fasta = inputs.plain(input_fasta)
+    repeatmasker_file = inputs.plain(repeatmasker_file)
+    # Region runs read the few sequences they need through the .fai index
+    if index is None and regions is not None:
+        index = FastaIndex(input_fasta, outdir)
+
     print(
         "Module 1 running with:\n"
         f"  Input: {input_fasta}\n"
         f"  RepeatMasker: {repeatmasker_file}\n"
         f"  Reference: {reference_fasta}\n"
         f"  Output Dir: {outdir}\n"
+        + (f"  Regions: {len(regions)} windows\n" if regions is not None else "")
     )
 
+    # Compile the filter up front so a bad expression fails before any work
+    if l1_filter:
+        compile_filter(l1_filter)
+    run_log = RunLog(outdir / "LOG.txt")
+    # Region runs would skew the per-stage history the planner fits
+    stage_metrics = StageMetrics("rm", outdir, history_path(metrics) if regions is None else None)
+
     print("[STEP 1] Parsing RepeatMasker output")
     # 1. Parse RepeatMasker file to unified BED6
     parsed_bed = outdir / "parsed_repeatmasker.bed"
-    parse_repeatmasker(repeatmasker_file, parsed_bed, log_skipped)
+    parsed, malformed = parse_repeatmasker(repeatmasker_file, parsed_bed, log_skipped, regions)
+    run_log.stage("parse_repeatmasker", parsed + malformed, parsed, "malformed lines")
+    stage_metrics.lap("parse_repeatmasker", "rm_records", parsed + malformed)
 
     print("[STEP 2] Extracting full-length L1s")
-    # 2. Extract full-length L1s (>=5000bp) from parsed BED
+    # 2. Extract full-length L1s (>=5000bp) from parsed BED. The optional
+    # filter is applied here so excluded elements skip every later stage.
     fl_bed = outdir / "FL.bed"
-    subprocess.run([
-        "python3", "-m", "haplongliner.extract_l1", parsed_bed, "-o", str(fl_bed)
-    ], check=True)
+    counts = extract_l1_from_bed(parsed_bed, fl_bed, where=l1_filter)
+    full_length = counts["total"] - counts["not_full_length"]
+    run_log.stage("extract_full_length", counts["total"], full_length, "not L1 or shorter than 5000 bp")
+    run_log.stage("filter", full_length, counts["kept"], l1_filter or "no filter")
+    if l1_filter:
+        print(f"[INFO] Filter kept {counts['kept']} of {full_length} full-length L1s")
 
     print("[STEP 3] Extracting full-length L1 sequences")
     # 3. Extract the sequence of the full-length L1s (plus and minus strand)
     fl_fa = outdir / "FL.fa"
-    with open(fl_fa, "w") as out_fa:
-        # Plus strand
-        plus_cmd = (
-            f"awk '$6==\"+\"' {fl_bed} | "
-            f"seqtk subseq {input_fasta} - | "
-            f"seqtk seq -U -l 0 - | "
-            "sed '/^>/ s/$/(+)/'"
-        )
-        subprocess.run(plus_cmd, shell=True, stdout=out_fa, check=True)
-        # Minus strand
-        minus_cmd = (
-            f"awk '$6==\"-\"' {fl_bed} | "
-            f"seqtk subseq {input_fasta} - | "
-            f"seqtk seq -U -r -l 0 - | "
-            "sed '/^>/ s/$/(-)/'"
-        )
-        subprocess.run(minus_cmd, shell=True, stdout=out_fa, check=True)
+    if index is not None:
+        index.write_bed(fl_bed, fl_fa, stranded=True)
+    else:
+        with open(fl_fa, "w") as out_fa:
+            # Plus strand
+            plus_cmd = (
+                f"awk '$6==\"+\"' {fl_bed} | "
+                f"seqtk subseq {input_fasta} - | "
+                f"seqtk seq -U -l 0 - | "
+                "sed '/^>/ s/$/(+)/'"
+            )
+            subprocess.run(plus_cmd, shell=True, stdout=out_fa, check=True)
+            # Minus strand
+            minus_cmd = (
+                f"awk '$6==\"-\"' {fl_bed} | "
+                f"seqtk subseq {input_fasta} - | "
+                f"seqtk seq -U -r -l 0 - | "
+                "sed '/^>/ s/$/(-)/'"
+            )
+            subprocess.run(minus_cmd, shell=True, stdout=out_fa, check=True)
 
     # Sanitize FASTA headers for getorf compatibility
     fl_rename_fa = outdir / "FL.rename.fa"
@@ -174,6 +449,9 @@ def run_module1(
                 fout.write(header + "\n")
             else:
                 fout.write(line)
+    sequences = {header.split()[0]: seq for header, seq in iter_fasta(fl_fa)}
+    run_log.stage("extract_sequence", counts["kept"], len(sequences), "no sequence in assembly")
+    stage_metrics.lap("extract_sequence", "assembly_bp", fasta_bases(input_fasta))
 
     print("[STEP 4] Extracting 2kb flanking regions")
     # 4. Extract flanking 2kb regions (upstream and downstream)
@@ -194,88 +472,264 @@ def run_module1(
     # 5. Extract sequences for flanking regions
     fl_minus2kb_fa = outdir / "FL-2kb.fa"
     fl_plus2kb_fa = outdir / "FL+2kb.fa"
-    subprocess.run(f"seqtk subseq {input_fasta} {fl_minus2kb_bed} | seqtk seq -U -l 0 - > {fl_minus2kb_fa}", shell=True, check=True)
-    subprocess.run(f"seqtk subseq {input_fasta} {fl_plus2kb_bed} | seqtk seq -U -l 0 - > {fl_plus2kb_fa}", shell=True, check=True)
+    _subseq(input_fasta, fl_minus2kb_bed, fl_minus2kb_fa, index)
+    _subseq(input_fasta, fl_plus2kb_bed, fl_plus2kb_fa, index)
 
     print("[STEP 6] Mapping flanks to reference genome")
     # 6. Map flanking regions to reference genome with minimap2 (using local FASTA)
     fl_minus2kb_minimap = outdir / "FL-2kb.minimap.txt"
     fl_plus2kb_minimap = outdir / "FL+2kb.minimap.txt"
-    subprocess.run(
-        f"minimap2 -x asm5 {reference_fasta} {fl_minus2kb_fa} > {fl_minus2kb_minimap}",
-        shell=True,
-        check=True,
-    )
-    subprocess.run(
-        f"minimap2 -x asm5 {reference_fasta} {fl_plus2kb_fa} > {fl_plus2kb_minimap}",
-        shell=True,
-        check=True,
-    )
+    memo = FlankMemo(liftover_memo) if liftover_memo else None
+    _map_flanks(reference_fasta, fl_minus2kb_fa, fl_minus2kb_minimap, memo)
+    _map_flanks(reference_fasta, fl_plus2kb_fa, fl_plus2kb_minimap, memo)
+    rescued = {}
+    if rescue_flanks:
+        unresolved = [
+            row[:4]
+            for row in combine_rows(fl_plus2kb_minimap, fl_minus2kb_minimap, (), fl_bed)
+            if "NA" in row[7:]
+        ]
+        if unresolved:
+            print(f"[STEP 6b] Retrying liftover of {len(unresolved)} loci with longer or offset flanks")
+            rescued = _rescue_liftover(unresolved, input_fasta, reference_fasta, outdir, memo, index=index)
+        run_log.stage("flank_rescue", len(unresolved), len(rescued), "still no unique concordant placement")
+    if memo:
+        memo.close()
+    stage_metrics.lap("map_flanks", "reference_bp", fasta_bases(reference_fasta))
 
     print("[STEP 7] Detecting ORFs")
     # 7. Detect ORFs and choose the longest ORF1/ORF2 per locus
     orf_fa = outdir / "FLAllORF.fa"
-    subprocess.run([
-        "getorf",
-        "-sequence",
-        fl_rename_fa,
-        "-find",
-        "1",
-        "-outseq",
-        str(orf_fa),
-    ], check=True)
     orf_bed = outdir / "FLAllORF.bed"
-    process_orf_fasta(orf_fa, orf_bed)
-    blastp_out = outdir / "FLAllORF.blastp"
-    db_prefix = Path("data") / "L1rpORF12p.fa"
-    verify_blast_db(db_prefix)
-    subprocess.run(
-        [
-            "blastp",
-            "-db",
-            str(db_prefix),
-            "-query",
-            str(orf_fa),
-            "-outfmt",
-            "6 std qlen slen sacc",
-            "-out",
-            str(blastp_out),
-        ],
-        check=True,
-    )
-    longest_orf_out = outdir / "FLAllORF.combine.blastp"
-    find_longest_orf(blastp_out, longest_orf_out)
+    reducer = OrfReducer()
+    orf_query = fl_rename_fa
+    cache = OrfCache(orf_cache, orf_cache_size, aligner, ORF_DB) if orf_cache else None
+    if cache:
+        # Replay verdicts for sequences seen in earlier runs and send only the
+        # cache misses through getorf and blastp.
+        keys = {
+            header.split()[0]: cache.key(seq)
+            for header, seq in iter_fasta(fl_rename_fa)
+        }
+        cached = cache.get_many(keys.values())
+        misses = []
+        orf_query = outdir / "FL.miss.fa"
+        with open(orf_query, "w") as fout:
+            for header, seq in iter_fasta(fl_rename_fa):
+                name = header.split()[0]
+                entry = cached.get(keys[name])
+                if entry is not None:
+                    reducer.consume(cache.replay(entry, name))
+                else:
+                    misses.append(name)
+                    fout.write(f">{header}\n{seq}\n")
+        print(f"[INFO] ORF cache: {len(keys) - len(misses)} hits, {len(misses)} misses")
+    if orf_query.stat().st_size > 0:
+        detect_orfs(orf_query, orf_fa, orf_bed, reducer, aligner, threads)
+    else:
+        orf_bed.touch()
+    if cache:
+        cache.put_many((keys[name], cache.entry(reducer, name)) for name in misses)
+        cache.close()
 
     print("[STEP 8] Identifying intact ORFs")
-    # 8. Identify intact ORFs
-    intact_out = outdir / "FLAllORF.intact.blastp"
-    find_intact_orf(longest_orf_out, intact_out)
+    # 8. The reducer already holds the longest and intact ORF hits; the
+    # tables are only written out for debugging
+    if keep_orf_tables:
+        reducer.write(outdir / "FLAllORF.combine.blastp", outdir / "FLAllORF.intact.blastp")
+    stage_metrics.lap("orf", "l1_count", len(sequences))
 
     print("[STEP 9] Integrating ORF status and liftover info")
     # 9. Integrate ORF status and liftover information
+    reported = lifted = intact = 0
+    try:
+        for row in combine_rows(
+            fl_plus2kb_minimap,
+            fl_minus2kb_minimap,
+            reducer.intact_lines(),
+            fl_bed,
+        ):
+            chrom, start, end, strand = row[:4]
+            if "NA" in row[7:] and (chrom, int(start), int(end)) in rescued:
+                row = (*row[:7], *map(str, rescued[(chrom, int(start), int(end))]))
+            orf1, orf2 = reducer.best_hits(_orf_query_name(chrom, start, end, strand))
+            record = L1Record.from_module1_row(
+                row,
+                OrfHit.from_blast(orf1),
+                OrfHit.from_blast(orf2),
+                sequences.get(f"{chrom}:{int(start) + 1}-{end}({strand})"),
+            )
+            reported += 1
+            lifted += record.ref_contig is not None
+            intact += record.intact
+            yield record
+        run_log.stage("liftover", reported, lifted, "no concordant flank placement (reported as NA)")
+        run_log.stage("orf", reported, intact, "no intact ORF1/ORF2 (reported as present)")
+        stage_metrics.lap("combine", "l1_count", len(sequences))
+        stage_metrics.save()
+    finally:
+        # Remove large intermediate files to save space
+        for tmp in [
+            orf_fa,
+            outdir / "FL.miss.fa",
+            fl_rename_fa,
+            None if keep_fasta else fl_fa,
+            parsed_bed,
+            fl_minus2kb_fa,
+            fl_plus2kb_fa,
+            regions_rm,
+        ]:
+            if tmp is None:
+                continue
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+        if index is not None:
+            index.close()
+        if not decompress_cache:
+            inputs.remove()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+def write_module1(records, output_dir="module1_output", bgzip=False, regions=None, merge_into=None,
+                  return_records=False):
+    """Write ``records`` (e.g. from :func:`iter_module1`) to ``HapLongLINErRM.txt``.
+
+    Records are streamed to the table as they arrive. With ``bgzip`` the
+    table is also written as a sorted, tabix-indexed ``HapLongLINErRM.bed.gz``
+    and ``FL.fa`` (kept by ``iter_module1(keep_fasta=True)``) as an indexed
+    ``FL.fa.gz``. ``merge_into`` is the output directory (or
+    ``HapLongLINErRM.txt``) of an earlier full run whose rows in the
+    ``regions`` windows are replaced by these records. The records are only
+    kept in memory and returned with ``return_records``.
+    """
+    if merge_into and not regions:
+        raise ValueError("merge_into needs regions: only rows inside the windows are replaced")
+    outdir = Path(output_dir)
+    outdir.mkdir(parents=True, exist_ok=True)
     combined_out = outdir / "HapLongLINErRM.txt"
-    combine_table(
-        fl_plus2kb_minimap,
-        fl_minus2kb_minimap,
-        intact_out,
-        fl_bed,
-        combined_out,
-    )
+    kept = [] if return_records else None
+    with open(combined_out, "w") as out:
+        for record in records:
+            out.write(record.module1_line())
+            if kept is not None:
+                kept.append(record)
+
+    if bgzip:
+        # Sorted, bgzipped and indexed copies for region/locus queries
+        write_indexed_bed(module1_rows(combined_out), outdir / "HapLongLINErRM.bed.gz", header=MODULE1_HEADER)
+        fl_fa = outdir / "FL.fa"
+        write_indexed_fasta(fl_fa, outdir / "FL.fa.gz")
+        os.remove(fl_fa)
+
+    if merge_into:
+        target = Path(merge_into)
+        if target.is_dir():
+            target = target / "HapLongLINErRM.txt"
+        with open(combined_out) as fh:
+            replaced, added = merge_table(
+                target, fh, Regions.parse(regions) if isinstance(regions, str) else regions, module1_coords,
+            )
+        indexed = target.with_name("HapLongLINErRM.bed.gz")
+        if indexed.exists():
+            write_indexed_bed(module1_rows(target), indexed, header=MODULE1_HEADER)
+        print(f"[INFO] Merged into {target}: {replaced} rows replaced by {added}")
 
     # Final output table
     print(f"Module 1 completed. Results in {combined_out}")
+    return kept
+
 
-    # Remove large intermediate files to save space
-    for tmp in [
-        blastp_out,
-        orf_fa,
-        fl_rename_fa,
-        fl_fa,
-        parsed_bed,
-        fl_minus2kb_fa,
-        fl_plus2kb_fa,
-    ]:
-        try:
-            os.remove(tmp)
-        except FileNotFoundError:
-            pass
+def run_module1(
+    input_fasta,
+    repeatmasker_file,
+    reference_fasta,
+    output_dir="module1_output",
+    log_skipped=None,
+    orf_cache=None,
+    orf_cache_size=100000,
+    liftover_memo=None,
+    bgzip=False,
+    aligner="blastp",
+    threads=1,
+    l1_filter=None,
+    rescue_flanks=False,
+    decompress_cache=None,
+    metrics=None,
+    regions=None,
+    merge_into=None,
+    keep_orf_tables=None,
+    return_records=False,
+):
+    """
+    RepeatMasker-based L1 discovery pipeline.
+    Downloads remote reference if needed.
+    Handles RepeatMasker BED, BED.gz, .out, or .out.gz input.
+    ``log_skipped`` specifies a file to log malformed RepeatMasker lines. If not
+    provided, the ``HAPLOGLINER_LOG_SKIPPED`` environment variable is checked.
+    ``orf_cache`` is an optional SQLite file shared across runs that maps L1
+    sequences to their ORF hits and intactness verdict (falling back to the
+    ``HAPLONGLINER_ORF_CACHE`` environment variable); it keeps at most
+    ``orf_cache_size`` entries. ``liftover_memo`` is an optional SQLite file
+    memoizing flank liftover hits across haplotypes (falling back to
+    ``HAPLONGLINER_LIFTOVER_MEMO``). With ``bgzip`` the results are also
+    written as a sorted, tabix-indexed ``HapLongLINErRM.bed.gz`` and the
+    full-length L1 sequences are kept as an indexed ``FL.fa.gz``.
+    ``aligner`` selects how ORFs are matched to L1rp ORF1p/ORF2p: ``blastp``
+    (default) or the in-process ``builtin`` aligner using ``threads``
+    worker processes. ``l1_filter`` is an optional expression over
+    ``subfamily``, ``length``, ``contig`` and ``strand`` (see
+    :func:`~haplongliner.extract_l1.compile_filter`) applied when the
+    full-length L1s are extracted, so excluded elements skip all later
+    stages. Per-stage counts of dropped elements are written to ``LOG.txt``.
+    With ``rescue_flanks``, loci whose 2 kb flanks give no concordant
+    placement are retried with the longer or offset flanks of
+    ``RESCUE_SCHEDULE`` (only those loci are re-aligned). A gzipped assembly
+    or RepeatMasker file is decompressed once (block-parallel with
+    ``threads`` threads for BGZF) into ``decompress_cache`` (falling back to
+    ``HAPLONGLINER_DECOMPRESS_CACHE``), where the copy is kept for later
+    runs, or into a per-run directory that is removed afterwards. Wall
+    time, peak memory and disk use of each stage are written to
+    ``METRICS.tsv`` and, with ``metrics`` (or ``HAPLONGLINER_METRICS``),
+    appended to that SQLite history for the resource planner.
+    ``regions`` (a BED file or comma-separated ``contig:start-end`` list,
+    see :class:`~haplongliner.regions.Regions`) restricts RepeatMasker
+    parsing, sequence extraction, ORF calling and flank liftover to the
+    full-length L1s overlapping those assembly windows; sequences are read
+    through the assembly's ``.fai``. ``merge_into`` is the output directory
+    (or ``HapLongLINErRM.txt``) of an earlier full run whose rows in the
+    windows are replaced by the region results. ``keep_orf_tables`` keeps
+    the longest and intact ORF hit tables (see :func:`iter_module1`).
+
+    The records from :func:`iter_module1` are written to
+    ``HapLongLINErRM.txt`` by :func:`write_module1`; they are also returned
+    as a list with ``return_records``, which keeps them all in memory.
+    """
+    return write_module1(
+        iter_module1(
+            input_fasta,
+            repeatmasker_file,
+            reference_fasta,
+            output_dir,
+            log_skipped=log_skipped,
+            orf_cache=orf_cache,
+            orf_cache_size=orf_cache_size,
+            liftover_memo=liftover_memo,
+            aligner=aligner,
+            threads=threads,
+            l1_filter=l1_filter,
+            rescue_flanks=rescue_flanks,
+            keep_fasta=bgzip,
+            decompress_cache=decompress_cache,
+            metrics=metrics,
+            regions=regions,
+            keep_orf_tables=keep_orf_tables,
+        ),
+        output_dir,
+        bgzip=bgzip,
+        regions=regions,
+        merge_into=merge_into,
+        return_records=return_records,
+    )
@@ -1,7 +1,50 @@
+import gzip
+import os
 import re
 import subprocess
+import tempfile
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .anchor_store import AnchorStore, anchor_signature
+from .bundle import anchor_coords
+from .decompress import InputCache
+from .metrics import StageMetrics, history_path
+from .planner import count_sv_records, fasta_bases
+from .indexed_output import write_indexed_bed
+from .l1_screen import KmerScreen, iter_insertion_alts, revcomp
+from .orf_detect import check_orf_tools, detect_orfs
+from .orf_reducer import OrfReducer
+from .records import L1Record
+from .utils import iter_fasta
+from .regions import FastaIndex, Regions, SequenceSource, bed_coords, merge_table
+from .seqstore import SharedGenome
+
+# Sequence added around each window when selecting deletions, so that the
+# deletion of an L1 overlapping a window edge is still found
+_ANCHOR_PAD = 10000
+
+
+def _minimap_target(fasta: str, original: str) -> str:
+    """Return a prebuilt minimap2 index of the assembly if one sits next to it, else ``fasta``.
+
+    ``x.fa.mmi`` and ``x.mmi`` are looked for next to ``original`` (the
+    assembly as given, possibly gzipped) and the plain copy ``fasta``.
+    """
+    for path in (Path(original), Path(fasta)):
+        name = path.name[:-3] if path.name.endswith('.gz') else path.name
+        for mmi in (path.with_name(f"{name}.mmi"), path.with_name(name).with_suffix('.mmi')):
+            if mmi.exists():
+                return str(mmi)
+    return fasta
+
+
+def _find_store(fasta: str) -> Optional[SharedGenome]:
+    """Attach to the shared sequence store loaded from ``fasta``, if any."""
+    index = SharedGenome.find(fasta)
+    if index is not None:
+        print(f"[INFO] Reading {fasta} from shared sequence store {index.name}")
+    return index
 
 
 def _read_paf(path: Path) -> Dict[str, List[str]]:
@@ -20,33 +63,32 @@ def _read_paf(path: Path) -> Dict[str, List[str]]:
 
 def _liftover_l1s(minus_paf: Path, plus_paf: Path, ref_bed: Path) -> List[Tuple[str, int, int, str, int, str]]:
     """Infer target assembly coordinates for each L1 listed in ``ref_bed``."""
-    minus = _read_paf(minus_paf)
-    plus = _read_paf(plus_paf)
+    return _liftover_hits(_read_paf(minus_paf), _read_paf(plus_paf), _anchor_coords(ref_bed))
 
+
+def _liftover_hits(minus: Dict[str, List[str]], plus: Dict[str, List[str]],
+                   anchors: Dict[str, Tuple[str, int, int, str]]) -> List[Tuple[str, int, int, str, int, str]]:
+    """Lift each anchor from its ``<name>_-2kb``/``<name>_+2kb`` flank hits."""
     lifted: List[Tuple[str, int, int, str, int, str]] = []
-    with open(ref_bed) as fh:
-        for line in fh:
-            if not line.strip() or line.startswith('#'):
-                continue
-            chrom, start, end, name, strand = line.strip().split()[:5]
-            m = minus.get(f"{name}_-2kb")
-            p = plus.get(f"{name}_+2kb")
-            if not m or not p:
-                continue
-            if m[5] != p[5] or m[4] != p[4]:
-                continue
-            tname = m[5]
-            orient = m[4]
-            if orient == '+':
-                start_t = int(m[8])
-                end_t = int(p[7])
-            else:
-                start_t = int(p[8])
-                end_t = int(m[7])
-            if end_t < start_t:
-                start_t, end_t = end_t, start_t
-            length = int(end) - int(start)
-            lifted.append((tname, start_t, end_t, name, length, orient))
+    for name, (_, start, end, _) in anchors.items():
+        m = minus.get(f"{name}_-2kb")
+        p = plus.get(f"{name}_+2kb")
+        if not m or not p:
+            continue
+        if m[5] != p[5] or m[4] != p[4]:
+            continue
+        tname = m[5]
+        orient = m[4]
+        if orient == '+':
+            start_t = int(m[8])
+            end_t = int(p[7])
+        else:
+            start_t = int(p[8])
+            end_t = int(m[7])
+        if end_t < start_t:
+            start_t, end_t = end_t, start_t
+        length = end - start
+        lifted.append((tname, start_t, end_t, name, length, orient))
     return lifted
 
 
@@ -61,7 +103,8 @@ def _parse_sv(sv_path: Path) -> Tuple[List[Tuple[str, int, int]], List[Tuple[str
     deletions: List[Tuple[str, int, int]] = []
     insertions: List[Tuple[str, int, int]] = []
     is_vcf = sv_path.suffix.lower().endswith('vcf') or sv_path.suffix.lower() == '.gz'
-    with open(sv_path) as fh:
+    opener = gzip.open if sv_path.suffix.lower() == '.gz' else open
+    with opener(sv_path, 'rt') as fh:
         for line in fh:
             if line.startswith('#') or not line.strip():
                 continue
@@ -96,6 +139,14 @@ def _bedtools_intersect(a: Path, b: Path, output: Path) -> None:
         subprocess.run(['bedtools', 'intersect', '-wa', '-wb', '-a', str(a), '-b', str(b)], check=True, stdout=out)
 
 
+def _deletion_status(a_start: int, a_end: int, d_start: int, d_end: int) -> str:
+    """``missing`` if an L1 covers >=95% of an overlapping deletion, else ``absent``."""
+    overlap = max(0, min(a_end, d_end) - max(a_start, d_start))
+    del_len = d_end - d_start
+    cov = overlap / del_len if del_len else 0
+    return 'missing' if cov >= 0.95 else 'absent'
+
+
 def _classify_deletions(lifted: List[Tuple[str, int, int, str, int, str]], deletions: List[Tuple[str, int, int]], outdir: Path) -> Dict[str, str]:
     lift_bed = outdir / 'lifted.bed'
     del_bed = outdir / 'sv_del.bed'
@@ -112,32 +163,24 @@ def _classify_deletions(lifted: List[Tuple[str, int, int, str, int, str]], delet
             f = line.strip().split('\t')
             if len(f) < 9:
                 continue
-            a_start = int(f[1])
-            a_end = int(f[2])
-            name = f[3]
-            d_start = int(f[6])
-            d_end = int(f[7])
-            overlap = max(0, min(a_end, d_end) - max(a_start, d_start))
-            del_len = d_end - d_start
-            cov = overlap / del_len if del_len else 0
-            if cov >= 0.95:
-                status[name] = 'missing'
-            else:
-                status[name] = 'absent'
+            status[f[3]] = _deletion_status(int(f[1]), int(f[2]), int(f[6]), int(f[7]))
     return status
 
 
-def _extract_sequences(fasta: Path, lifted: List[Tuple[str, int, int, str, int, str]], status: Dict[str, str], out_fa: Path) -> None:
+def _extract_sequences(fasta: Path, lifted: List[Tuple[str, int, int, str, int, str]], status: Dict[str, str], out_fa: Path,
+                       index: Optional[SequenceSource] = None) -> None:
     bed_path = out_fa.with_suffix('.bed')
     with open(bed_path, 'w') as bed:
         for chrom, start, end, name, length, _ in lifted:
             if status.get(name) in {'missing', 'absent'} and abs((end - start) - length) / length < 0.1:
                 bed.write(f"{chrom}\t{start}\t{end}\t{name}\n")
-    if bed_path.stat().st_size > 0:
+    if bed_path.stat().st_size > 0 and index is not None:
+        index.write_bed(bed_path, out_fa)
+    elif bed_path.stat().st_size > 0:
         cmd = f"seqtk subseq {fasta} {bed_path} | seqtk seq -U -l 0 - > {out_fa}"
         subprocess.run(cmd, shell=True, check=True)
     else:
-        out_fa.touch()
+        out_fa.write_text('')
 
 
 def _parse_repeatmasker(out_file: Path) -> List[str]:
@@ -151,7 +194,267 @@ def _parse_repeatmasker(out_file: Path) -> List[str]:
     return hits
 
 
-def run_module2(input_fasta: str, sv_file: str, l1ref_fasta: str, output_bed: str) -> None:
+def _screen_insertions(sv_file: Path, outdir: Path, ins_bed: Path, aligner: str = 'blastp',
+                       regions: Optional[Regions] = None) -> int:
+    """Screen INS ALT sequences for young full-length L1s and check their ORFs.
+
+    Insertions of 5-7 kb are classified in-process by k-mer containment
+    against ``data/L1rp.fa``; only the hits go through getorf and blastp.
+    Writes ``chrom pos pos+1 id length strand status containment`` rows to
+    ``ins_bed`` and returns the number of hits. With ``regions`` only
+    insertions inside those windows are screened.
+    """
+    screen = KmerScreen(Path('data') / 'L1rp.fa')
+    ins_fa = outdir / 'ins_candidates.fa'
+    hits = []
+    with open(ins_fa, 'w') as fa:
+        for chrom, pos, var_id, seq in iter_insertion_alts(sv_file):
+            if regions is not None and not regions.overlaps(chrom, pos, pos + 1):
+                continue
+            result = screen.classify(seq)
+            if result is None:
+                continue
+            containment, _, strand = result
+            name = f"ins{len(hits)}_{strand}"
+            oriented = seq.upper() if strand == '+' else revcomp(seq.upper())
+            fa.write(f">{name}\n{oriented}\n")
+            hits.append((chrom, pos, var_id, len(seq), strand, name, containment))
+
+    reducer = OrfReducer()
+    if hits:
+        detect_orfs(ins_fa, outdir / 'ins_candidates.orf.fa', outdir / 'ins_candidates.orf.bed', reducer, aligner)
+    with open(ins_bed, 'w') as out:
+        for chrom, pos, var_id, length, strand, name, containment in hits:
+            stat = 'intact' if reducer.intact(name) else 'present'
+            out.write(f"{chrom}\t{pos}\t{pos + 1}\t{var_id}\t{length}\t{strand}\t{stat}\t{containment:.3f}\n")
+    return len(hits)
+
+
+def _anchor_coords(ref_bed: Path) -> Dict[str, Tuple[str, int, int, str]]:
+    """Map anchor name to its reference ``(chrom, start, end, strand)``.
+
+    Served from the reference bundle when one is built and fresh.
+    """
+    return anchor_coords(ref_bed)
+
+
+def _update_store(store: AnchorStore, input_fasta: str, sv_file: str, minus_fa: Path, plus_fa: Path,
+                  anchors: Dict[str, Tuple[str, int, int, str]], outdir: Path, original_fasta: str):
+    """Map the new or changed anchors of the catalogue and record them in ``store``.
+
+    Returns ``(minus_hits, plus_hits, verdicts)`` for every anchor of the
+    catalogue, where ``verdicts`` holds the stored ``(status, l1_flag)`` of
+    anchors that need no reclassification. The anchors are mapped to a
+    prebuilt index next to ``original_fasta`` when there is one (see
+    :func:`_minimap_target`).
+    """
+    if not store.bind('assembly', store.checksum(input_fasta)):
+        print("[INFO] Anchor store was built for another assembly; lifting over all anchors")
+        store.reset(liftover=True)
+    if not store.bind('sv', store.checksum(sv_file)):
+        print("[INFO] SV callset changed; reclassifying all anchors")
+        store.reset()
+    minus_seqs = {header.split()[0]: seq for header, seq in iter_fasta(minus_fa)}
+    plus_seqs = {header.split()[0]: seq for header, seq in iter_fasta(plus_fa)}
+    signatures = {
+        name: anchor_signature(coords, minus_seqs.get(f"{name}_-2kb", ''), plus_seqs.get(f"{name}_+2kb", ''))
+        for name, coords in anchors.items()
+    }
+    stored = store.signatures()
+    removed = set(stored) - set(signatures)
+    store.remove(removed)
+    changed = [name for name, signature in signatures.items() if stored.get(name) != signature]
+    print(f"[INFO] Anchor store: {len(signatures) - len(changed)} anchors retained, "
+          f"{len(changed)} added or changed, {len(removed)} removed")
+
+    if changed:
+        target = _minimap_target(input_fasta, original_fasta)
+        delta = {}
+        for side, seqs in (('_-2kb', minus_seqs), ('_+2kb', plus_seqs)):
+            delta_fa = outdir / f"delta{side}.fa"
+            paf = outdir / ('minus2kb.paf' if side == '_-2kb' else 'plus2kb.paf')
+            with open(delta_fa, 'w') as out:
+                for name in changed:
+                    if f"{name}{side}" in seqs:
+                        out.write(f">{name}{side}\n{seqs[f'{name}{side}']}\n")
+            subprocess.run(f"minimap2 -x asm5 {target} {delta_fa} > {paf}", shell=True, check=True)
+            delta[side] = _read_paf(paf)
+            os.remove(delta_fa)
+        store.put_hits(
+            (name, signatures[name], delta['_-2kb'].get(f"{name}_-2kb"), delta['_+2kb'].get(f"{name}_+2kb"))
+            for name in changed
+        )
+    hits = store.hits()
+    minus = {f"{name}_-2kb": m for name, (m, _) in hits.items() if m}
+    plus = {f"{name}_+2kb": p for name, (_, p) in hits.items() if p}
+    return minus, plus, store.verdicts()
+
+
+def iter_module2(input_fasta: str, sv_file: str, l1ref_fasta: str, output_dir: Optional[str] = None,
+                 threads: int = 1, decompress_cache: Optional[str] = None,
+                 stage_metrics: Optional[StageMetrics] = None, regions: Optional[Regions] = None,
+                 anchor_store: Optional[str] = None,
+                 index: Optional[SequenceSource] = None) -> Iterator[L1Record]:
+    """SV-based L1 discovery, streaming one :class:`L1Record` per lifted anchor.
+
+    ``ref_*`` hold the reference anchor coordinates and ``l1_flag`` the
+    RepeatMasker confirmation of missing/absent candidates. Intermediate
+    files go to ``output_dir``, or to a temporary directory removed
+    afterwards when it is ``None``. The insertion screen is only run by
+    :func:`run_module2`. Gzipped inputs are decompressed once as in
+    :func:`run_module2`. ``stage_metrics`` records per-stage resource use.
+    Anchor flanks are always mapped to the whole assembly, so that paralogous
+    copies elsewhere keep the primary hit; with ``regions`` only L1s
+    overlapping those windows are reported and candidate sequences are read
+    through the ``.fai``. A prebuilt ``<assembly>.mmi`` is used when present.
+    With ``anchor_store`` (a per-assembly SQLite file, see
+    :class:`~haplongliner.anchor_store.AnchorStore`) only anchors added or
+    changed since the last run are mapped, classified and checked; the
+    others are taken from the store. ``index`` is a caller-owned source of
+    the assembly's sequences (e.g. a :class:`~haplongliner.seqstore.SharedGenome`);
+    without one, a shared sequence store loaded from ``input_fasta`` is used
+    if there is one.
+    """
+    if regions is not None and anchor_store:
+        raise ValueError("An anchor store cannot be updated by a region-restricted run")
+    tmpdir = None
+    if output_dir is None:
+        tmpdir = tempfile.TemporaryDirectory(prefix="haplongliner_")
+        output_dir = tmpdir.name
+    if isinstance(regions, str):
+        regions = Regions.parse(regions)
+    if decompress_cache is None:
+        decompress_cache = os.getenv("HAPLONGLINER_DECOMPRESS_CACHE")
+    inputs = InputCache(decompress_cache or Path(output_dir) / ".inputs", threads)
+    owns_index = index is None
+    store = AnchorStore(anchor_store) if anchor_store else None
+    try:
+        outdir = Path(output_dir)
+        outdir.mkdir(parents=True, exist_ok=True)
+        # Candidate and window sequences come from a shared sequence store
+        # (``haplongliner seqstore load``) when one holds the assembly. It is
+        # keyed on the file as loaded, so look it up before decompressing.
+        if index is None:
+            index = _find_store(input_fasta)
+        # minimap2, seqtk and the SV parser all read the plain copies
+        original_fasta = input_fasta
+        input_fasta = inputs.plain(input_fasta)
+        sv_file = inputs.plain(sv_file)
+        # Region runs read the few candidate sequences through the .fai
+        if index is None and regions is not None:
+            index = FastaIndex(input_fasta, outdir)
+
+        minus_fa = Path('data') / '-2kb.fa'
+        plus_fa = Path('data') / '+2kb.fa'
+
+        minus_paf = outdir / 'minus2kb.paf'
+        plus_paf = outdir / 'plus2kb.paf'
+
+        ref_bed = Path('data') / 'HPRC_L1_hs_v2_v2fl.bed'
+        anchors = _anchor_coords(ref_bed)
+        verdicts: Dict[str, Tuple[str, str]] = {}
+        if store is not None:
+            minus, plus, verdicts = _update_store(store, input_fasta, sv_file, minus_fa, plus_fa, anchors, outdir,
+                                                    original_fasta)
+        else:
+            target = _minimap_target(input_fasta, original_fasta)
+            subprocess.run(f"minimap2 -x asm5 {target} {minus_fa} > {minus_paf}", shell=True, check=True)
+            subprocess.run(f"minimap2 -x asm5 {target} {plus_fa} > {plus_paf}", shell=True, check=True)
+            minus, plus = _read_paf(minus_paf), _read_paf(plus_paf)
+
+        lifted = _liftover_hits(minus, plus, anchors)
+        if regions is not None:
+            # Filtered after genome-wide mapping, so an anchor whose flanks
+            # place elsewhere is not pulled into a window by a paralog
+            lifted = [entry for entry in lifted if regions.overlaps(*entry[:3])]
+        if stage_metrics:
+            stage_metrics.lap("map_anchors", "assembly_bp", fasta_bases(input_fasta))
+            # The planner predicts these stages from every SV record, not just deletions
+            sv_records = count_sv_records(sv_file)
+
+        deletions, _ = _parse_sv(Path(sv_file))
+        if regions is not None:
+            padded = regions.padded(_ANCHOR_PAD)
+            deletions = [d for d in deletions if padded.overlaps(*d)]
+        # Only anchors without a stored verdict are classified and checked
+        pending = [entry for entry in lifted if entry[3] not in verdicts]
+        status = _classify_deletions(pending, deletions, outdir)
+        if stage_metrics:
+            stage_metrics.lap("classify", "sv_records", sv_records)
+
+        candidate_fa = outdir / 'candidates.fa'
+        _extract_sequences(Path(input_fasta), pending, status, candidate_fa, index)
+
+        if candidate_fa.stat().st_size > 0:
+            subprocess.run(['RepeatMasker', str(candidate_fa)], check=True)
+            rm_out = candidate_fa.with_suffix('.fa.out')
+            l1_names = set(_parse_repeatmasker(rm_out))
+        else:
+            l1_names = set()
+        if stage_metrics:
+            stage_metrics.lap("candidate_check", "sv_records", sv_records)
+
+        for _, _, _, name, _, _ in pending:
+            verdicts[name] = (status.get(name, 'present'), 'L1' if name in l1_names else 'NA')
+        if store is not None:
+            # Anchors that did not lift over get an empty verdict so they are not retried
+            lifted_names = {entry[3] for entry in lifted}
+            store.put_verdicts(
+                (name, *verdicts.get(name, ('', ''))) for name in anchors
+                if name not in lifted_names or name in status or name not in verdicts
+            )
+
+        for chrom, start, end, name, length, strand in lifted:
+            ref_chrom, ref_start, ref_end, ref_strand = anchors[name]
+            yield L1Record(
+                chrom, start, end, strand, length, name, verdicts[name][0],
+                ref_chrom, ref_start, ref_end, ref_strand,
+                l1_flag=verdicts[name][1],
+            )
+    finally:
+        if store is not None:
+            store.close()
+        if owns_index and index is not None:
+            index.close()
+        if not decompress_cache:
+            inputs.remove()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+def run_module2(input_fasta: str, sv_file: str, l1ref_fasta: str, output_bed: str, bgzip: bool = False,
+                screen_insertions: bool = True, aligner: str = 'blastp', threads: int = 1,
+                decompress_cache: Optional[str] = None, metrics: Optional[str] = None,
+                regions: Optional[str] = None, merge_into: Optional[str] = None,
+                anchor_store: Optional[str] = None) -> List[L1Record]:
+    """SV-based L1 discovery; ``bgzip`` adds a sorted, tabix-indexed ``output_bed.gz``.
+
+    With ``screen_insertions``, sequence-resolved INS calls are screened for
+    novel young full-length L1s, written to ``<output>.ins.bed``; their ORFs
+    are checked with ``aligner`` (``blastp`` or ``builtin``). A gzipped
+    assembly or SV callset is decompressed once (block-parallel with
+    ``threads`` threads for BGZF) into ``decompress_cache`` (falling back to
+    ``HAPLONGLINER_DECOMPRESS_CACHE``) or a per-run directory removed at the
+    end. Per-stage wall time, peak memory and disk use are written to
+    ``<output>.METRICS.tsv`` next to ``output_bed`` and, with ``metrics`` (or
+    ``HAPLONGLINER_METRICS``), appended to that SQLite history. ``regions``
+    (a BED file or comma-separated ``contig:start-end`` list) restricts the
+    run to L1s, deletions and insertions in those assembly windows;
+    ``merge_into`` is the BED of an earlier full run whose rows in the
+    windows are replaced by the region results (its ``.ins.bed`` too).
+    ``anchor_store`` keeps this assembly's anchor liftovers and verdicts so
+    that a later run with a grown anchor catalogue only processes the added
+    or changed anchors. The records from :func:`iter_module2` are written to
+    ``output_bed`` and returned.
+    """
+    if merge_into and not regions:
+        raise ValueError("merge_into needs regions: only rows inside the windows are replaced")
+    if isinstance(regions, str):
+        regions = Regions.parse(regions)
+    if screen_insertions:
+        check_orf_tools(aligner, "The insertion screen",
+                        "skip it with --no-ins-screen" if aligner == "builtin"
+                        else "use --aligner builtin or skip the screen with --no-ins-screen")
     print(
         f"Module 2 running with:\n  Input: {input_fasta}\n  SV: {sv_file}\n  L1 Reference: {l1ref_fasta}\n  Output: {output_bed}"
     )
@@ -160,35 +463,47 @@ def run_module2(input_fasta: str, sv_file: str, l1ref_fasta: str, output_bed: st
     outdir = out_path.parent
     outdir.mkdir(parents=True, exist_ok=True)
 
-    minus_fa = Path('data') / '-2kb.fa'
-    plus_fa = Path('data') / '+2kb.fa'
+    if decompress_cache is None:
+        decompress_cache = os.getenv("HAPLONGLINER_DECOMPRESS_CACHE")
+    inputs = InputCache(decompress_cache or outdir / ".inputs", threads)
+    stage_metrics = StageMetrics("sv", outdir, history_path(metrics) if regions is None else None,
+                                 out_path.with_suffix('.METRICS.tsv'))
+    records = []
+    # Found on the assembly as given; iter_module2 decompresses it afterwards
+    index = _find_store(input_fasta)
+    try:
+        sv_file = inputs.plain(sv_file)
+        with open(output_bed, 'w') as out:
+            for record in iter_module2(input_fasta, sv_file, l1ref_fasta, str(outdir), threads, decompress_cache,
+                                       stage_metrics, regions, anchor_store, index):
+                out.write(record.module2_line())
+                records.append(record)
 
-    minus_paf = outdir / 'minus2kb.paf'
-    plus_paf = outdir / 'plus2kb.paf'
+        if screen_insertions:
+            ins_bed = out_path.with_suffix('.ins.bed')
+            n_ins = _screen_insertions(Path(sv_file), outdir, ins_bed, aligner, regions)
+            print(f"[INFO] {n_ins} insertion calls look like young full-length L1s; see {ins_bed}")
+            stage_metrics.lap("insertion_screen", "sv_records", count_sv_records(sv_file))
+        stage_metrics.save()
+    finally:
+        if index is not None:
+            index.close()
+        if not decompress_cache:
+            inputs.remove()
 
-    subprocess.run(f"minimap2 -x asm5 {input_fasta} {minus_fa} > {minus_paf}", shell=True, check=True)
-    subprocess.run(f"minimap2 -x asm5 {input_fasta} {plus_fa} > {plus_paf}", shell=True, check=True)
+    if bgzip:
+        write_indexed_bed((record.module2_line().rstrip("\n").split("\t") for record in records), f"{output_bed}.gz")
 
-    ref_bed = Path('data') / 'HPRC_L1_hs_v2_v2fl.bed'
-    lifted = _liftover_l1s(minus_paf, plus_paf, ref_bed)
-
-    deletions, insertions = _parse_sv(Path(sv_file))
-    status = _classify_deletions(lifted, deletions, outdir)
-
-    candidate_fa = outdir / 'candidates.fa'
-    _extract_sequences(Path(input_fasta), lifted, status, candidate_fa)
-
-    if candidate_fa.stat().st_size > 0:
-        subprocess.run(['RepeatMasker', str(candidate_fa)], check=True)
-        rm_out = candidate_fa.with_suffix('.fa.out')
-        l1_names = set(_parse_repeatmasker(rm_out))
-    else:
-        l1_names = set()
-
-    with open(output_bed, 'w') as out:
-        for chrom, start, end, name, length, strand in lifted:
-            stat = status.get(name, 'present')
-            l1flag = 'L1' if name in l1_names else 'NA'
-            out.write(f"{chrom}\t{start}\t{end}\t{name}\t{length}\t{strand}\t{stat}\t{l1flag}\n")
+    if merge_into:
+        replaced, added = merge_table(merge_into, (record.module2_line() for record in records), regions, bed_coords)
+        print(f"[INFO] Merged into {merge_into}: {replaced} rows replaced by {added}")
+        target_ins = Path(merge_into).with_suffix('.ins.bed')
+        if screen_insertions and target_ins.exists():
+            with open(out_path.with_suffix('.ins.bed')) as fh:
+                merge_table(target_ins, fh.readlines(), regions, bed_coords)
+        if Path(f"{merge_into}.gz").exists():
+            with open(merge_into) as fh:
+                write_indexed_bed((line.rstrip("\n").split("\t") for line in fh if line.strip()), f"{merge_into}.gz")
 
     print(f"Module 2 completed. Results in {output_bed}")
+    return records
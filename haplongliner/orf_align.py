@@ -0,0 +1,342 @@
+"""In-process protein alignment of getorf ORFs against L1rp ORF1p/ORF2p.
+
+A drop-in replacement for ``blastp -db data/L1rpORF12p.fa -outfmt '6 std
+qlen slen sacc'`` for the two fixed subjects: exact 3-mer seeds are
+chained into the colinear run of diagonals an ORF shares with a subject,
+and a banded Smith-Waterman with affine gaps (BLOSUM62, gap open 11,
+extend 1 as in blastp) aligns across all of them, so an indel moves the
+alignment to another diagonal instead of ending it. The band is widened
+while the alignment runs along its edge. Rows carry the same identity,
+length and span columns BLAST reports, so
+:class:`~haplongliner.orf_reducer.OrfReducer` and the intactness check
+consume them unchanged. E-values and bit scores use the Karlin-Altschul
+parameters of BLOSUM62 11/1 without composition-based adjustment, so they
+are close to, but not identical with, BLAST's. Hits above ``MAX_EVALUE``
+are dropped.
+"""
+
+import math
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .bundle import fasta_records
+from .orf_reducer import ORF1_SUBJECT, ORF2_SUBJECT
+from .utils import iter_fasta
+
+_AA = "ARNDCQEGHILKMFPSTWYVBZX*"
+_BLOSUM62_ROWS = """
+ 4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+-1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+-2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+-2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+ 0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+-1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+-1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+ 0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+-2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+-1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+-1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+-1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+-1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+-2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+-1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+ 1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+ 0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+-3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+-2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+ 0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+-2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+-1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+ 0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+-4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+"""
+BLOSUM62: Dict[str, Dict[str, int]] = {
+    a: dict(zip(_AA, map(int, row.split())))
+    for a, row in zip(_AA, _BLOSUM62_ROWS.strip().splitlines())
+}
+# Residues outside the matrix (e.g. U, O, J) score as X
+for _row in BLOSUM62.values():
+    _row.update({c: _row["X"] for c in "UOJ"})
+BLOSUM62.update({c: BLOSUM62["X"] for c in "UOJ"})
+
+GAP_OPEN = 11
+GAP_EXTEND = 1
+# Gapped Karlin-Altschul parameters for BLOSUM62 with 11/1 gaps
+LAMBDA = 0.267
+K = 0.041
+SEED = 3
+# E-value cutoff for ORF hits. Weak hits of one ORF protein on the other
+# would otherwise compete with the real hits for the longest ORF1p/ORF2p
+# alignment of an L1.
+MAX_EVALUE = 1e-5
+
+_CODONS = {
+    a + b + c: aa
+    for (a, b, c), aa in zip(
+        ((x, y, z) for x in "TCAG" for y in "TCAG" for z in "TCAG"),
+        "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+    )
+}
+
+
+def translate(seq: str) -> str:
+    """Translate a coding sequence, dropping a trailing stop codon."""
+    seq = seq.upper()
+    protein = "".join(_CODONS.get(seq[i:i + 3], "X") for i in range(0, len(seq) - 2, 3))
+    return protein[:-1] if protein.endswith("*") else protein
+
+
+def load_subjects(fasta="data/L1rpORF12p.fa") -> List[Tuple[str, str]]:
+    """Return ``(accession, protein)`` for ORF1p and ORF2p.
+
+    ``L1rpORF12p.fa`` holds the L1rp ORF coding sequences; they are
+    translated here and named like the BLAST database entries.
+    """
+    subjects = []
+    for header, seq in fasta_records(fasta):
+        name = header.split()[0]
+        if set(seq.upper()) <= set("ACGTN"):
+            seq = translate(seq)
+        subjects.append((name if name.endswith("p") else f"{name}p", seq.upper()))
+    names = {name for name, _ in subjects}
+    if not {ORF1_SUBJECT, ORF2_SUBJECT} <= names:
+        raise ValueError(f"{fasta} must contain {ORF1_SUBJECT} and {ORF2_SUBJECT}")
+    return subjects
+
+
+class _Subject:
+    __slots__ = ("name", "seq", "kmers")
+
+    def __init__(self, name: str, seq: str) -> None:
+        self.name = name
+        self.seq = seq
+        self.kmers: Dict[str, List[int]] = {}
+        for j in range(len(seq) - SEED + 1):
+            self.kmers.setdefault(seq[j:j + SEED], []).append(j)
+
+
+def _chain_diagonals(query: str, subject: _Subject, min_seeds: int) -> Optional[Tuple[int, int]]:
+    """Return the lowest and highest ``subject - query`` offset of the best seed chain.
+
+    Only diagonals with at least ``min_seeds`` seed hits take part; the
+    chain is the longest run of their seeds that is colinear in query and
+    subject, so it follows the alignment across indels.
+    """
+    seeds = []
+    diagonals = Counter()
+    kmers = subject.kmers
+    for i in range(len(query) - SEED + 1):
+        for j in kmers.get(query[i:i + SEED], ()):
+            seeds.append((i, j))
+            diagonals[j - i] += 1
+    seeds = [(i, j) for i, j in seeds if diagonals[j - i] >= min_seeds]
+    if not seeds:
+        return None
+    # Longest chain increasing in both coordinates; seeds of one query
+    # position are visited with decreasing j so that only one is taken
+    seeds.sort(key=lambda seed: (seed[0], -seed[1]))
+    tails: List[int] = []
+    tail_seed: List[int] = []
+    previous = [-1] * len(seeds)
+    for n, (_, j) in enumerate(seeds):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_seed.append(n)
+        else:
+            tails[pos] = j
+            tail_seed[pos] = n
+        previous[n] = tail_seed[pos - 1] if pos else -1
+    n = tail_seed[-1]
+    lo = hi = seeds[n][1] - seeds[n][0]
+    while n >= 0:
+        diag = seeds[n][1] - seeds[n][0]
+        lo, hi = min(lo, diag), max(hi, diag)
+        n = previous[n]
+    return lo, hi
+
+
+def banded_sw(query: str, subject: str, diag: int, band: int):
+    """Local alignment of ``query`` and ``subject`` within ``band`` of ``diag``.
+
+    Returns ``(score, qstart, qend, sstart, send, length, identities,
+    mismatches, gap_opens, edge)`` with 1-based inclusive coordinates, or
+    ``None`` when nothing scores above zero. ``edge`` is true when the
+    alignment runs along the band's edge, where a wider band may score
+    higher.
+    """
+    m, n = len(query), len(subject)
+    width = 2 * band + 1
+    lo = diag - band  # subject offset of band column 0 relative to the query row
+    open_cost = GAP_OPEN + GAP_EXTEND
+    neg = -(1 << 30)
+    # H/E/F rows indexed by band column; row 0 is the empty query prefix
+    H = [[0] * (width + 1) for _ in range(m + 1)]
+    E = [[neg] * (width + 1) for _ in range(m + 1)]
+    F = [[neg] * (width + 1) for _ in range(m + 1)]
+    best = (0, 0, 0)
+    for i in range(1, m + 1):
+        scores = BLOSUM62.get(query[i - 1], BLOSUM62["X"])
+        Hp, Fp = H[i - 1], F[i - 1]
+        Hi, Ei, Fi = H[i], E[i], F[i]
+        k_min = max(0, 1 - i - lo)
+        k_max = min(width - 1, n - i - lo)
+        for k in range(k_min, k_max + 1):
+            j = i + lo + k
+            # Gap in the query (horizontal move) from column k - 1 of this row
+            if k > k_min:
+                e = max(Ei[k - 1] - GAP_EXTEND, Hi[k - 1] - open_cost)
+            else:
+                e = neg
+            # Gap in the subject (vertical move) from column k + 1 of the row above
+            if k + 1 < width:
+                f = max(Fp[k + 1] - GAP_EXTEND, Hp[k + 1] - open_cost)
+            else:
+                f = neg
+            h = Hp[k] + scores.get(subject[j - 1], -1)
+            if e > h:
+                h = e
+            if f > h:
+                h = f
+            if h < 0:
+                h = 0
+            Hi[k], Ei[k], Fi[k] = h, e, f
+            if h > best[0]:
+                best = (h, i, k)
+    score, i, k = best
+    if score <= 0:
+        return None
+
+    # Traceback
+    qend, send = i, i + lo + k
+    state = "H"
+    length = identities = mismatches = gap_opens = 0
+    edge = False
+    while True:
+        j = i + lo + k
+        if (k == 0 and j > 1) or (k == width - 1 and j < n):
+            edge = True
+        if state == "H":
+            h = H[i][k]
+            if h == 0:
+                break
+            if h == H[i - 1][k] + BLOSUM62.get(query[i - 1], BLOSUM62["X"]).get(subject[j - 1], -1):
+                length += 1
+                if query[i - 1] == subject[j - 1]:
+                    identities += 1
+                else:
+                    mismatches += 1
+                qstart, sstart = i, j
+                i -= 1
+                continue
+            state = "E" if h == E[i][k] else "F"
+            gap_opens += 1
+        elif state == "E":
+            length += 1
+            from_open = E[i][k] == H[i][k - 1] - open_cost
+            k -= 1
+            if from_open:
+                state = "H"
+        else:
+            length += 1
+            from_open = F[i][k] == H[i - 1][k + 1] - open_cost
+            i -= 1
+            k += 1
+            if from_open:
+                state = "H"
+    return score, qstart, qend, sstart, send, length, identities, mismatches, gap_opens, edge
+
+
+def _format_evalue(evalue: float) -> str:
+    if evalue < 1e-180:
+        return "0.0"
+    if evalue < 1e-3:
+        return f"{evalue:.2e}"
+    return f"{evalue:.3f}"
+
+
+def _format_bits(bits: float) -> str:
+    return f"{bits:.0f}" if bits > 99.9 else f"{bits:.1f}"
+
+
+_subjects: List[_Subject] = []
+_db_length = 0
+
+
+def _init(subjects: List[Tuple[str, str]]) -> None:
+    global _subjects, _db_length
+    _subjects = [_Subject(name, seq) for name, seq in subjects]
+    _db_length = sum(len(s.seq) for s in _subjects)
+
+
+def _align_one(item: Tuple[str, str], band: int = 32, min_seeds: int = 2,
+               max_evalue: float = MAX_EVALUE) -> List[str]:
+    """Align one ORF against every subject; return outfmt-6 rows."""
+    qid, query = item
+    query = query.upper().rstrip("*")
+    rows = []
+    for subject in _subjects:
+        chain = _chain_diagonals(query, subject, min_seeds)
+        if chain is None:
+            continue
+        lo, hi = chain
+        diag = (lo + hi) // 2
+        width = (hi - lo + 1) // 2 + band
+        full = len(query) + len(subject.seq)
+        while True:
+            aln = banded_sw(query, subject.seq, diag, width)
+            if aln is None or not aln[-1] or width >= full:
+                break
+            width *= 2
+        if aln is None:
+            continue
+        score, qstart, qend, sstart, send, length, identities, mismatches, gap_opens, _ = aln
+        evalue = K * len(query) * _db_length * math.exp(-LAMBDA * score)
+        if evalue > max_evalue:
+            continue
+        bits = (LAMBDA * score - math.log(K)) / math.log(2)
+        rows.append(
+            f"{qid}\t{subject.name}\t{100 * identities / length:.3f}\t{length}\t{mismatches}\t"
+            f"{gap_opens}\t{qstart}\t{qend}\t{sstart}\t{send}\t{_format_evalue(evalue)}\t"
+            f"{_format_bits(bits)}\t{len(query)}\t{len(subject.seq)}\t{subject.name}\n"
+        )
+    return rows
+
+
+def align_orfs(orf_fa, subjects_fa="data/L1rpORF12p.fa", threads: int = 1) -> Iterator[str]:
+    """Yield ``6 std qlen slen sacc`` rows for every ORF in ``orf_fa``.
+
+    With ``threads`` > 1 the ORFs are spread over a pool of worker
+    processes (the alignment is CPU-bound pure Python, so processes rather
+    than threads); rows come back in input order.
+    """
+    subjects = load_subjects(subjects_fa)
+    queries: Iterable[Tuple[str, str]] = (
+        (header.split()[0], seq) for header, seq in iter_fasta(orf_fa)
+    )
+    if threads > 1:
+        with ProcessPoolExecutor(threads, initializer=_init, initargs=(subjects,)) as pool:
+            for rows in pool.map(_align_one, queries, chunksize=64):
+                yield from rows
+    else:
+        _init(subjects)
+        for item in queries:
+            yield from _align_one(item)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Align getorf ORFs against L1rp ORF1p/ORF2p (blastp outfmt '6 std qlen slen sacc')"
+    )
+    parser.add_argument("orf_fa", help="Protein FASTA from getorf")
+    parser.add_argument("-d", "--db", default=str(Path("data") / "L1rpORF12p.fa"),
+                        help="ORF1p/ORF2p FASTA (default: data/L1rpORF12p.fa)")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="Worker processes")
+    args = parser.parse_args()
+    sys.stdout.writelines(align_orfs(args.orf_fa, args.db, args.threads))
@@ -0,0 +1,73 @@
+"""ORF calling and ORF1p/ORF2p matching shared by module 1 and the insertion screen."""
+
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+from .orf_align import align_orfs
+from .process_orf import process_orf_fasta
+from .utils import require_tools, verify_blast_db
+
+# L1rp ORF1p/ORF2p protein FASTA (and BLAST database prefix)
+ORF_DB = Path("data") / "L1rpORF12p.fa"
+
+
+def orf_tools(aligner: str = "blastp") -> List[str]:
+    """Return the external tools :func:`detect_orfs` runs with ``aligner``."""
+    return ["getorf", "blastp"] if aligner == "blastp" else ["getorf"]
+
+
+def check_orf_tools(aligner: str, needed_for: str, alternative: str) -> None:
+    """Exit with an error naming ``alternative`` if a tool for ``needed_for`` is missing."""
+    missing = [tool for tool in orf_tools(aligner) if shutil.which(tool) is None]
+    if missing:
+        sys.exit(
+            f"Error: {needed_for} needs {', '.join(missing)} on your PATH; "
+            f"install {'it' if len(missing) == 1 else 'them'} or {alternative}."
+        )
+    if aligner == "blastp":
+        verify_blast_db(ORF_DB)
+
+
+def detect_orfs(query_fa, orf_fa, orf_bed, reducer, aligner="blastp", threads=1):
+    """Run getorf and blastp on ``query_fa`` and fold the hits into ``reducer``.
+
+    With ``aligner="builtin"`` the ORFs are aligned in-process by
+    :func:`~haplongliner.orf_align.align_orfs` on ``threads`` workers
+    instead of blastp.
+    """
+    subprocess.run([
+        "getorf",
+        "-sequence",
+        str(query_fa),
+        "-find",
+        "1",
+        "-outseq",
+        str(orf_fa),
+    ], check=True)
+    process_orf_fasta(orf_fa, orf_bed)
+    if aligner == "builtin":
+        reducer.consume(align_orfs(orf_fa, ORF_DB, threads))
+        return
+    require_tools("blastp")
+    verify_blast_db(ORF_DB)
+    # Stream blastp's tabular output straight into the ORF reducer so the
+    # raw per-hit table is never written to disk.
+    with subprocess.Popen(
+        [
+            "blastp",
+            "-db",
+            str(ORF_DB),
+            "-query",
+            str(orf_fa),
+            "-outfmt",
+            "6 std qlen slen sacc",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    ) as proc:
+        reducer.consume(proc.stdout)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
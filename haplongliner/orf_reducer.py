@@ -0,0 +1,150 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+ORF1_SUBJECT = "L1rpORF1p"
+ORF2_SUBJECT = "L1rpORF2p"
+# Subject spans that an intact ORF must cover (see ``find_intact_orf``)
+ORF1_SPAN = (1, 338)
+ORF2_SPAN = (1, 1275)
+
+
+def _l1_name(query_id: str) -> str:
+    """Strip the ``_N`` ORF index that getorf appends to each L1 header."""
+    head, sep, tail = query_id.rpartition("_")
+    if sep and tail.isascii() and tail.isdigit():
+        return head
+    return query_id
+
+
+class OrfReducer:
+    """Streaming reducer over ``blastp -outfmt '6 std qlen slen sacc'`` rows.
+
+    Fuses ``find_longest_orf`` and ``find_intact_orf`` into a single pass:
+    only the running best (longest, last one wins on ties) ORF1p and ORF2p
+    hit is kept for each L1, so memory grows with the number of L1s rather
+    than with the number of BLAST hits. Alignment lengths and subject spans
+    live in flat arrays indexed by a per-L1 slot.
+    """
+
+    def __init__(self) -> None:
+        self._slots: Dict[str, int] = {}
+        self._names: List[str] = []
+        # Per subject: best alignment length, sstart, send and the raw row
+        self._len = (array("i"), array("i"))
+        self._sstart = (array("i"), array("i"))
+        self._send = (array("i"), array("i"))
+        self._rows: Tuple[List[Optional[str]], List[Optional[str]]] = ([], [])
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _slot(self, name: str) -> int:
+        slot = self._slots.get(name)
+        if slot is None:
+            slot = len(self._names)
+            self._slots[name] = slot
+            self._names.append(name)
+            for i in (0, 1):
+                self._len[i].append(-1)
+                self._sstart[i].append(0)
+                self._send[i].append(0)
+                self._rows[i].append(None)
+        return slot
+
+    def add(self, line: str) -> None:
+        """Fold one BLASTP tabular row into the table."""
+        row = line.strip()
+        if not row:
+            return
+        fields = row.split()
+        slot = self._slot(_l1_name(fields[0]))
+        subject = fields[1]
+        if subject == ORF1_SUBJECT:
+            i = 0
+        elif subject == ORF2_SUBJECT:
+            i = 1
+        else:
+            return
+        aln_len = int(fields[3])
+        if aln_len >= self._len[i][slot]:
+            self._len[i][slot] = aln_len
+            self._sstart[i][slot] = int(fields[8])
+            self._send[i][slot] = int(fields[9])
+            self._rows[i][slot] = row
+
+    def consume(self, lines: Iterable[str]) -> "OrfReducer":
+        """Fold every row of ``lines`` (a file or a pipe) into the table."""
+        for line in lines:
+            self.add(line)
+        return self
+
+    def is_intact(self, slot: int) -> bool:
+        return (
+            self._rows[0][slot] is not None
+            and self._rows[1][slot] is not None
+            and (self._sstart[0][slot], self._send[0][slot]) == ORF1_SPAN
+            and (self._sstart[1][slot], self._send[1][slot]) == ORF2_SPAN
+        )
+
+    def intact(self, name: str) -> bool:
+        """Return whether ``name`` has intact ORF1 and ORF2 hits."""
+        slot = self._slots.get(name)
+        return slot is not None and self.is_intact(slot)
+
+    def best_hits(self, name: str) -> Tuple[Optional[str], Optional[str]]:
+        """Return the best ``(ORF1p, ORF2p)`` rows recorded for ``name``."""
+        slot = self._slots.get(name)
+        if slot is None:
+            return None, None
+        return self._rows[0][slot], self._rows[1][slot]
+
+    def longest_lines(self) -> Iterator[str]:
+        """Yield ``find_longest_orf`` rows: ORF1p and ORF2p hits side by side."""
+        orf1, orf2 = self._rows
+        for slot in range(len(self._names)):
+            if orf1[slot] is not None and orf2[slot] is not None:
+                yield f"{orf1[slot]}\t{orf2[slot]}\n"
+
+    def intact_lines(self) -> Iterator[str]:
+        """Yield the subset of :meth:`longest_lines` that ``find_intact_orf`` keeps."""
+        orf1, orf2 = self._rows
+        for slot in range(len(self._names)):
+            if self.is_intact(slot):
+                yield f"{orf1[slot]}\t{orf2[slot]}\n"
+
+    def verdicts(self) -> Iterator[Tuple[str, bool]]:
+        """Yield ``(l1_name, intact)`` for every L1 seen in the stream."""
+        for slot, name in enumerate(self._names):
+            yield name, self.is_intact(slot)
+
+    def write(self, longest_out, intact_out) -> None:
+        """Write the longest-ORF and intact-ORF tables in one pass."""
+        with open(longest_out, "w") as lout, open(intact_out, "w") as iout:
+            orf1, orf2 = self._rows
+            for slot in range(len(self._names)):
+                if orf1[slot] is None or orf2[slot] is None:
+                    continue
+                line = f"{orf1[slot]}\t{orf2[slot]}\n"
+                lout.write(line)
+                if self.is_intact(slot):
+                    iout.write(line)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Reduce BLASTP tabular output (file or stdin) to longest and intact ORF tables"
+    )
+    parser.add_argument("longest_out", help="Output file for longest ORF1/ORF2 hits")
+    parser.add_argument("intact_out", help="Output file for intact ORF1/ORF2 hits")
+    parser.add_argument("blastp_file", nargs="?", help="BLASTP tabular output (default: stdin)")
+    args = parser.parse_args()
+    reducer = OrfReducer()
+    if args.blastp_file:
+        with open(args.blastp_file) as fh:
+            reducer.consume(fh)
+    else:
+        reducer.consume(sys.stdin)
+    reducer.write(args.longest_out, args.intact_out)
@@ -0,0 +1,269 @@
+"""Dry-run resource planning for module 1 and module 2 jobs.
+
+:func:`inspect_inputs` measures what drives each stage's cost without
+running anything: assembly and reference length (from a ``.fai`` when
+present), the number of RepeatMasker records and full-length L1s, and the
+number of SV records. :func:`plan_job` turns these into a per-stage
+prediction of wall time, peak memory and disk footprint. Each stage is
+modelled as ``a + b * driver`` for time, memory and disk, fitted to the
+stages recorded by earlier runs in a metrics history
+(:mod:`haplongliner.metrics`); stages without history fall back to rough
+built-in coefficients. :func:`recommend_jobs` sizes ``batch`` parallelism
+from the predicted peaks and this node's cores and memory.
+"""
+
+import gzip
+import os
+import re
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .decompress import _bsize, is_bgzf, is_gzip
+from .metrics import load_history
+
+# Typical length of hs1/hg38 when the reference is still to be downloaded
+_GENOME_BP = 3.1e9
+# Plain-to-gzip size ratio assumed for non-BGZF gzipped FASTA
+_GZIP_RATIO = 3.4
+# Typical counts for a human haplotype, used for inputs that are not local yet
+_TYPICAL = {"rm_records": 5.5e6, "l1_count": 15000, "sv_records": 30000}
+
+# stage -> (driver, (time s: a, b), (memory MB: a, b), (disk MB: a, b))
+# Rough single-thread figures for a human assembly; replaced per stage by
+# fits to recorded runs as soon as a metrics history has them.
+DEFAULT_MODEL = {
+    "rm": [
+        ("parse_repeatmasker", "rm_records", (1, 2e-6), (80, 2e-4), (0, 1e-4)),
+        ("extract_sequence", "assembly_bp", (2, 1e-8), (50, 1e-8), (0, 0)),
+        ("map_flanks", "reference_bp", (20, 2e-7), (300, 2.6e-6), (0, 0)),
+        ("orf", "l1_count", (5, 0.1), (200, 0), (0, 0.03)),
+        ("combine", "l1_count", (1, 1e-3), (100, 0.01), (0, 0.01)),
+    ],
+    "sv": [
+        ("map_anchors", "assembly_bp", (10, 1e-7), (300, 2.6e-6), (0, 0)),
+        ("classify", "sv_records", (1, 2e-5), (80, 5e-4), (0, 1e-4)),
+        ("candidate_check", "sv_records", (30, 5e-5), (500, 0), (0, 1e-4)),
+        ("insertion_screen", "sv_records", (2, 1e-4), (150, 1e-3), (0, 1e-4)),
+    ],
+}
+
+
+def fasta_bases(path) -> float:
+    """Return the sequence length of a FASTA (exact from ``.fai``, else estimated)."""
+    path = Path(path)
+    for fai in (Path(f"{path}.fai"), path.with_suffix(".fai") if path.suffix == ".gz" else None):
+        if fai is not None and fai.exists():
+            with open(fai) as fh:
+                return float(sum(int(line.split("\t")[1]) for line in fh if line.strip()))
+    if not path.exists():
+        return _GENOME_BP
+    size = path.stat().st_size
+    if path.suffix == ".mmi":
+        # minimap2 indexes take roughly 2.6 bytes per base at the asm presets
+        return size / 2.6
+    if is_gzip(path):
+        size = bgzf_plain_size(path) if is_bgzf(path) else size * _GZIP_RATIO
+    # Subtract newlines of 60-80 column FASTA
+    return size * 0.985
+
+
+def bgzf_plain_size(path) -> int:
+    """Sum the uncompressed sizes recorded in every BGZF block trailer."""
+    total = 0
+    with open(path, "rb") as fh:
+        while True:
+            head = fh.read(12)
+            if len(head) < 12:
+                return total
+            xlen = struct.unpack("<H", head[10:12])[0]
+            bsize = _bsize(fh.read(xlen))
+            if bsize is None:
+                raise ValueError(f"{path}: BGZF block without a BC subfield")
+            # ISIZE is the last 4 bytes of the bsize + 1 byte block
+            fh.seek(bsize + 1 - 12 - xlen - 4, os.SEEK_CUR)
+            total += struct.unpack("<I", fh.read(4))[0]
+
+
+def _open_text(path):
+    return gzip.open(path, "rt") if is_gzip(path) else open(path)
+
+
+def count_repeatmasker(path, min_length: int = 5000) -> Tuple[int, int]:
+    """Return ``(records, full_length_l1s)`` of a RepeatMasker BED or ``.out`` file."""
+    records = full_length = 0
+    with _open_text(path) as fh:
+        for line in fh:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = re.split(r"\s+", line.strip())
+            if len(fields) >= 14 and fields[5].isdigit() and fields[6].isdigit():
+                start, end, name = int(fields[5]) - 1, int(fields[6]), fields[9]
+            elif len(fields) >= 5 and fields[1].isdigit() and fields[2].isdigit():
+                start, end, name = int(fields[1]), int(fields[2]), fields[3]
+            else:
+                continue
+            records += 1
+            full_length += name.startswith("L1") and end - start >= min_length
+    return records, full_length
+
+
+def count_sv_records(path) -> int:
+    with _open_text(path) as fh:
+        return sum(1 for line in fh if line.strip() and not line.startswith("#"))
+
+
+def inspect_inputs(module: str, params: Dict[str, str]) -> Tuple[Dict[str, float], List[str]]:
+    """Measure the cost drivers of a job; return ``(drivers, notes)``."""
+    drivers: Dict[str, float] = {}
+    notes: List[str] = []
+    missing = [key for key in ("input", "mask", "sv") if key in params and not Path(params[key]).exists()]
+    if missing:
+        notes.append(f"{', '.join(params[key] for key in missing)} not local; assuming a typical human haplotype")
+    drivers["assembly_bp"] = fasta_bases(params["input"])
+    if module == "rm":
+        if "mask" in missing:
+            drivers["rm_records"], drivers["l1_count"] = _TYPICAL["rm_records"], _TYPICAL["l1_count"]
+        else:
+            drivers["rm_records"], drivers["l1_count"] = count_repeatmasker(params["mask"])
+        reference = params["reference"]
+        if "://" in reference or reference in ("hs1", "hg38"):
+            local = Path("data") / Path(reference).name
+            drivers["reference_bp"] = fasta_bases(local) if local.exists() else _GENOME_BP
+            if not local.exists():
+                notes.append(f"reference {reference} will be downloaded first (~1 GB)")
+        else:
+            drivers["reference_bp"] = fasta_bases(reference)
+            mmi = Path(reference).with_suffix(".mmi")
+            if not reference.endswith(".mmi"):
+                if mmi.exists():
+                    notes.append(f"pass --custom {mmi} to reuse the existing minimap2 index")
+                else:
+                    notes.append("the reference is indexed by every minimap2 call; "
+                                 "a prebuilt .mmi (minimap2 -x asm5 -d) saves most of map_flanks")
+    else:
+        drivers["sv_records"] = _TYPICAL["sv_records"] if "sv" in missing else count_sv_records(params["sv"])
+    for key in ("input", "mask", "sv"):
+        if key in params and key not in missing and is_gzip(params[key]):
+            drivers.setdefault("decompressed_mb", 0)
+            plain = bgzf_plain_size(params[key]) if is_bgzf(params[key]) else Path(params[key]).stat().st_size * _GZIP_RATIO
+            drivers["decompressed_mb"] += plain / (1 << 20)
+    return drivers, notes
+
+
+def _fit(points: Sequence[Tuple[float, float]], default: Tuple[float, float]) -> Tuple[float, float]:
+    """Least-squares ``a + b x`` (non-negative).
+
+    Without spread in ``x`` (e.g. a single recorded run) the default slope
+    is kept and the intercept moved to pass through the observed mean.
+    """
+    if not points:
+        return default
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    n = len(points)
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if var == 0:
+        return max(0.0, mean_y - default[1] * mean_x), default[1]
+    b = max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var)
+    return max(0.0, mean_y - b * mean_x), b
+
+
+def plan_job(module: str, drivers: Dict[str, float], history=None) -> List[Tuple]:
+    """Return ``(stage, driver, value, seconds, peak_mb, disk_mb, source)`` per stage.
+
+    ``disk_mb`` is the predicted size of the output directory after the
+    stage, including any decompressed input copies.
+    """
+    recorded = load_history(history, module)
+    rows = []
+    base_disk = drivers.get("decompressed_mb", 0.0)
+    for stage, driver, time_ab, mem_ab, disk_ab in DEFAULT_MODEL[module]:
+        value = drivers.get(driver, 0.0)
+        points = recorded.get(stage, [])
+        fits = [
+            _fit([(p[0], p[i]) for p in points], default)
+            for i, default in ((1, time_ab), (2, mem_ab), (3, disk_ab))
+        ]
+        seconds, peak, disk = (a + b * value for a, b in fits)
+        source = f"history ({len(points)} runs)" if points else "default"
+        # Recorded footprints already include the decompressed input copies
+        rows.append((stage, driver, value, seconds, peak, disk if points else base_disk + disk, source))
+    return rows
+
+
+def _meminfo_mb() -> Optional[float]:
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def recommend_jobs(peak_mb: float, threads: int = 1, cores: Optional[int] = None,
+                   memory_mb: Optional[float] = None) -> Tuple[int, str]:
+    """Return ``(jobs, reason)``: how many such jobs fit on this node at once."""
+    cores = cores or os.cpu_count() or 1
+    memory_mb = memory_mb or _meminfo_mb()
+    by_cpu = max(1, cores // max(1, threads))
+    if not memory_mb or not peak_mb:
+        return by_cpu, f"{cores} cores"
+    by_mem = max(1, int(0.8 * memory_mb // peak_mb))
+    if by_mem < by_cpu:
+        return by_mem, f"{memory_mb / 1024:.0f} GB available memory"
+    return by_cpu, f"{cores} cores"
+
+
+def _duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _size(mb: float) -> str:
+    return f"{mb / 1024:.1f} GB" if mb >= 1024 else f"{mb:.0f} MB"
+
+
+def format_plan(label: str, rows: List[Tuple], notes: Sequence[str] = ()) -> str:
+    lines = [f"[PLAN] {label}",
+             f"  {'stage':<20}{'driver':<14}{'value':>15}{'time':>10}{'peak mem':>11}{'disk':>10}  source"]
+    for stage, driver, value, seconds, peak, disk, source in rows:
+        lines.append(
+            f"  {stage:<20}{driver:<14}{value:>15,.0f}{_duration(seconds):>10}{_size(peak):>11}{_size(disk):>10}  {source}"
+        )
+    total = sum(r[3] for r in rows)
+    peak = max((r[4] for r in rows), default=0)
+    disk = max((r[5] for r in rows), default=0)
+    lines.append(f"  {'total':<49}{_duration(total):>10}{_size(peak):>11}{_size(disk):>10}")
+    lines.extend(f"  note: {note}" for note in notes)
+    return "\n".join(lines)
+
+
+def plan_manifest(manifest, history=None, prefetch: int = 2, threads: int = 1) -> str:
+    """Plan every job of a ``batch`` manifest; recommend ``--jobs`` and ``--quota``."""
+    from .batch import STAGED_PARAMS, source_size
+    from .work_queue import read_job_manifest
+
+    blocks = []
+    peak = staged = total = 0.0
+    jobs = 0
+    for jobs, (sample, haplotype, module, params) in enumerate(read_job_manifest(manifest), 1):
+        drivers, notes = inspect_inputs(module, params)
+        rows = plan_job(module, drivers, history)
+        blocks.append(format_plan(f"job {jobs}: {module} {sample} {haplotype}", rows, notes))
+        peak = max([peak] + [r[4] for r in rows])
+        total += sum(r[3] for r in rows)
+        staged = max(staged, sum(source_size(params[key]) or 0 for key in STAGED_PARAMS if key in params))
+    n_jobs, reason = recommend_jobs(peak, threads)
+    n_jobs = max(1, min(n_jobs, jobs))
+    lines = [f"[PLAN] {jobs} jobs, {_duration(total)} of work; about {_duration(total / n_jobs)} with --jobs {n_jobs}",
+             f"[PLAN] recommended: --jobs {n_jobs} (largest job peaks at {_size(peak)}; limited by {reason})"]
+    if staged:
+        quota = staged * (n_jobs + prefetch) / (1 << 20)
+        lines.append(f"[PLAN] recommended: --quota {max(1, int(quota / 1024 + 0.999))}G "
+                     f"(inputs of {n_jobs + prefetch} jobs staged at once)")
+    return "\n\n".join(blocks + ["\n".join(lines)])
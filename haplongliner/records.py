@@ -0,0 +1,125 @@
+"""In-memory L1 records produced by the discovery modules.
+
+:func:`haplongliner.iter_module1` and :func:`haplongliner.iter_module2`
+stream :class:`L1Record` objects so that HapLongLINEr can be used as a
+library (e.g. from a notebook or a cohort workflow) without writing and
+re-parsing the text tables; ``run_module1``/``run_module2`` only serialise
+the same records to their usual output files.
+"""
+
+from typing import List, Optional, Sequence
+
+
+def _int_or_none(value: str) -> Optional[int]:
+    return None if value in ("", "NA") else int(value)
+
+
+class OrfHit:
+    """Best BLASTP hit of one ORF against L1rp ORF1p/ORF2p (outfmt ``6 std``)."""
+
+    __slots__ = ("query", "subject", "pident", "length", "qstart", "qend",
+                 "sstart", "send", "evalue", "bitscore")
+
+    def __init__(self, query: str, subject: str, pident: float, length: int, qstart: int,
+                 qend: int, sstart: int, send: int, evalue: float, bitscore: float) -> None:
+        self.query = query
+        self.subject = subject
+        self.pident = pident
+        self.length = length
+        self.qstart = qstart
+        self.qend = qend
+        self.sstart = sstart
+        self.send = send
+        self.evalue = evalue
+        self.bitscore = bitscore
+
+    @classmethod
+    def from_blast(cls, row: Optional[str]) -> Optional["OrfHit"]:
+        """Parse a tabular BLASTP row; ``None`` passes through."""
+        if row is None:
+            return None
+        f = row.split()
+        return cls(f[0], f[1], float(f[2]), int(f[3]), int(f[6]), int(f[7]),
+                   int(f[8]), int(f[9]), float(f[10]), float(f[11]))
+
+    def __repr__(self) -> str:
+        return (f"OrfHit({self.subject} {self.sstart}-{self.send}, "
+                f"length={self.length}, pident={self.pident})")
+
+
+class L1Record:
+    """One full-length L1 locus in an assembly.
+
+    Assembly coordinates are 0-based half-open. ``ref_*`` hold the flank
+    liftover onto the reference (module 1) or the reference anchor the locus
+    was lifted from (module 2) and are ``None`` where the liftover failed.
+    ``orf1``/``orf2`` are the best :class:`OrfHit` per ORF (module 1 only);
+    ``l1_flag`` is module 2's RepeatMasker confirmation (``"L1"`` or ``"NA"``).
+    """
+
+    __slots__ = ("contig", "start", "end", "strand", "length", "name", "status",
+                 "ref_contig", "ref_start", "ref_end", "ref_strand",
+                 "orf1", "orf2", "l1_flag", "sequence")
+
+    def __init__(self, contig: str, start: int, end: int, strand: str, length: int,
+                 name: str, status: str, ref_contig: Optional[str] = None,
+                 ref_start: Optional[int] = None, ref_end: Optional[int] = None,
+                 ref_strand: Optional[str] = None, orf1: Optional[OrfHit] = None,
+                 orf2: Optional[OrfHit] = None, l1_flag: Optional[str] = None,
+                 sequence: Optional[str] = None) -> None:
+        self.contig = contig
+        self.start = start
+        self.end = end
+        self.strand = strand
+        self.length = length
+        self.name = name
+        self.status = status
+        self.ref_contig = ref_contig
+        self.ref_start = ref_start
+        self.ref_end = ref_end
+        self.ref_strand = ref_strand
+        self.orf1 = orf1
+        self.orf2 = orf2
+        self.l1_flag = l1_flag
+        self.sequence = sequence
+
+    def __repr__(self) -> str:
+        return (f"L1Record({self.contig}:{self.start}-{self.end}({self.strand}) "
+                f"{self.name} {self.status})")
+
+    @property
+    def intact(self) -> bool:
+        return self.status == "intact"
+
+    @classmethod
+    def from_module1_row(cls, row: Sequence[str], orf1: Optional[OrfHit] = None,
+                         orf2: Optional[OrfHit] = None, sequence: Optional[str] = None) -> "L1Record":
+        """Build a record from a :func:`combine_rows` tuple."""
+        chrom, start, end, strand, length, name, status, chr_ref, start_ref, end_ref, out_strand = row
+        return cls(
+            chrom, int(start), int(end), strand, int(length), name, status,
+            None if chr_ref == "NA" else chr_ref,
+            _int_or_none(start_ref),
+            _int_or_none(end_ref),
+            None if out_strand == "NA" else out_strand,
+            orf1, orf2, sequence=sequence,
+        )
+
+    def _ref_fields(self) -> List[str]:
+        return ["NA" if v is None else str(v)
+                for v in (self.ref_contig, self.ref_start, self.ref_end, self.ref_strand)]
+
+    def module1_line(self) -> str:
+        """Serialise as a ``HapLongLINErRM.txt`` line."""
+        return (f"{self.contig}_{self.start}_{self.end}_{self.strand}_{self.length}_"
+                f"{self.name}_{self.status}\t{'_'.join(self._ref_fields())}\n")
+
+    def module2_line(self) -> str:
+        """Serialise as a module 2 BED line."""
+        return (f"{self.contig}\t{self.start}\t{self.end}\t{self.name}\t{self.length}\t"
+                f"{self.strand}\t{self.status}\t{self.l1_flag or 'NA'}\n")
+
+    def bed_fields(self) -> List[str]:
+        """Columns of ``MODULE1_HEADER`` for the indexed BED output."""
+        return [self.contig, str(self.start), str(self.end), self.name, str(self.length),
+                self.strand, self.status, *self._ref_fields()]
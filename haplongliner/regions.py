@@ -0,0 +1,259 @@
+"""Region-restricted reanalysis of a few assembly loci.
+
+A region run of module 1 or module 2 (``--regions``) only looks at the
+full-length L1s overlapping a set of assembly windows: RepeatMasker records,
+SV calls and insertions outside them are dropped while parsing, and
+sequences are read through the assembly's ``.fai`` index with
+:class:`FastaIndex` instead of scanning the whole FASTA with ``seqtk``.
+:func:`merge_table` then replaces the rows of an earlier full run that fall
+in the windows with the region results.
+"""
+
+import os
+import shutil
+import subprocess
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .decompress import build_fai
+from .l1_screen import revcomp
+from .site_query import parse_region
+
+Interval = Tuple[str, int, int]
+
+
+class Regions:
+    """Assembly windows, merged per contig, with fast overlap tests."""
+
+    def __init__(self, intervals: Iterable[Interval]) -> None:
+        by_contig: Dict[str, List[Tuple[int, int]]] = {}
+        for chrom, start, end in intervals:
+            by_contig.setdefault(chrom, []).append((max(0, start), end))
+        self.starts: Dict[str, List[int]] = {}
+        self.ends: Dict[str, List[int]] = {}
+        for chrom, spans in by_contig.items():
+            merged: List[List[int]] = []
+            for start, end in sorted(spans):
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.starts[chrom] = [s for s, _ in merged]
+            self.ends[chrom] = [e for _, e in merged]
+
+    @classmethod
+    def parse(cls, spec: str) -> "Regions":
+        """Read windows from a BED file or a comma-separated ``contig:start-end`` list.
+
+        List coordinates are 1-based and inclusive as in samtools; a BED file
+        may also hold ``contig:start-end`` lines.
+        """
+        if os.path.isfile(spec):
+            intervals = []
+            with open(spec) as fh:
+                for line in fh:
+                    if not line.strip() or line.startswith(("#", "track", "browser")):
+                        continue
+                    fields = line.split()
+                    if len(fields) >= 3 and fields[1].isdigit() and fields[2].isdigit():
+                        intervals.append((fields[0], int(fields[1]), int(fields[2])))
+                    else:
+                        intervals.append(parse_region(fields[0]))
+            return cls(intervals)
+        return cls(parse_region(item.strip()) for item in spec.split(",") if item.strip())
+
+    def __iter__(self) -> Iterator[Interval]:
+        for chrom, starts in self.starts.items():
+            yield from ((chrom, s, e) for s, e in zip(starts, self.ends[chrom]))
+
+    def __len__(self) -> int:
+        return sum(len(starts) for starts in self.starts.values())
+
+    @property
+    def contigs(self) -> List[str]:
+        return list(self.starts)
+
+    def overlaps(self, chrom: str, start: int, end: int) -> bool:
+        """Return ``True`` if ``[start, end)`` on ``chrom`` touches any window."""
+        starts = self.starts.get(chrom)
+        if not starts:
+            return False
+        # Windows are disjoint, so only the last one starting before ``end`` can overlap
+        i = bisect_left(starts, end) - 1
+        return i >= 0 and self.ends[chrom][i] > start
+
+    def padded(self, pad: int) -> "Regions":
+        return Regions((chrom, start - pad, end + pad) for chrom, start, end in self)
+
+    def tabix_regions(self) -> List[str]:
+        return [chrom if end >= 2 ** 62 else f"{chrom}:{start + 1}-{end}" for chrom, start, end in self]
+
+
+class SequenceSource(ABC):
+    """Random access to contig sequences; subclasses provide :meth:`length` and :meth:`fetch`."""
+
+    @abstractmethod
+    def __contains__(self, name: str) -> bool:
+        ...
+
+    @abstractmethod
+    def length(self, name: str) -> int:
+        ...
+
+    @abstractmethod
+    def fetch(self, name: str, start: int, end: int) -> str:
+        """Return the upper-cased sequence of ``name`` in ``[start, end)`` (clamped)."""
+
+    def write_bed(self, bed, out_fa, stranded: bool = False) -> int:
+        """Write the BED intervals of ``bed`` to ``out_fa`` like ``seqtk subseq``.
+
+        Records are named ``contig:start+1-end``. With ``stranded``,
+        minus-strand intervals (column 6) are reverse-complemented and
+        ``(+)``/``(-)`` is appended to the name. Intervals on contigs missing
+        from the assembly are skipped. Returns the number written.
+        """
+        written = 0
+        with open(bed) as fin, open(out_fa, "w") as out:
+            for line in fin:
+                fields = line.split()
+                if len(fields) < 3 or fields[0] not in self:
+                    continue
+                chrom, start, end = fields[0], int(fields[1]), int(fields[2])
+                seq = self.fetch(chrom, start, end)
+                name = f"{chrom}:{start + 1}-{end}"
+                if stranded:
+                    strand = fields[5] if len(fields) > 5 else "+"
+                    if strand == "-":
+                        seq = revcomp(seq)
+                    name += f"({strand})"
+                out.write(f">{name}\n{seq}\n")
+                written += 1
+        return written
+
+
+class FastaIndex(SequenceSource):
+    """Random access to a plain FASTA through its ``.fai``.
+
+    A missing index is built next to the FASTA, or in ``fai_dir`` when the
+    FASTA's directory is not writable.
+    """
+
+    def __init__(self, fasta, fai_dir=None) -> None:
+        self.fasta = Path(fasta)
+        fai = Path(f"{fasta}.fai")
+        if not fai.exists() or fai.stat().st_mtime < self.fasta.stat().st_mtime:
+            try:
+                build_fai(self.fasta, fai)
+            except OSError:
+                if fai_dir is None:
+                    raise
+                fai = build_fai(self.fasta, Path(fai_dir) / f"{self.fasta.name}.fai")
+        self.entries: Dict[str, Tuple[int, int, int, int]] = {}
+        with open(fai) as fh:
+            for line in fh:
+                name, length, offset, line_bases, line_bytes = line.split("\t")[:5]
+                self.entries[name] = (int(length), int(offset), int(line_bases), int(line_bytes))
+        self._fh = open(self.fasta, "rb")
+
+    def __enter__(self) -> "FastaIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def length(self, name: str) -> int:
+        return self.entries[name][0]
+
+    def fetch(self, name: str, start: int, end: int) -> str:
+        """Return the upper-cased sequence of ``name`` in ``[start, end)`` (clamped)."""
+        length, offset, line_bases, line_bytes = self.entries[name]
+        start, end = max(0, start), min(end, length)
+        if end <= start:
+            return ""
+        first = offset + start // line_bases * line_bytes + start % line_bases
+        last = offset + (end - 1) // line_bases * line_bytes + (end - 1) % line_bases
+        self._fh.seek(first)
+        raw = self._fh.read(last - first + 1)
+        return raw.replace(b"\n", b"").replace(b"\r", b"").decode("ascii").upper()
+
+
+def tabix_subset(path, regions: Regions, out) -> bool:
+    """Write the records of a tabix-indexed ``path`` in ``regions`` to ``out``.
+
+    tabix prints a record once for every region it overlaps, so records
+    spanning several windows are written once. Returns ``False`` (writing
+    nothing) when ``path`` has no ``.tbi``/``.csi`` index or ``tabix`` is not
+    installed.
+    """
+    if not (Path(f"{path}.tbi").exists() or Path(f"{path}.csi").exists()) or not shutil.which("tabix"):
+        return False
+    seen = set()
+    with open(out, "w") as fh, subprocess.Popen(
+        ["tabix", str(path), *regions.tabix_regions()], stdout=subprocess.PIPE, text=True
+    ) as proc:
+        for line in proc.stdout:
+            if line not in seen:
+                seen.add(line)
+                fh.write(line)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    return True
+
+
+def module1_coords(line: str) -> Optional[Interval]:
+    fields = line.split()
+    if len(fields) < 2:
+        return None
+    chrom, start, end = fields[0].rsplit("_", 6)[:3]
+    return chrom, int(start), int(end)
+
+
+def bed_coords(line: str) -> Optional[Interval]:
+    fields = line.split("\t")
+    if len(fields) < 3 or line.startswith("#"):
+        return None
+    return fields[0], int(fields[1]), int(fields[2])
+
+
+def merge_table(existing, new_lines: Iterable[str], regions: Regions,
+                coords: Callable[[str], Optional[Interval]], out=None) -> Tuple[int, int]:
+    """Replace the rows of ``existing`` inside ``regions`` with ``new_lines``.
+
+    Rows outside the windows are kept; the result is ordered by contig (in
+    order of first appearance) and start, and written atomically to ``out``
+    (default: ``existing``). Returns ``(rows_replaced, rows_added)``.
+    """
+    out = Path(out or existing)
+    header: List[str] = []
+    kept: List[Tuple[Interval, str]] = []
+    replaced = 0
+    with open(existing) as fh:
+        for line in fh:
+            interval = coords(line)
+            if interval is None:
+                if line.startswith("#") and not kept:
+                    header.append(line)
+                continue
+            if regions.overlaps(*interval):
+                replaced += 1
+            else:
+                kept.append((interval, line))
+    added = [(interval, line) for line in new_lines for interval in [coords(line)] if interval is not None]
+    rank: Dict[str, int] = {}
+    for (chrom, _, _), _ in kept + added:
+        rank.setdefault(chrom, len(rank))
+    rows = sorted(kept + added, key=lambda row: (rank[row[0][0]], row[0][1], row[0][2]))
+    partial = out.with_name(f".{out.name}.{os.getpid()}.partial")
+    with open(partial, "w") as fh:
+        fh.writelines(header)
+        fh.writelines(line for _, line in rows)
+    os.replace(partial, out)
+    return replaced, len(added)
@@ -0,0 +1,466 @@
+"""Incrementally updatable HPRC L1 cohort repository.
+
+The repository is a SQLite database holding one row per L1 site (hs1 span,
+present/intact frequencies) and one row per carrier haplotype. It can be
+seeded from ``HPRC_L1_hs1_master_v2.bed`` with :func:`import_master` and then
+grown one haplotype at a time with :func:`append_sample`, which touches only
+the sites carried by that haplotype. :func:`export_master` writes the
+repository back in the master BED layout.
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .bundle import anchor_coords, bed_rows, fasta_records
+
+YOUNG_L1 = ("L1HS", "L1PA2", "L1PA3")
+ANCHOR_BED = Path("data") / "HPRC_L1_hs_v2_v2fl.bed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sites (
+    site_id TEXT PRIMARY KEY,
+    site_index INTEGER,
+    site_lineage TEXT,
+    chrom TEXT,
+    start INTEGER,
+    end INTEGER,
+    strand TEXT,
+    present_freq INTEGER DEFAULT 0,
+    intact_freq INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sites_pos ON sites (chrom, start);
+CREATE TABLE IF NOT EXISTS calls (
+    site_id TEXT,
+    sample TEXT,
+    haplotype TEXT,
+    status TEXT,
+    lineage TEXT,
+    assembly_info TEXT,
+    hs1_coord TEXT,
+    orientation TEXT,
+    cigar TEXT,
+    PRIMARY KEY (site_id, sample, haplotype)
+);
+CREATE INDEX IF NOT EXISTS calls_haplotype ON calls (sample, haplotype);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+HAPLOTYPES = {"1": "paternal", "2": "maternal", "paternal": "paternal", "maternal": "maternal"}
+
+
+def assembly_tag(sample: str, haplotype: str) -> str:
+    """Return the ``sample#1#``/``sample#2#`` prefix of a call's assembly info."""
+    return f"{sample}#{'1' if HAPLOTYPES[haplotype] == 'paternal' else '2'}#"
+
+
+def parse_hs1_coord(field: str) -> Tuple[str, int, int, str]:
+    """Return ``(chrom, start, end, strand)`` from ``chr1_123_456_+``.
+
+    Contig names may themselves contain underscores.
+    """
+    chrom, start, end, strand = field.rsplit("_", 3)
+    return chrom, int(start), int(end), strand
+
+
+def make_site_id(chrom: str, start: int, taken) -> str:
+    """Return a new site ID in the master table style, e.g. ``014887A1``.
+
+    The ID is the two character chromosome code, the leading four digits of
+    the position and the first letter not already used by ``taken`` for
+    that prefix.
+    """
+    code = chrom[3:] if chrom.startswith("chr") else chrom
+    code = code.zfill(2) if len(code) <= 2 else "UN"
+    prefix = f"{code}{str(start)[:4].zfill(4)}"
+    for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
+        site_id = f"{prefix}{letter}1"
+        if site_id not in taken:
+            return site_id
+    raise ValueError(f"No free site ID left for prefix {prefix}")
+
+
+def open_repository(db) -> sqlite3.Connection:
+    """Open (creating if necessary) the repository database ``db``."""
+    conn = sqlite3.connect(str(db), timeout=60, isolation_level=None)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _get_meta(conn: sqlite3.Connection, key: str, default: int = 0) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return int(row[0]) if row else default
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value: int) -> None:
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def import_master(bed, db) -> int:
+    """Seed repository ``db`` from a master BED; return the number of sites.
+
+    hs1 spans are merged per site exactly as ``create_l1_db._parse_bed``
+    does: the smallest start and largest end seen for the site.
+    """
+    conn = open_repository(db)
+    sites: Dict[str, List] = {}
+    calls = []
+    for fields in bed_rows(bed):
+        if len(fields) < 10:
+            continue
+        site_id, sample, hap, status, lineage, site_lineage = fields[:6]
+        hs1_coord = fields[9]
+        chrom, start, end, strand = parse_hs1_coord(hs1_coord)
+        site = sites.get(site_id)
+        if site is None:
+            index = int(fields[10]) if len(fields) > 10 else len(sites) + 1
+            site = sites[site_id] = [index, site_lineage, chrom, start, end, strand, 0, 0]
+        else:
+            site[3] = min(site[3], start)
+            site[4] = max(site[4], end)
+        site[6] += 1
+        site[7] += status == "intact"
+        calls.append((site_id, sample, hap, status, lineage, fields[8], hs1_coord))
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO sites VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(k, *v) for k, v in sites.items()],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO calls (site_id, sample, haplotype, status, lineage, assembly_info, hs1_coord)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            calls,
+        )
+        max_span = max((v[4] - v[3] for v in sites.values()), default=0)
+        _set_meta(conn, "max_span", max(max_span, _get_meta(conn, "max_span")))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return len(sites)
+
+
+def read_module1(path) -> Iterator[Dict[str, str]]:
+    """Yield carrier calls from a module 1 ``HapLongLINErRM.txt`` table."""
+    with open(path) as fh:
+        for line in fh:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            key, ref = fields[0], fields[1]
+            *_, name, status = key.rsplit("_", 2)
+            if ref.startswith("NA_") or ref.endswith("_NA"):
+                continue
+            try:
+                chrom, start, end, strand = parse_hs1_coord(ref)
+            except ValueError:
+                continue
+            yield {
+                "key": key,
+                "lineage": name,
+                "status": status,
+                "chrom": chrom,
+                "start": start,
+                "end": end,
+                "strand": strand,
+            }
+
+
+def read_module2(path) -> Iterator[Dict[str, str]]:
+    """Yield calls from a module 2 BED, keyed by HPRC anchor name."""
+    with open(path) as fh:
+        for line in fh:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 8:
+                continue
+            chrom, start, end, name, length, strand, status, l1flag = fields[:8]
+            carrier = status == "present" or l1flag == "L1"
+            yield {
+                "key": f"{chrom}_{start}_{end}_{strand}_{length}_{name}_{status}",
+                "site_id": name,
+                "status": "present" if carrier else status,
+                "carrier": carrier,
+            }
+
+
+def is_module2(path) -> bool:
+    """Return whether ``path`` is a module 2 BED rather than a module 1 table."""
+    with open(path) as fh:
+        for line in fh:
+            if line.strip():
+                return len(line.rstrip("\n").split("\t")) >= 8
+    return False
+
+
+def _load_anchors(path, names) -> Dict[str, Tuple[str, int, int, str]]:
+    wanted = set(names)
+    return {name: coords for name, coords in anchor_coords(path).items() if name in wanted}
+
+
+def _find_site(conn, chrom, start, end, strand, slop, max_span) -> Optional[Tuple]:
+    """Return the site overlapping ``start-end`` (+/- ``slop``) on ``strand``.
+
+    The ``sites_pos`` index bounds the scan to starts within ``max_span +
+    slop`` of the query, so the lookup cost does not grow with the cohort.
+    """
+    return conn.execute(
+        "SELECT site_id, start, end FROM sites WHERE chrom = ? AND strand = ?"
+        " AND start BETWEEN ? AND ? AND end >= ?"
+        " ORDER BY ABS(start - ?) LIMIT 1",
+        (chrom, strand, start - max_span - slop, end + slop, start - slop, start),
+    ).fetchone()
+
+
+def _fasta_key(header: str) -> Tuple[str, int, int]:
+    """Return ``(chrom, start, end)`` from a seqtk ``chrom:start-end`` header."""
+    name = header.split()[0]
+    for suffix in ("(+)", "(-)"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    chrom, _, span = name.rpartition(":")
+    start, _, end = span.partition("-")
+    return chrom, int(start) - 1, int(end)
+
+
+def _read_fasta_records(path) -> Dict[Tuple[str, int, int], str]:
+    from .utils import iter_fasta
+
+    records = {}
+    for header, seq in iter_fasta(path):
+        try:
+            records[_fasta_key(header)] = seq
+        except ValueError:
+            continue
+    return records
+
+
+def append_sample(
+    db,
+    table,
+    sample: str,
+    haplotype: str,
+    fasta=None,
+    reference="data/L1rp.fa",
+    anchors=ANCHOR_BED,
+    lineages: Iterable[str] = YOUNG_L1,
+    slop: int = 100,
+) -> Dict[str, int]:
+    """Ingest one haplotype's module 1 or module 2 output into ``db``.
+
+    Only the sites carried by (or previously recorded for) this haplotype are
+    touched, so the cost is independent of cohort size. Re-appending the same
+    haplotype replaces its previous calls: calls missing from the new table
+    are removed and leave their sites' frequencies. Module 1 rows are matched to
+    existing sites by hs1 overlap and strand, and unmatched rows open new
+    sites. Module 2 rows are matched by anchor name. When ``fasta`` (e.g. the
+    module 1 ``FL.fa``) is given, each call's sequence is stored as a CIGAR
+    against ``reference``. Everything is applied in a single transaction.
+
+    Returns counts of ``added``, ``updated``, ``removed`` calls,
+    ``duplicates`` (further rows of the table that map to a site already
+    called from it, which are skipped) and ``new_sites``.
+    """
+    haplotype = HAPLOTYPES[str(haplotype)]
+    lineages = set(lineages)
+    conn = open_repository(db)
+    counts = {"added": 0, "updated": 0, "removed": 0, "duplicates": 0, "new_sites": 0}
+
+    sequences = _read_fasta_records(fasta) if fasta else {}
+    ref_seq = None
+    if sequences:
+        from .store_l1_diffs import _best_alignment
+
+        ref_seq = next(fasta_records(reference))[1]
+
+    module2 = is_module2(table)
+    rows = list(read_module2(table) if module2 else read_module1(table))
+    anchor_coords = _load_anchors(anchors, [r["site_id"] for r in rows]) if module2 else {}
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        max_span = _get_meta(conn, "max_span")
+        next_index = (conn.execute("SELECT MAX(site_index) FROM sites").fetchone()[0] or 0) + 1
+        previous = {
+            r[0] for r in conn.execute(
+                "SELECT site_id FROM calls WHERE sample = ? AND haplotype = ?", (sample, haplotype)
+            )
+        }
+        # Sites called from this table; a second row for one of them is a duplicate
+        called = set()
+        for row in rows:
+            if module2:
+                site_id = row["site_id"]
+                if site_id in called:
+                    counts["duplicates"] += 1
+                    continue
+                site = conn.execute(
+                    "SELECT chrom, start, end, strand, site_lineage FROM sites WHERE site_id = ?",
+                    (site_id,),
+                ).fetchone()
+                if not row["carrier"]:
+                    # The haplotype lacks this L1: drop any earlier call.
+                    counts["removed"] += _remove_call(conn, site_id, sample, haplotype)
+                    continue
+                if site is None:
+                    if site_id not in anchor_coords:
+                        continue
+                    chrom, start, end, strand = anchor_coords[site_id]
+                    conn.execute(
+                        "INSERT INTO sites (site_id, site_index, site_lineage, chrom, start, end, strand)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (site_id, next_index, "NA", chrom, start, end, strand),
+                    )
+                    next_index += 1
+                    counts["new_sites"] += 1
+                    max_span = max(max_span, end - start)
+                    lineage = "NA"
+                else:
+                    chrom, start, end, strand, lineage = site
+                hs1 = (chrom, start, end, strand)
+                seq = None
+            else:
+                if row["lineage"] not in lineages:
+                    continue
+                chrom, start, end, strand = hs1 = (
+                    row["chrom"], row["start"], row["end"], row["strand"]
+                )
+                lineage = row["lineage"]
+                site = _find_site(conn, chrom, start, end, strand, slop, max_span)
+                if site is None:
+                    taken = {
+                        r[0]
+                        for r in conn.execute(
+                            "SELECT site_id FROM sites WHERE site_id LIKE ?",
+                            (make_site_id(chrom, start, ())[:6] + "%",),
+                        )
+                    }
+                    site_id = make_site_id(chrom, start, taken)
+                    conn.execute(
+                        "INSERT INTO sites (site_id, site_index, site_lineage, chrom, start, end, strand)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (site_id, next_index, lineage, chrom, start, end, strand),
+                    )
+                    next_index += 1
+                    counts["new_sites"] += 1
+                else:
+                    site_id, s_start, s_end = site
+                    if site_id in called:
+                        counts["duplicates"] += 1
+                        continue
+                    if start < s_start or end > s_end:
+                        conn.execute(
+                            "UPDATE sites SET start = ?, end = ? WHERE site_id = ?",
+                            (min(start, s_start), max(end, s_end), site_id),
+                        )
+                        start, end = min(start, s_start), max(end, s_end)
+                max_span = max(max_span, end - start)
+                key_fields = row["key"].rsplit("_", 6)
+                seq = sequences.get((key_fields[0], int(key_fields[1]), int(key_fields[2])))
+
+            orient = cigar = None
+            if seq and ref_seq:
+                orient, cigar = _best_alignment(seq, ref_seq)
+            counts["updated" if _remove_call(conn, site_id, sample, haplotype) else "added"] += 1
+            called.add(site_id)
+            status = row["status"]
+            conn.execute(
+                "INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    site_id,
+                    sample,
+                    haplotype,
+                    status,
+                    lineage,
+                    assembly_tag(sample, haplotype) + row["key"],
+                    "{}_{}_{}_{}".format(*hs1),
+                    orient,
+                    cigar,
+                ),
+            )
+            conn.execute(
+                "UPDATE sites SET present_freq = present_freq + 1,"
+                " intact_freq = intact_freq + ? WHERE site_id = ?",
+                (int(status == "intact"), site_id),
+            )
+        # Calls of an earlier append that the new table no longer contains
+        for site_id in previous - called:
+            counts["removed"] += _remove_call(conn, site_id, sample, haplotype)
+        _set_meta(conn, "max_span", max_span)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return counts
+
+
+def _remove_call(conn, site_id, sample, haplotype) -> int:
+    """Delete one call and take it out of its site's frequencies."""
+    old = conn.execute(
+        "SELECT status FROM calls WHERE site_id = ? AND sample = ? AND haplotype = ?",
+        (site_id, sample, haplotype),
+    ).fetchone()
+    if old is None:
+        return 0
+    conn.execute(
+        "DELETE FROM calls WHERE site_id = ? AND sample = ? AND haplotype = ?",
+        (site_id, sample, haplotype),
+    )
+    conn.execute(
+        "UPDATE sites SET present_freq = present_freq - 1,"
+        " intact_freq = intact_freq - ? WHERE site_id = ?",
+        (int(old[0] == "intact"), site_id),
+    )
+    return 1
+
+
+def export_master(db, out) -> None:
+    """Write the repository in the ``HPRC_L1_hs1_master_v2.bed`` layout.
+
+    Each row keeps the hs1 coordinate recorded for that call; the merged
+    per-site span is available in the ``sites`` table.
+    """
+    conn = open_repository(db)
+    try:
+        query = conn.execute(
+            "SELECT c.site_id, c.sample, c.haplotype, c.status, c.lineage, s.site_lineage,"
+            " s.present_freq, s.intact_freq, c.assembly_info, c.hs1_coord, s.site_index"
+            " FROM calls c JOIN sites s ON c.site_id = s.site_id"
+            " ORDER BY s.site_index, c.sample, c.haplotype"
+        )
+        with open(out, "w") as fh:
+            for row in query:
+                fh.write("\t".join(map(str, row)) + "\n")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the HPRC L1 cohort repository")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="Seed the repository from a master BED")
+    p_import.add_argument("bed")
+    p_import.add_argument("db")
+    p_append = sub.add_parser("append", help="Add one haplotype's module 1/2 output")
+    p_append.add_argument("db")
+    p_append.add_argument("table")
+    p_append.add_argument("sample")
+    p_append.add_argument("haplotype")
+    p_append.add_argument("--fasta")
+    p_export = sub.add_parser("export", help="Write the repository as a master BED")
+    p_export.add_argument("db")
+    p_export.add_argument("out")
+    args = parser.parse_args()
+    if args.command == "import":
+        print(f"Imported {import_master(args.bed, args.db)} sites")
+    elif args.command == "append":
+        print(append_sample(args.db, args.table, args.sample, args.haplotype, args.fasta))
+    else:
+        export_master(args.db, args.out)
@@ -0,0 +1,23 @@
+"""Per-stage run log (``LOG.txt``) written next to a module's outputs."""
+
+from pathlib import Path
+
+_HEADER = "stage\tinput\tkept\tdropped\tnote\n"
+
+
+class RunLog:
+    """Append one tab-separated line per pipeline stage to ``path``.
+
+    Each line records how many elements entered a stage, how many were
+    passed on and how many were dropped (with a short reason), so that it
+    is visible where loci are lost along the pipeline.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        with open(self.path, "w") as fh:
+            fh.write(_HEADER)
+
+    def stage(self, name: str, total: int, kept: int, note: str = "") -> None:
+        with open(self.path, "a") as fh:
+            fh.write(f"{name}\t{total}\t{kept}\t{total - kept}\t{note}\n")
@@ -0,0 +1,315 @@
+"""Node-local shared-memory store of 2-bit packed genomes.
+
+:meth:`SharedGenome.open` packs a FASTA (see :mod:`haplongliner.twobit`)
+into a POSIX shared-memory segment once per node; every later process that
+opens the same file attaches to the segment instead of reading it again,
+and slices contigs straight out of the shared pages. A 3 Gb assembly takes
+about 750 MB of shared memory however many workers use it, and each worker
+only decodes the bases it asks for.
+
+The segment outlives the process that created it; ``haplongliner seqstore
+drop`` (or :meth:`SharedGenome.unlink`) removes it. Its name is derived from
+the FASTA's path, size and modification time, so an edited FASTA gets a new
+segment rather than stale sequence.
+
+Segment layout: an 8-byte magic, the creator's pid and the length of a JSON
+index (``{"source": ..., "contigs": {name: [length, offset, runs]}}``),
+then the index and the packed contigs. The magic is written last, so a
+segment whose magic is missing is still being filled.
+"""
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections.abc import Mapping
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import twobit
+from .regions import SequenceSource
+from .utils import iter_fasta
+
+_PREFIX = "haplongliner_"
+_MAGIC = b"HLLSEQ01"
+_HEADER = struct.Struct("<8sQQ")
+_SHM_DIR = Path("/dev/shm")
+
+
+def segment_name(fasta) -> str:
+    """Return the shared-memory name for the current version of ``fasta``."""
+    st = os.stat(fasta)
+    key = f"{os.path.realpath(fasta)}\0{st.st_size}\0{st.st_mtime_ns}"
+    return _PREFIX + hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def _segment(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """Open a segment that is not unlinked when this process exits."""
+    try:
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)
+    except TypeError:
+        # Before Python 3.13 every opener registers the segment with the
+        # resource tracker, which unlinks it when the process exits
+        shm = shared_memory.SharedMemory(name, create=create, size=size)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _unlink(shm: shared_memory.SharedMemory) -> None:
+    if sys.version_info < (3, 13):
+        # unlink() also unregisters, which the tracker reports for unknown segments
+        resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+
+
+def _shm_free() -> Optional[int]:
+    """Free bytes in the shared-memory filesystem, or ``None`` if unknown."""
+    try:
+        st = os.statvfs(_SHM_DIR)
+    except OSError:
+        return None
+    return st.f_bavail * st.f_frsize
+
+
+def _data_offset(index_length: int) -> int:
+    """Packed data starts at the first 8-byte boundary after the index."""
+    return -(-(_HEADER.size + index_length) // 8) * 8
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedSequence:
+    """One contig of a :class:`SharedGenome`; slicing returns a ``str``."""
+
+    def __init__(self, packed: memoryview, length: int, runs: List[twobit.Run]) -> None:
+        self.packed = packed
+        self.runs = [tuple(run) for run in runs]
+        self._run_starts = [run[0] for run in self.runs]
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, step = key.indices(self._length)
+            if step != 1:
+                return twobit.unpack(self.packed, self._length, self.runs)[key]
+            return twobit.unpack_slice(self.packed, start, max(start, end), self.runs, self._run_starts)
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError("sequence index out of range")
+        return twobit.unpack_slice(self.packed, key, key + 1, self.runs, self._run_starts)
+
+    def __str__(self) -> str:
+        return self[:]
+
+
+class SharedGenome(SequenceSource, Mapping):
+    """Read-only ``contig -> SharedSequence`` mapping backed by a shared-memory segment.
+
+    Also usable wherever a :class:`~haplongliner.regions.FastaIndex` is
+    (``length``, ``fetch``, ``write_bed``).
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, index: dict, data_offset: int) -> None:
+        self.shm = shm
+        self.name = shm.name.lstrip("/")
+        self.source = index["source"]
+        self.contigs: Dict[str, Tuple[int, int, List]] = {
+            name: tuple(entry) for name, entry in index["contigs"].items()
+        }
+        self._data_offset = data_offset
+        self._sequences: Dict[str, SharedSequence] = {}
+        # Whether this process created the segment (see :meth:`open`)
+        self.created = False
+
+    @classmethod
+    def create(cls, fasta, name: Optional[str] = None) -> "SharedGenome":
+        """Pack ``fasta`` (plain or gzipped) into a new segment.
+
+        Raises :class:`FileExistsError` if the segment already exists and
+        :class:`OSError` (``ENOSPC``) if it would not fit in ``/dev/shm``,
+        where filling it would otherwise kill the process with ``SIGBUS``
+        (e.g. Docker's default 64 MB).
+        """
+        name = name or segment_name(fasta)
+        packed: List[bytes] = []
+        contigs: Dict[str, list] = {}
+        offset = 0
+        for header, seq in iter_fasta(fasta):
+            data, runs = twobit.pack(seq)
+            contigs[header.split()[0]] = [len(seq), offset, runs]
+            packed.append(data)
+            offset += len(data)
+        index = json.dumps({"source": os.path.realpath(fasta), "contigs": contigs}).encode()
+        data_offset = _data_offset(len(index))
+        size = data_offset + offset
+        free = _shm_free()
+        if free is not None and size > free:
+            raise OSError(errno.ENOSPC, f"{size} bytes needed for {fasta}, {free} free in {_SHM_DIR}")
+        shm = _segment(name, create=True, size=size)
+        try:
+            _HEADER.pack_into(shm.buf, 0, bytes(8), os.getpid(), len(index))
+            shm.buf[_HEADER.size:_HEADER.size + len(index)] = index
+            pos = data_offset
+            for data in packed:
+                shm.buf[pos:pos + len(data)] = data
+                pos += len(data)
+            shm.buf[:8] = _MAGIC
+        except BaseException:
+            shm.close()
+            _unlink(shm)
+            raise
+        genome = cls(shm, json.loads(index), data_offset)
+        genome.created = True
+        return genome
+
+    @classmethod
+    def attach(cls, name: str, timeout: float = 3600) -> "SharedGenome":
+        """Attach to the segment ``name``, waiting up to ``timeout`` s for it to be filled.
+
+        Raises :class:`FileNotFoundError` if there is no such segment and
+        :class:`RuntimeError` if its creator died before filling it.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                shm = _segment(name)
+            except ValueError:
+                # Created but not sized yet
+                shm = None
+            if shm is not None:
+                magic, pid, index_length = _HEADER.unpack_from(shm.buf)
+                if magic == _MAGIC:
+                    index = json.loads(bytes(shm.buf[_HEADER.size:_HEADER.size + index_length]))
+                    return cls(shm, index, _data_offset(index_length))
+                shm.close()
+                if pid and not _alive(pid):
+                    raise RuntimeError(
+                        f"Shared sequence store {name} was left incomplete; "
+                        f"remove it with 'haplongliner seqstore drop'"
+                    )
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Shared sequence store {name} was not filled within {timeout:g} s")
+            time.sleep(0.2)
+
+    @classmethod
+    def find(cls, fasta) -> Optional["SharedGenome"]:
+        """Attach to the segment of ``fasta`` if one has been loaded, else return ``None``."""
+        try:
+            return cls.attach(segment_name(fasta))
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def open(cls, fasta) -> "SharedGenome":
+        """Attach to the segment of ``fasta``, creating it if this is the first process to ask.
+
+        First callers serialize on a lock file, so the FASTA is packed once.
+        """
+        name = segment_name(fasta)
+        with open(Path(tempfile.gettempdir()) / f"{name}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return cls.attach(name)
+            except FileNotFoundError:
+                return cls.create(fasta, name)
+
+    def __getitem__(self, name: str) -> SharedSequence:
+        seq = self._sequences.get(name)
+        if seq is None:
+            length, _, runs = self.contigs[name]
+            seq = SharedSequence(self.view(name), length, runs)
+            self._sequences[name] = seq
+        return seq
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.contigs)
+
+    def __len__(self) -> int:
+        return len(self.contigs)
+
+    def __contains__(self, name) -> bool:
+        return name in self.contigs
+
+    def view(self, name: str) -> memoryview:
+        """Return the packed bytes of ``name`` as a zero-copy view of the segment."""
+        length, offset, _ = self.contigs[name]
+        start = self._data_offset + offset
+        return self.shm.buf[start:start + (length + 3) // 4]
+
+    def length(self, name: str) -> int:
+        return self.contigs[name][0]
+
+    def fetch(self, name: str, start: int, end: int) -> str:
+        """Return the upper-cased sequence of ``name`` in ``[start, end)`` (clamped)."""
+        return self[name][max(0, start):max(0, end)]
+
+    @property
+    def nbytes(self) -> int:
+        return self.shm.size
+
+    def __enter__(self) -> "SharedGenome":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Detach from the segment; it stays available to other processes.
+
+        Views returned by :meth:`view` must be released first.
+        """
+        for seq in self._sequences.values():
+            seq.packed.release()
+        self._sequences.clear()
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """Remove the segment from the node; attached processes keep their mapping."""
+        _unlink(self.shm)
+
+
+def unlink_segment(name: str) -> None:
+    """Remove segment ``name`` without attaching to it."""
+    shm = _segment(name)
+    shm.close()
+    _unlink(shm)
+
+
+def list_segments() -> List[Tuple[str, str, int]]:
+    """Return ``(name, source FASTA, bytes)`` of the stores on this node."""
+    segments = []
+    if not _SHM_DIR.is_dir():
+        return segments
+    for path in sorted(_SHM_DIR.glob(f"{_PREFIX}*")):
+        try:
+            shm = _segment(path.name)
+        except (OSError, ValueError):
+            continue
+        try:
+            magic, _, index_length = _HEADER.unpack_from(shm.buf)
+            if magic == _MAGIC:
+                source = json.loads(bytes(shm.buf[_HEADER.size:_HEADER.size + index_length]))["source"]
+            else:
+                source = "(incomplete)"
+            segments.append((path.name, source, shm.size))
+        finally:
+            shm.close()
+    return segments
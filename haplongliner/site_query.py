@@ -0,0 +1,228 @@
+"""In-memory interval index over the cohort's L1 sites.
+
+:class:`SiteIndex` loads a master BED (``HPRC_L1_hs1_master_v2.bed`` layout)
+or a cohort repository database once and answers lookups by site ID, by
+sample and by hs1 region. Sites are kept per chromosome in start-sorted
+arrays; an overlap query bisects to the query end and walks back at most
+the longest site span, so a lookup costs a few microseconds and a BED of a
+million intervals is annotated in seconds. :func:`serve` keeps an index
+resident behind a small local HTTP/JSON service.
+"""
+
+import json
+import sqlite3
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from .bundle import bed_rows
+from .repository import parse_hs1_coord
+
+MASTER_BED = Path("data") / "HPRC_L1_hs1_master_v2.bed"
+
+
+class Site(NamedTuple):
+    site_id: str
+    chrom: str
+    start: int
+    end: int
+    strand: str
+    site_lineage: str
+    present_freq: int
+    intact_freq: int
+
+
+class Call(NamedTuple):
+    site_id: str
+    sample: str
+    haplotype: str
+    status: str
+    lineage: str
+    hs1_coord: str
+
+
+def parse_region(region: str) -> Tuple[str, int, int]:
+    """Return 0-based half-open ``(chrom, start, end)`` from ``chrom:start-end``.
+
+    Coordinates are 1-based and inclusive as in samtools/tabix; a bare
+    ``chrom`` covers the whole chromosome.
+    """
+    chrom, sep, span = region.rpartition(":")
+    if not sep:
+        return region, 0, 2 ** 62
+    start, _, end = span.replace(",", "").partition("-")
+    return chrom, int(start) - 1, int(end) if end else int(start)
+
+
+class SiteIndex:
+    """Sites and carrier calls of a cohort, indexed for fast lookups."""
+
+    def __init__(self, sites: Dict[str, Site], calls: List[Call]) -> None:
+        self.sites = sites
+        self.by_sample: Dict[str, List[Call]] = {}
+        self.by_site: Dict[str, List[Call]] = {}
+        for call in calls:
+            self.by_sample.setdefault(call.sample, []).append(call)
+            self.by_site.setdefault(call.site_id, []).append(call)
+        self._chroms: Dict[str, Tuple[array, array, List[str], int]] = {}
+        grouped: Dict[str, List[Site]] = {}
+        for site in sites.values():
+            grouped.setdefault(site.chrom, []).append(site)
+        for chrom, rows in grouped.items():
+            rows.sort(key=lambda s: (s.start, s.end))
+            self._chroms[chrom] = (
+                array("l", (s.start for s in rows)),
+                array("l", (s.end for s in rows)),
+                [s.site_id for s in rows],
+                max(s.end - s.start for s in rows),
+            )
+
+    @classmethod
+    def from_master(cls, bed=MASTER_BED) -> "SiteIndex":
+        """Build the index from a master BED; site spans are merged as in ``import_master``."""
+        sites: Dict[str, list] = {}
+        calls = []
+        for fields in bed_rows(bed):
+            if len(fields) < 10:
+                continue
+            site_id, sample, hap, status, lineage, site_lineage = fields[:6]
+            chrom, start, end, strand = parse_hs1_coord(fields[9])
+            site = sites.get(site_id)
+            if site is None:
+                sites[site_id] = [site_id, chrom, start, end, strand, site_lineage,
+                                  int(fields[6]), int(fields[7])]
+            else:
+                site[2] = min(site[2], start)
+                site[3] = max(site[3], end)
+            calls.append(Call(site_id, sample, hap, status, lineage, fields[9]))
+        return cls({k: Site(*v) for k, v in sites.items()}, calls)
+
+    @classmethod
+    def from_repository(cls, db) -> "SiteIndex":
+        """Build the index from a cohort repository created by :mod:`haplongliner.repository`."""
+        conn = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+        try:
+            sites = {
+                row[0]: Site(*row)
+                for row in conn.execute(
+                    "SELECT site_id, chrom, start, end, strand, site_lineage, present_freq, intact_freq FROM sites"
+                )
+            }
+            calls = [
+                Call(*row)
+                for row in conn.execute(
+                    "SELECT site_id, sample, haplotype, status, lineage, hs1_coord FROM calls"
+                )
+            ]
+        finally:
+            conn.close()
+        return cls(sites, calls)
+
+    def site(self, site_id: str) -> List[Site]:
+        site = self.sites.get(site_id)
+        return [site] if site else []
+
+    def sample(self, sample: str) -> List[Call]:
+        return self.by_sample.get(sample, [])
+
+    def overlap(self, chrom: str, start: int, end: int) -> List[Site]:
+        """Return the sites overlapping the 0-based half-open ``start-end``, by start."""
+        entry = self._chroms.get(chrom)
+        if entry is None:
+            return []
+        starts, ends, ids, max_span = entry
+        hits = []
+        i = bisect_left(starts, end) - 1
+        while i >= 0 and starts[i] > start - max_span:
+            if ends[i] > start:
+                hits.append(ids[i])
+            i -= 1
+        return [self.sites[site_id] for site_id in reversed(hits)]
+
+    def annotate(self, rows) -> Iterator[List[str]]:
+        """Append site IDs and present/intact frequencies to each BED row.
+
+        Each of the three added columns holds a comma-separated value per
+        overlapping site, or ``.`` when no site overlaps.
+        """
+        for fields in rows:
+            hits = self.overlap(fields[0], int(fields[1]), int(fields[2]))
+            if hits:
+                fields = fields + [
+                    ",".join(s.site_id for s in hits),
+                    ",".join(str(s.present_freq) for s in hits),
+                    ",".join(str(s.intact_freq) for s in hits),
+                ]
+            else:
+                fields = fields + [".", ".", "."]
+            yield fields
+
+    def annotate_bed(self, bed, out) -> int:
+        """Write :meth:`annotate` output for ``bed`` to ``out``; return the row count."""
+        count = 0
+        with open(bed) as fh, open(out, "w") as dst:
+            rows = (
+                line.rstrip("\n").split("\t")
+                for line in fh
+                if line.strip() and not line.startswith(("#", "track", "browser"))
+            )
+            for fields in self.annotate(rows):
+                dst.write("\t".join(fields) + "\n")
+                count += 1
+        return count
+
+
+def format_rows(rows) -> Iterator[str]:
+    """Render sites or calls as tab-separated lines."""
+    for row in rows:
+        yield "\t".join(map(str, row))
+
+
+def serve(index: SiteIndex, host: str = "127.0.0.1", port: int = 8765) -> None:
+    """Serve ``index`` over HTTP until interrupted.
+
+    Endpoints return JSON lists: ``/site/<site_id>``, ``/sample/<sample>``
+    (calls, each with its site) and ``/region/<chrom:start-end>``.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import unquote
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            kind, _, value = self.path.split("?")[0].strip("/").partition("/")
+            value = unquote(value)
+            try:
+                if kind == "site":
+                    body = [s._asdict() for s in index.site(value)]
+                elif kind == "sample":
+                    body = [
+                        dict(c._asdict(), site=index.sites[c.site_id]._asdict())
+                        for c in index.sample(value)
+                    ]
+                elif kind == "region":
+                    body = [s._asdict() for s in index.overlap(*parse_region(value))]
+                else:
+                    self.send_error(404, "Use /site/<id>, /sample/<name> or /region/<chrom:start-end>")
+                    return
+            except ValueError as exc:
+                self.send_error(400, str(exc))
+                return
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving {len(index.sites)} sites on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,215 @@
+"""Single-pass module 2 classification for multi-sample (pangenome) VCFs.
+
+Pangenome SV callsets come as one VCF with a genotype column per sample.
+Rather than re-reading it once per haplotype, :func:`parse_multisample_vcf`
+streams it once and splits the DEL/INS calls by the allele carried on each
+haplotype of each sample into compact per-chromosome interval arrays. The
+reference L1 anchors are then classified against the deletions of every
+haplotype in a sorted sweep, using the same ``missing``/``absent`` rule as
+``module2_SV._classify_deletions``.
+"""
+
+import gzip
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .indexed_output import write_indexed_bed
+from .module2_SV import _anchor_coords, _deletion_status
+
+
+class HaplotypeIntervals:
+    """DEL and INS calls carried by one haplotype, as flat per-chromosome arrays.
+
+    Intervals are 0-based half-open; each chromosome keeps parallel
+    ``array('l')`` starts and ends in VCF order.
+    """
+
+    __slots__ = ("deletions", "insertions")
+
+    def __init__(self) -> None:
+        self.deletions: Dict[str, Tuple[array, array]] = {}
+        self.insertions: Dict[str, Tuple[array, array]] = {}
+
+    @staticmethod
+    def _add(table: Dict[str, Tuple[array, array]], chrom: str, start: int, end: int) -> None:
+        arrays = table.get(chrom)
+        if arrays is None:
+            arrays = table[chrom] = (array("l"), array("l"))
+        arrays[0].append(start)
+        arrays[1].append(end)
+
+    def add_deletion(self, chrom: str, start: int, end: int) -> None:
+        self._add(self.deletions, chrom, start, end)
+
+    def add_insertion(self, chrom: str, start: int, end: int) -> None:
+        self._add(self.insertions, chrom, start, end)
+
+    def count(self, kind: str) -> int:
+        return sum(len(starts) for starts, _ in getattr(self, kind).values())
+
+
+def _info(info: str) -> Tuple[Optional[str], Optional[int]]:
+    svtype = end = None
+    for item in info.split(";"):
+        if item.startswith("SVTYPE="):
+            svtype = item[7:]
+        elif item.startswith("END="):
+            end = int(item[4:]) - 1
+    return svtype, end
+
+
+def _alleles(gt: str) -> List[bool]:
+    """Return, per haplotype in ``gt``, whether it carries a non-reference allele."""
+    return [allele not in ("0", ".", "") for allele in gt.replace("|", "/").split("/")]
+
+
+def parse_multisample_vcf(vcf, samples: Optional[Iterable[str]] = None) -> Dict[Tuple[str, str], HaplotypeIntervals]:
+    """Read ``vcf`` once; return ``(sample, haplotype) -> HaplotypeIntervals``.
+
+    Haplotypes are named ``"1"`` and ``"2"`` after their position in the
+    genotype (haploid genotypes give only ``"1"``). ``samples`` restricts parsing to the given sample columns.
+    """
+    wanted = set(samples) if samples else None
+    opener = gzip.open if str(vcf).endswith(".gz") else open
+    haplotypes: Dict[Tuple[str, str], HaplotypeIntervals] = {}
+    columns: List[Tuple[int, str]] = []
+    with opener(vcf, "rt") as fh:
+        for line in fh:
+            if line.startswith("##"):
+                continue
+            if line.startswith("#"):
+                header = line.rstrip("\n").split("\t")
+                columns = [
+                    (i, name) for i, name in enumerate(header[9:], 9)
+                    if wanted is None or name in wanted
+                ]
+                if wanted and len(columns) < len(wanted):
+                    missing = wanted - {name for _, name in columns}
+                    raise ValueError(f"Samples not found in {vcf}: {', '.join(sorted(missing))}")
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 10:
+                continue
+            svtype, end = _info(fields[7])
+            if svtype == "DEL" and end is not None:
+                add = HaplotypeIntervals.add_deletion
+            elif svtype == "INS":
+                add = HaplotypeIntervals.add_insertion
+            else:
+                continue
+            chrom = fields[0]
+            start = int(fields[1]) - 1
+            if svtype == "INS":
+                end = start + 1
+            fmt = fields[8].split(":")
+            if "GT" not in fmt:
+                continue
+            gt_index = fmt.index("GT")
+            for col, sample in columns:
+                values = fields[col].split(":")
+                gt = values[gt_index] if gt_index < len(values) else "."
+                for hap, carried in enumerate(_alleles(gt), 1):
+                    key = (sample, str(hap))
+                    intervals = haplotypes.get(key)
+                    if intervals is None:
+                        # Every haplotype seen in a genotype gets an entry,
+                        # even if it never carries a call
+                        intervals = haplotypes[key] = HaplotypeIntervals()
+                    if carried:
+                        add(intervals, chrom, start, end)
+    return haplotypes
+
+
+class _DeletionIndex:
+    """Per-chromosome deletions sorted by start for overlap queries."""
+
+    def __init__(self, intervals: HaplotypeIntervals) -> None:
+        self.chroms = {}
+        for chrom, (starts, ends) in intervals.deletions.items():
+            order = sorted(range(len(starts)), key=starts.__getitem__)
+            sorted_starts = array("l", (starts[i] for i in order))
+            max_len = max((ends[i] - starts[i] for i in order), default=0)
+            self.chroms[chrom] = (sorted_starts, order, starts, ends, max_len)
+
+    def status(self, chrom: str, start: int, end: int) -> str:
+        """Classify an anchor as ``present``, ``missing`` or ``absent``.
+
+        Like the ``bedtools intersect`` based classification, the last
+        overlapping deletion in VCF order decides.
+        """
+        entry = self.chroms.get(chrom)
+        if entry is None:
+            return "present"
+        sorted_starts, order, starts, ends, max_len = entry
+        last = -1
+        i = bisect_left(sorted_starts, end) - 1
+        while i >= 0 and sorted_starts[i] > start - max_len:
+            idx = order[i]
+            if ends[idx] > start and idx > last:
+                last = idx
+            i -= 1
+        if last < 0:
+            return "present"
+        return _deletion_status(start, end, starts[last], ends[last])
+
+
+def classify_haplotypes(anchors: Dict[str, Tuple[str, int, int, str]],
+                        haplotypes: Dict[Tuple[str, str], HaplotypeIntervals]) -> Dict[Tuple[str, str], Dict[str, str]]:
+    """Return ``(sample, haplotype) -> {anchor: status}`` for every haplotype."""
+    result = {}
+    for key, intervals in haplotypes.items():
+        index = _DeletionIndex(intervals)
+        result[key] = {
+            name: index.status(chrom, start, end)
+            for name, (chrom, start, end, _) in anchors.items()
+        }
+    return result
+
+
+def run_module2_multi(sv_file: str, output_dir: str, samples: Optional[Iterable[str]] = None,
+                      bgzip: bool = False) -> Dict[Tuple[str, str], Dict[str, str]]:
+    """Classify the reference L1 anchors for every haplotype of a multi-sample VCF.
+
+    Writes one module 2 style BED per haplotype (``<sample>.<haplotype>.bed``,
+    in reference coordinates) and a ``L1_status_matrix.tsv`` with one row per
+    anchor and one column per haplotype. With ``bgzip`` each BED also gets a
+    sorted, tabix-indexed ``.bed.gz`` copy.
+    """
+    outdir = Path(output_dir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    print(f"Module 2 (multi-sample) running with:\n  SV: {sv_file}\n  Output Dir: {outdir}")
+
+    print("[STEP 1] Splitting SV genotypes by sample and haplotype")
+    haplotypes = parse_multisample_vcf(sv_file, samples)
+    for (sample, hap), intervals in sorted(haplotypes.items()):
+        print(
+            f"[INFO] {sample} haplotype {hap}: {intervals.count('deletions')} DEL, "
+            f"{intervals.count('insertions')} INS"
+        )
+
+    print("[STEP 2] Classifying reference L1 anchors")
+    anchors = _anchor_coords(Path("data") / "HPRC_L1_hs_v2_v2fl.bed")
+    statuses = classify_haplotypes(anchors, haplotypes)
+
+    keys = sorted(statuses)
+    for sample, hap in keys:
+        status = statuses[(sample, hap)]
+        rows = [
+            [chrom, str(start), str(end), name, str(end - start), strand, status[name], "NA"]
+            for name, (chrom, start, end, strand) in anchors.items()
+        ]
+        bed = outdir / f"{sample}.{hap}.bed"
+        with open(bed, "w") as out:
+            out.writelines("\t".join(row) + "\n" for row in rows)
+        if bgzip:
+            write_indexed_bed(rows, f"{bed}.gz")
+
+    with open(outdir / "L1_status_matrix.tsv", "w") as out:
+        out.write("\t".join(["anchor"] + [f"{s}.{h}" for s, h in keys]) + "\n")
+        for name in anchors:
+            out.write("\t".join([name] + [statuses[key][name] for key in keys]) + "\n")
+
+    print(f"Module 2 (multi-sample) completed for {len(keys)} haplotypes. Results in {outdir}")
+    return statuses
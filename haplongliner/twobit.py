@@ -0,0 +1,71 @@
+"""2-bit nucleotide packing.
+
+Sequences are upper-cased and packed four bases per byte (A=0, C=1, G=2,
+T=3, first base in the high bits). Anything other than ACGT (N, IUPAC
+codes) is recorded as runs of ``(start, length, character)`` that are
+patched back in when unpacking.
+"""
+
+import re
+from bisect import bisect_right
+from typing import List, Optional, Sequence, Tuple
+
+# Every byte other than ACGT is encoded as A (0); runs restore it
+_ENCODE = bytes(max(b"ACGT".find(c), 0) for c in range(256))
+# Codes 0-3 moved to each of the four 2-bit slots of a byte
+_SLOTS = [bytes.maketrans(b"\x00\x01\x02\x03", bytes(c << shift for c in range(4))) for shift in (6, 4, 2, 0)]
+# Four decoded bases for every packed byte value
+_QUADS = [
+    bytes(b"ACGT"[(v >> shift) & 3] for shift in (6, 4, 2, 0))
+    for v in range(256)
+]
+_NON_ACGT = re.compile(rb"([^ACGT])\1*")
+
+Run = Tuple[int, int, str]
+
+
+def pack(seq: str) -> Tuple[bytes, List[Run]]:
+    """Return ``(packed, runs)`` for ``seq``; ``len(packed) == ceil(len/4)``."""
+    raw = seq.upper().encode("ascii")
+    runs: List[Run] = [(m.start(), m.end() - m.start(), chr(m.group(1)[0])) for m in _NON_ACGT.finditer(raw)]
+    codes = raw.translate(_ENCODE) + bytes(-len(raw) % 4)
+    # OR the four slots of every byte together as big integers (C speed)
+    value = 0
+    for slot, table in enumerate(_SLOTS):
+        value |= int.from_bytes(codes[slot::4].translate(table), "big")
+    return value.to_bytes(len(codes) // 4, "big"), runs
+
+
+def unpack(packed: Sequence[int], length: int, runs: Sequence[Run] = ()) -> str:
+    """Inverse of :func:`pack`; ``packed`` may be any bytes-like buffer."""
+    out = bytearray(b"".join(map(_QUADS.__getitem__, packed)))
+    del out[length:]
+    for start, run_length, char in runs:
+        out[start:start + run_length] = char.encode("ascii") * run_length
+    return out.decode("ascii")
+
+
+def unpack_slice(packed: Sequence[int], start: int, end: int, runs: Sequence[Run] = (),
+                 run_starts: Optional[Sequence[int]] = None) -> str:
+    """Return bases ``[start, end)`` of a packed sequence, decoding only their bytes.
+
+    ``end`` must not exceed the sequence length. ``run_starts`` (the
+    starts of ``runs``, which are sorted) limits the run lookup to the
+    runs that can overlap the slice.
+    """
+    if end <= start:
+        return ""
+    out = bytearray(b"".join(map(_QUADS.__getitem__, packed[start // 4:(end + 3) // 4])))
+    offset = start - start % 4
+    del out[end - offset:]
+    del out[:start - offset]
+    if runs:
+        if run_starts is None:
+            run_starts = [run[0] for run in runs]
+        # Runs do not overlap, so only the one before ``start`` can reach into the slice
+        for i in range(max(0, bisect_right(run_starts, start) - 1), bisect_right(run_starts, end - 1)):
+            run_start, run_length, char = runs[i]
+            lo, hi = max(run_start, start), min(run_start + run_length, end)
+            if lo < hi:
+                out[lo - start:hi - start] = char.encode("ascii") * (hi - lo)
+    return out.decode("ascii")
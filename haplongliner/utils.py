@@ -1,10 +1,19 @@
+import gzip
 import shutil
 import sys
 from pathlib import Path
 
 def check_dependencies():
-    """Ensure required external tools are available."""
-    tools = ["seqtk", "minimap2", "getorf", "blastp"]
+    """Ensure required external tools are available.
+
+    ``blastp`` is checked when ORFs are aligned with it, as the in-process
+    aligner does not need BLAST+.
+    """
+    require_tools("seqtk", "minimap2", "getorf")
+
+
+def require_tools(*tools):
+    """Exit with an error if any of ``tools`` is not on the PATH."""
     missing = [tool for tool in tools if shutil.which(tool) is None]
     if missing:
         sys.exit(
@@ -28,3 +37,22 @@ def verify_blast_db(db_prefix):
             )
 
 
+
+
+def iter_fasta(path):
+    """Yield ``(header, sequence)`` pairs from a plain or gzipped FASTA."""
+    opener = gzip.open if str(path).endswith(".gz") else open
+    header = None
+    chunks = []
+    with opener(path, "rt") as fh:
+        for line in fh:
+            line = line.strip()
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(chunks)
+                header = line[1:]
+                chunks = []
+            elif header is not None:
+                chunks.append(line)
+    if header is not None:
+        yield header, "".join(chunks)
@@ -0,0 +1,305 @@
+"""Lease-based work queue for spreading cohort runs across nodes.
+
+Jobs are ``(sample, haplotype, module)`` triples with the module's
+parameters, stored in an SQLite file that every worker can reach (e.g. on
+shared storage). A worker claims a job by taking a time-limited lease and
+keeps it alive with heartbeats while the module runs. If a node dies, its
+lease expires and the job is handed to another worker. Results are written
+to a private staging path and moved into place with an atomic rename in the
+same transaction that checks the lease and marks the job done, so a
+half-written output, or one from a worker whose lease was taken over, is
+never visible.
+"""
+
+import csv
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from .constants import REFERENCES
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sample TEXT NOT NULL,
+    haplotype TEXT NOT NULL,
+    module TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    updated REAL,
+    UNIQUE (sample, haplotype, module)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+"""
+
+MODULES = ("rm", "sv")
+
+
+class WorkQueue:
+    """SQLite-backed job queue with leases."""
+
+    def __init__(self, path) -> None:
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path, timeout=300, isolation_level=None)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _transaction(self, sql: str, args=()) -> sqlite3.Cursor:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.conn.execute(sql, args)
+            self.conn.execute("COMMIT")
+            return cur
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, sample: str, haplotype: str, module: str, params: Dict[str, str],
+                max_attempts: int = 3) -> bool:
+        """Add a job; returns ``False`` if the same job is already queued."""
+        if module not in MODULES:
+            raise ValueError(f"Unknown module '{module}' (expected one of {', '.join(MODULES)})")
+        cur = self._transaction(
+            "INSERT OR IGNORE INTO jobs (sample, haplotype, module, params, max_attempts, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (sample, haplotype, module, json.dumps(params), max_attempts, time.time()),
+        )
+        return cur.rowcount > 0
+
+    def claim(self, worker: str, lease: float) -> Optional[Dict]:
+        """Lease the next queued (or abandoned) job to ``worker``."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT id, sample, haplotype, module, params, attempts FROM jobs"
+                " WHERE (state = 'queued' OR (state = 'running' AND lease_expires < ?))"
+                " AND attempts < max_attempts ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                # Abandoned jobs that used up their attempts are failed for good
+                self.conn.execute(
+                    "UPDATE jobs SET state = 'failed', error = 'lease expired', updated = ?"
+                    " WHERE state = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                    (now, now),
+                )
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET state = 'running', lease_owner = ?, lease_expires = ?,"
+                " attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + lease, now, row[0]),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        job_id, sample, haplotype, module, params, attempts = row
+        return {
+            "id": job_id,
+            "sample": sample,
+            "haplotype": haplotype,
+            "module": module,
+            "params": json.loads(params),
+            "attempt": attempts + 1,
+        }
+
+    def heartbeat(self, job_id: int, worker: str, lease: float) -> bool:
+        """Extend ``worker``'s lease; ``False`` means the lease was lost."""
+        cur = self._transaction(
+            "UPDATE jobs SET lease_expires = ?, updated = ?"
+            " WHERE id = ? AND lease_owner = ? AND state = 'running'",
+            (time.time() + lease, time.time(), job_id, worker),
+        )
+        return cur.rowcount > 0
+
+    def complete(self, job_id: int, worker: str, publish: Optional[Callable[[], None]] = None) -> bool:
+        """Mark the job done if ``worker`` still holds its lease; ``False`` means it was lost.
+
+        ``publish`` runs after the lease check, inside the same transaction,
+        so no other worker can claim the job between the check and the
+        result being moved into place.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.conn.execute(
+                "UPDATE jobs SET state = 'done', lease_expires = NULL, error = NULL, updated = ?"
+                " WHERE id = ? AND lease_owner = ? AND state = 'running'",
+                (time.time(), job_id, worker),
+            )
+            held = cur.rowcount > 0
+            if held and publish is not None:
+                publish()
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return held
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+        """Release a failed job: re-queue it, or mark it failed when out of attempts."""
+        self._transaction(
+            "UPDATE jobs SET state = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,"
+            " lease_owner = NULL, lease_expires = NULL, error = ?, updated = ?"
+            " WHERE id = ? AND lease_owner = ?",
+            (error, time.time(), job_id, worker),
+        )
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+
+def enqueue_manifest(queue_path, manifest, max_attempts: int = 3) -> int:
+    """Queue every row of a TSV manifest; return the number of new jobs.
+
+    The manifest needs ``sample``, ``haplotype`` and ``module`` (``rm`` or
+    ``sv``) columns; every other column is passed to the module as a
+    parameter: ``input``, ``mask``, ``reference`` and ``out`` for ``rm``;
+    ``input``, ``sv``, ``l1ref`` and ``out`` for ``sv``; either may set
+    ``aligner``, ``decompress_cache``, ``metrics`` and ``regions``; ``rm``
+    jobs may set ``filter`` and ``rescue_flanks`` and ``sv`` jobs
+    ``anchor_store``.
+    """
+    queue = WorkQueue(queue_path)
+    added = 0
+    try:
+        for sample, haplotype, module, params in read_job_manifest(manifest):
+            added += queue.enqueue(sample, haplotype, module, params, max_attempts)
+    finally:
+        queue.close()
+    return added
+
+
+def read_job_manifest(manifest) -> Iterator[Tuple[str, str, str, Dict[str, str]]]:
+    """Yield ``(sample, haplotype, module, params)`` for each row of a job manifest."""
+    with open(manifest, newline="") as fh:
+        for row in csv.DictReader(fh, delimiter="\t"):
+            sample = row.pop("sample")
+            haplotype = row.pop("haplotype")
+            module = row.pop("module")
+            yield sample, haplotype, module, {k: v for k, v in row.items() if v not in (None, "")}
+
+
+def _publish(staging: Path, final: Path) -> None:
+    """Atomically move a finished output into place, replacing any old one."""
+    old = None
+    if final.exists():
+        old = final.with_name(final.name + f".old-{os.getpid()}")
+        os.replace(final, old)
+    os.replace(staging, final)
+    if old is not None:
+        shutil.rmtree(old) if old.is_dir() else old.unlink()
+
+
+def _run_job(job: Dict, staging: Path, final: Path) -> Path:
+    """Run ``job`` into the ``staging`` directory; return the path to publish."""
+    from .module1_RM import run_module1
+    from .module2_SV import run_module2
+
+    params = dict(job["params"])
+    if job["module"] == "rm":
+        reference = REFERENCES.get(params["reference"], params["reference"])
+        run_module1(
+            params["input"],
+            params["mask"],
+            reference,
+            str(staging),
+            orf_cache=params.get("orf_cache"),
+            liftover_memo=params.get("liftover_memo"),
+            aligner=params.get("aligner", "blastp"),
+            l1_filter=params.get("filter"),
+            rescue_flanks=params.get("rescue_flanks", "").lower() in ("1", "true", "yes"),
+            decompress_cache=params.get("decompress_cache"),
+            metrics=params.get("metrics"),
+            regions=params.get("regions"),
+        )
+        return staging
+    # Module 2 writes intermediates next to its BED, so keep them in staging too
+    staging.mkdir(parents=True, exist_ok=True)
+    run_module2(params["input"], params["sv"], params["l1ref"], str(staging / final.name),
+                aligner=params.get("aligner", "blastp"), decompress_cache=params.get("decompress_cache"),
+                metrics=params.get("metrics"), regions=params.get("regions"),
+                anchor_store=params.get("anchor_store"))
+    return staging / final.name
+
+
+def run_worker(queue_path, worker: str = None, lease: float = 600, heartbeat: float = 60,
+               poll: float = 30, once: bool = False) -> int:
+    """Process jobs from ``queue_path`` until it is drained; return jobs done.
+
+    With ``once`` the worker exits after a single job. While a job runs, a
+    background thread renews the lease every ``heartbeat`` seconds. Running
+    jobs whose lease belongs to another (possibly dead) worker keep the loop
+    polling every ``poll`` seconds until they finish or are re-queued.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    queue = WorkQueue(queue_path)
+    done = 0
+    try:
+        while True:
+            job = queue.claim(worker, lease)
+            if job is None:
+                if once or not queue.counts().get("running"):
+                    return done
+                time.sleep(poll)
+                continue
+
+            final = Path(job["params"]["out"])
+            final.parent.mkdir(parents=True, exist_ok=True)
+            staging = final.with_name(f".{final.name}.{job['id']}.{worker.replace(':', '_')}.partial")
+            print(
+                f"[WORKER {worker}] job {job['id']}: {job['module']} {job['sample']} "
+                f"{job['haplotype']} (attempt {job['attempt']})"
+            )
+
+            stop = threading.Event()
+            lost = threading.Event()
+
+            def beat(job_id=job["id"]):
+                hb_queue = WorkQueue(queue_path)
+                try:
+                    while not stop.wait(heartbeat):
+                        if not hb_queue.heartbeat(job_id, worker, lease):
+                            lost.set()
+                            return
+                finally:
+                    hb_queue.close()
+
+            thread = threading.Thread(target=beat, daemon=True)
+            thread.start()
+            try:
+                result = _run_job(job, staging, final)
+            except Exception:
+                stop.set()
+                thread.join()
+                queue.fail(job["id"], worker, traceback.format_exc(limit=5))
+                print(f"[WORKER {worker}] job {job['id']} failed")
+            else:
+                stop.set()
+                thread.join()
+                if not lost.is_set() and queue.complete(job["id"], worker, lambda: _publish(result, final)):
+                    done += 1
+                else:
+                    print(f"[WORKER {worker}] lease on job {job['id']} lost; discarding result")
+            finally:
+                if staging.exists():
+                    shutil.rmtree(staging) if staging.is_dir() else staging.unlink()
+            if once:
+                return done
+    finally:
+        queue.close()
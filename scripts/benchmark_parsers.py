@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""Benchmark the Python parsing stages against their legacy Perl scripts.
+
+The fixtures in ``tests/`` are scaled up to cohort size by replicating their
+rows onto renamed contigs. Each stage is then run as a separate process in
+both implementations (``python -m haplongliner.<stage>`` and
+``perl legacy/<Script>.pl``), timing wall clock and recording peak RSS.
+Outputs are compared after normalising the documented convention changes
+(0-based starts in ``process_orf``, ``NA`` fields and the
+intact lookup in ``combine_table``). Results can be saved as a baseline; a
+later run at the same ``--scale`` and ``--repeats`` fails when a Python stage
+becomes slower, relative to Perl on the same machine, by more than
+``--tolerance``, or its peak RSS grows by more than ``--memory-tolerance``.
+The two implementations run alternately and times and ratios are medians
+over the repeats. Stages whose median is below ``--min-seconds`` in either
+implementation are dominated by interpreter startup and are reported
+without being gated on time.
+
+Example::
+
+    python scripts/benchmark_parsers.py --scale 20 --baseline scripts/benchmark_baselines.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from statistics import median
+from typing import Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+TESTS = ROOT / "tests"
+LEGACY = ROOT / "legacy"
+
+
+def _scaled_bed(src: Path, dest: Path, scale: int) -> None:
+    """Replicate ``src`` ``scale`` times onto contigs renamed ``<chrom>r<i>``."""
+    rows = [line for line in src.read_text().splitlines() if line.strip()]
+    with open(dest, "w") as out:
+        for i in range(scale):
+            for line in rows:
+                chrom, rest = line.split("\t", 1)
+                out.write(f"{chrom}r{i}\t{rest}\n")
+
+
+def _fl_entries(fl_bed: Path) -> List[Tuple[str, int, int, str]]:
+    entries = []
+    with open(fl_bed) as fh:
+        for line in fh:
+            f = line.split()
+            entries.append((f[0], int(f[1]), int(f[2]), f[5]))
+    return entries
+
+
+def _write_getorf(fl_bed: Path, dest: Path, rng: random.Random) -> None:
+    """Write getorf-style FASTA headers for every L1 in ``fl_bed``.
+
+    The legacy script splits headers on every underscore, so contig names
+    are flattened to keep both implementations comparable.
+    """
+    with open(dest, "w") as out:
+        for chrom, start, end, strand in _fl_entries(fl_bed):
+            name = chrom.replace("_", "")
+            for n in range(1, rng.randint(2, 12)):
+                a = rng.randint(1, 6000)
+                b = a + rng.choice([1, -1]) * rng.randint(90, 3900)
+                out.write(f">{name}_{start + 1}_{end}_{strand}_{n} [{a} - {b}] \nMX\n")
+
+
+def _write_blastp(fl_bed: Path, dest: Path, rng: random.Random) -> None:
+    """Write ``-outfmt '6 std qlen slen sacc'`` rows for every L1."""
+    with open(dest, "w") as out:
+        for chrom, start, end, strand in _fl_entries(fl_bed):
+            for n in range(1, rng.randint(2, 8)):
+                for subject, slen in (("L1rpORF1p", 338), ("L1rpORF2p", 1275)):
+                    if rng.random() < 0.2:
+                        continue
+                    length = rng.randint(30, slen)
+                    intact = rng.random() < 0.5
+                    sstart, send = (1, slen) if intact else (rng.randint(1, 40), length)
+                    out.write(
+                        f"{chrom}_{start + 1}_{end}_{strand}_{n}\t{subject}\t98.5\t{length}\t3\t0\t1\t{length}\t"
+                        f"{sstart}\t{send}\t0.0\t{length * 2}\t{length}\t{slen}\t{subject}\n"
+                    )
+
+
+def _write_minimap(fl_bed: Path, minus: Path, plus: Path, rng: random.Random) -> None:
+    """Write PAF hits for the 2 kb flanks of most L1s in ``fl_bed``."""
+    with open(minus, "w") as mout, open(plus, "w") as pout:
+        for chrom, start, end, strand in _fl_entries(fl_bed):
+            ref = f"chr{rng.randint(1, 22)}"
+            pos = rng.randint(10_000, 200_000_000)
+            ori = rng.choice("+-")
+            for _ in range(rng.randint(0, 3)):
+                aln = rng.randint(100, 2000)
+                target = ref if rng.random() < 0.8 else f"{ref}_decoy"
+                mout.write(
+                    f"{chrom}:{start - 1999}-{start}\t2000\t0\t{aln}\t{ori}\t{target}\t248387328\t"
+                    f"{pos - aln}\t{pos}\t{aln}\t{aln}\t60\n"
+                )
+                pout.write(
+                    f"{chrom}:{end + 1}-{end + 2000}\t2000\t0\t{aln}\t{ori}\t{target}\t248387328\t"
+                    f"{pos + 10}\t{pos + 10 + aln}\t{aln}\t{aln}\t60\n"
+                )
+
+
+# Runs the stage from a small wrapper process so that the reported peak RSS
+# is the stage's own and not inherited from this (larger) process at fork.
+_WRAPPER = (
+    "import resource, subprocess, sys\n"
+    "out = open(sys.argv[1], 'w') if sys.argv[1] else subprocess.DEVNULL\n"
+    "code = subprocess.call(sys.argv[2:], stdout=out)\n"
+    "sys.stderr.write(str(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))\n"
+    "sys.exit(code)\n"
+)
+
+
+def _run(cmd: List[str], stdout_path: Path = None) -> Tuple[float, int]:
+    """Run ``cmd``; return wall seconds and peak RSS in MiB of that process."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", _WRAPPER, str(stdout_path or ""), *cmd],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=proc.stderr)
+    return elapsed, int(proc.stderr.strip().splitlines()[-1]) // 1024
+
+
+def _lines(path: Path) -> List[str]:
+    return sorted(line.rstrip("\n") for line in open(path) if line.strip())
+
+
+def _normalise_process_orf(path: Path) -> List[str]:
+    """Map Python's 0-based ``process_orf`` rows onto ProcessORF.pl's."""
+    rows = []
+    for line in open(path):
+        l1_id, start, end, strand, length, l1_strand = line.split()
+        rows.append(f"{l1_id}\t{int(start) + 1}\t{end}\t{strand}\t{int(length) - 1}\t{l1_strand}")
+    return sorted(rows)
+
+
+def _normalise_combine_table(path: Path) -> List[str]:
+    """Drop the ORF status and unify missing liftover fields.
+
+    CombineTable.pl looks up intact ORFs under a key that still carries the
+    L1 strand, so it never matches getorf-derived names and every locus is
+    reported as ``present``; it also prints empty fields where the Python
+    port writes ``NA``. Everything else must agree.
+    """
+    rows = []
+    for line in open(path):
+        key, ref = line.split()
+        key = key.rsplit("_", 1)[0]
+        ref = "_".join(field or "NA" for field in ref.split("_"))
+        if ref.startswith("NA_NA_NA_"):
+            ref = "NA_NA_NA_NA"
+        rows.append(f"{key}\t{ref}")
+    return sorted(rows)
+
+
+def _stages(work: Path) -> Dict[str, Tuple[List[str], List[str], Path, Path, Callable, Callable]]:
+    """Return ``name -> (python_cmd, perl_cmd, py_out, pl_out, py_norm, pl_norm)``."""
+    py = [sys.executable, "-m"]
+    out = {
+        name: work / f"{name}.pl.out"
+        for name in ("extract_l1", "process_orf", "find_longest_orf", "find_intact_orf", "orf_reducer",
+                     "combine_table")
+    }
+    return {
+        "extract_l1": (
+            py + ["haplongliner.extract_l1", str(work / "rm.bed"), "-o", str(work / "extract_l1.py.out")],
+            ["perl", str(LEGACY / "ExtractL1.pl"), str(work / "rm.bed")],
+            work / "extract_l1.py.out", out["extract_l1"], _lines, _lines,
+        ),
+        "process_orf": (
+            py + ["haplongliner.process_orf", str(work / "orf.fa"), str(work / "process_orf.py.out")],
+            ["perl", str(LEGACY / "ProcessORF.pl"), str(work / "orf.fa")],
+            work / "process_orf.py.out", out["process_orf"], _normalise_process_orf, _lines,
+        ),
+        "find_longest_orf": (
+            py + ["haplongliner.find_longest_orf", str(work / "orf.blastp"), str(work / "find_longest_orf.py.out")],
+            ["perl", str(LEGACY / "FindLongestORF.pl"), str(work / "orf.blastp")],
+            work / "find_longest_orf.py.out", out["find_longest_orf"], _lines, _lines,
+        ),
+        "find_intact_orf": (
+            py + ["haplongliner.find_intact_orf", str(work / "combine.blastp"), str(work / "find_intact_orf.py.out")],
+            ["perl", str(LEGACY / "FindIntactORF.pl"), str(work / "combine.blastp")],
+            work / "find_intact_orf.py.out", out["find_intact_orf"], _lines, _lines,
+        ),
+        # The streaming reducer module 1 uses in place of the two stages above
+        "orf_reducer": (
+            py + ["haplongliner.orf_reducer", str(work / "orf_reducer.longest.out"), str(work / "orf_reducer.py.out"),
+                  str(work / "orf.blastp")],
+            ["sh", "-c", f"perl {LEGACY / 'FindLongestORF.pl'} {work / 'orf.blastp'} | perl {LEGACY / 'FindIntactORF.pl'}"],
+            work / "orf_reducer.py.out", out["orf_reducer"], _lines, _lines,
+        ),
+        "combine_table": (
+            py + ["haplongliner.combine_table", str(work / "plus.paf"), str(work / "minus.paf"),
+                  str(work / "intact.blastp"), str(work / "FL.bed"), str(work / "combine_table.py.out")],
+            ["perl", str(LEGACY / "CombineTable.pl"), str(work / "plus.paf"), str(work / "minus.paf"),
+             str(work / "intact.blastp"), str(work / "FL.bed")],
+            work / "combine_table.py.out", out["combine_table"],
+            _normalise_combine_table, _normalise_combine_table,
+        ),
+    }
+
+
+def prepare(work: Path, scale: int, seed: int = 0) -> None:
+    """Build the scaled fixtures in ``work``."""
+    rng = random.Random(seed)
+    _scaled_bed(TESTS / "HG00410.1.FL.bed", work / "rm.bed", scale)
+    _scaled_bed(TESTS / "FL.bed", work / "FL.bed", scale)
+    _write_getorf(work / "FL.bed", work / "orf.fa", rng)
+    _write_blastp(work / "FL.bed", work / "orf.blastp", rng)
+    _write_minimap(work / "FL.bed", work / "minus.paf", work / "plus.paf", rng)
+    # Downstream fixtures come from the Perl stage so both sides see the same input
+    with open(work / "combine.blastp", "w") as fh:
+        subprocess.run(["perl", str(LEGACY / "FindLongestORF.pl"), str(work / "orf.blastp")], stdout=fh, check=True)
+    with open(work / "intact.blastp", "w") as fh:
+        subprocess.run(["perl", str(LEGACY / "FindIntactORF.pl"), str(work / "combine.blastp")], stdout=fh, check=True)
+
+
+def benchmark(work: Path, repeats: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, (py_cmd, pl_cmd, py_out, pl_out, py_norm, pl_norm) in _stages(work).items():
+        # Alternate the implementations so load on the machine hits both alike
+        py_runs, pl_runs = [], []
+        for _ in range(repeats):
+            py_runs.append(_run(py_cmd))
+            pl_runs.append(_run(pl_cmd, pl_out))
+        py_time = median(t for t, _ in py_runs)
+        pl_time = median(t for t, _ in pl_runs)
+        ratio = median(py / pl if pl else float("inf") for (py, _), (pl, _) in zip(py_runs, pl_runs))
+        results[name] = {
+            "python_s": round(py_time, 4),
+            "perl_s": round(pl_time, 4),
+            "ratio": round(ratio, 3),
+            "python_rss_mb": max(m for _, m in py_runs),
+            "perl_rss_mb": max(m for _, m in pl_runs),
+            "equivalent": py_norm(py_out) == pl_norm(pl_out),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Python stages against the legacy Perl scripts")
+    parser.add_argument("--scale", type=int, default=10, help="Replicate the test fixtures this many times (default: 10)")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per stage; the median is kept (default: 5)")
+    parser.add_argument("--baseline", help="JSON baseline to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative increase of the Python/Perl time ratio (default: 0.25)")
+    parser.add_argument("--min-seconds", dest="min_seconds", type=float, default=0.5,
+                        help="Only gate the time of stages whose median is at least this long in both "
+                             "implementations (default: 0.5)")
+    parser.add_argument("--memory-tolerance", dest="memory_tolerance", type=float, default=0.25,
+                        help="Allowed relative increase of the Python peak RSS (default: 0.25)")
+    parser.add_argument("--workdir", help="Keep fixtures and outputs in this directory")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(args.workdir or tmp)
+        work.mkdir(parents=True, exist_ok=True)
+        prepare(work, args.scale)
+        results = benchmark(work, args.repeats)
+
+    print(f"{'stage':<18}{'python s':>10}{'perl s':>10}{'ratio':>8}{'py MiB':>8}{'pl MiB':>8}  equivalent")
+    for name, r in results.items():
+        print(f"{name:<18}{r['python_s']:>10.3f}{r['perl_s']:>10.3f}{r['ratio']:>8.2f}"
+              f"{r['python_rss_mb']:>8}{r['perl_rss_mb']:>8}  {r['equivalent']}")
+
+    failures = [f"{name}: output differs from Perl" for name, r in results.items() if not r["equivalent"]]
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w") as fh:
+            json.dump({"scale": args.scale, "repeats": args.repeats, "stages": results}, fh, indent=2)
+            fh.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        run = {"scale": args.scale, "repeats": args.repeats}
+        recorded = {key: baseline.get(key) for key in run}
+        if recorded != run:
+            sys.exit(f"Baseline was recorded with {recorded}, this run uses {run}; "
+                     "rerun with the same settings or --update-baseline")
+        for name, r in results.items():
+            base = baseline["stages"].get(name)
+            if not base:
+                continue
+            timed = min(r["python_s"], r["perl_s"], base["python_s"], base["perl_s"]) >= args.min_seconds
+            if timed and r["ratio"] > base["ratio"] * (1 + args.tolerance):
+                failures.append(
+                    f"{name}: Python/Perl ratio {r['ratio']:.2f} exceeds baseline {base['ratio']:.2f}"
+                )
+            if r["python_rss_mb"] > base["python_rss_mb"] * (1 + args.memory_tolerance):
+                failures.append(
+                    f"{name}: Python peak RSS {r['python_rss_mb']} MiB exceeds baseline {base['python_rss_mb']} MiB"
+                )
+    if failures:
+        sys.exit("Benchmark failed:\n  " + "\n  ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
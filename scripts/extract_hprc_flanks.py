@@ -9,8 +9,10 @@ from __future__ import annotations
 
 import argparse
 from pathlib import Path
-from typing import Dict, List, Tuple
-import gzip
+from typing import List, Mapping, Tuple
+
+from haplongliner.seqstore import SharedGenome
+from haplongliner.utils import iter_fasta
 
 
 def parse_bed(path: Path) -> List[Tuple[str, int, int, str, str]]:
@@ -30,24 +32,22 @@ def parse_bed(path: Path) -> List[Tuple[str, int, int, str, str]]:
     return entries
 
 
-def load_fasta(path: Path) -> Dict[str, str]:
+def load_fasta(path: Path) -> Mapping[str, str]:
     """Return mapping ``sequence_name -> sequence`` from FASTA ``path``.
 
     Automatically handles gzipped FASTA files when ``path`` ends with
-    ``.gz``.
+    ``.gz``. The sequences are 2-bit packed into a node-local shared-memory
+    store (see :mod:`haplongliner.seqstore`) that concurrent runs on the same
+    reference attach to instead of loading their own copy. When no segment
+    can be created (e.g. a 64 MB ``/dev/shm`` in a container) they are read
+    into a plain dict instead. Either way, slicing a sequence returns an
+    upper-case ``str``.
     """
-    seqs: Dict[str, List[str]] = {}
-    name = None
-    opener = gzip.open if str(path).endswith(".gz") else open
-    with opener(path, "rt") as fh:
-        for line in fh:
-            line = line.strip()
-            if line.startswith(">"):
-                name = line[1:].split()[0]
-                seqs[name] = []
-            elif name:
-                seqs[name].append(line)
-    return {k: "".join(v) for k, v in seqs.items()}
+    try:
+        return SharedGenome.open(path)
+    except (OSError, RuntimeError) as exc:
+        print(f"[INFO] Shared sequence store unavailable ({exc}); reading {path} into memory")
+        return {header.split()[0]: seq.upper() for header, seq in iter_fasta(path)}
 
 
 def write_fasta(entries: List[Tuple[str, str]], path: Path) -> None:
@@ -63,6 +63,9 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Extract +/-2kb flanks for HPRC L1 insertions")
     parser.add_argument("reference", help="Reference FASTA containing chromosomes referenced by the BED file")
     parser.add_argument("output_prefix", help="Prefix for output FASTA files")
+    parser.add_argument("--keep-store", dest="keep_store", action="store_true",
+                        help="Keep a shared sequence store created by this run for later runs "
+                             "(remove it with 'haplongliner seqstore drop')")
     args = parser.parse_args()
 
     bed_path = Path("data") / "HPRC_L1_hs_v2_v2fl.bed"
@@ -85,6 +88,11 @@ def main() -> None:
         minus_entries.append((f"{name}_-2kb", minus_seq))
         plus_entries.append((f"{name}_+2kb", plus_seq))
 
+    if isinstance(sequences, SharedGenome):
+        sequences.close()
+        if sequences.created and not args.keep_store:
+            sequences.unlink()
+
     write_fasta(minus_entries, Path(f"{args.output_prefix}-2kb.fa"))
     write_fasta(plus_entries, Path(f"{args.output_prefix}+2kb.fa"))
 
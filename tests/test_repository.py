@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from haplongliner.repository import YOUNG_L1, append_sample, open_repository
+
+FIXTURE = Path(__file__).with_name("HG00410.1.hs1.fa.HapLongLINErRM.txt")
+
+
+def _young_lifted_rows():
+    return [
+        line for line in FIXTURE.read_text().splitlines(True)
+        if not line.split()[1].startswith("NA_") and line.split()[0].rsplit("_", 2)[1] in YOUNG_L1
+    ]
+
+
+def _state(db):
+    conn = open_repository(db)
+    try:
+        calls = conn.execute("SELECT COUNT(*) FROM calls").fetchone()[0]
+        present, intact = conn.execute("SELECT SUM(present_freq), SUM(intact_freq) FROM sites").fetchone()
+        intact_calls = conn.execute("SELECT COUNT(*) FROM calls WHERE status = 'intact'").fetchone()[0]
+    finally:
+        conn.close()
+    return calls, present, intact, intact_calls
+
+
+def test_reappend_replaces_previous_calls(tmp_path):
+    db = tmp_path / "cohort.db"
+    first = append_sample(db, FIXTURE, "HG00410", "1")
+    assert first["added"] == 2908
+    assert first["duplicates"] == 2
+
+    lifted = _young_lifted_rows()
+    subset = tmp_path / "subset.txt"
+    subset.write_text("".join(lifted[:3]))
+    second = append_sample(db, subset, "HG00410", "1")
+
+    assert second["updated"] == 3
+    assert second["removed"] == 2905
+    calls, present, intact, intact_calls = _state(db)
+    assert calls == 3
+    assert present == 3
+    assert intact == intact_calls
+
+
+def test_duplicate_rows_do_not_overwrite(tmp_path):
+    db = tmp_path / "cohort.db"
+    lifted = _young_lifted_rows()
+    table = tmp_path / "dup.txt"
+    table.write_text(lifted[0] + lifted[0])
+    counts = append_sample(db, table, "HG00410", "2")
+    assert counts["added"] == 1
+    assert counts["updated"] == 0
+    assert counts["duplicates"] == 1
+    assert _state(db)[:2] == (1, 1)